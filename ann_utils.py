@@ -0,0 +1,239 @@
+import os
+import logging
+from typing import List, Optional, Iterable
+
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file (IVF-flat) approximate nearest neighbour index.
+
+    Vectors are clustered with spherical k-means into `nlist` inverted lists.
+    A query only scores the vectors in its `nprobe` closest lists, trading
+    recall for latency. The index stores row numbers of the owning
+    LocalVectorStore matrix rather than copies of the vectors.
+    """
+
+    def __init__(self, dimension: int, nlist: int = 0, nprobe: int = 8):
+        """
+        Create an untrained index.
+
+        Args:
+            dimension: Dimension of the indexed vectors
+            nlist: Number of inverted lists (0 picks 4 * sqrt(n) at training time)
+            nprobe: Number of lists scanned per query
+        """
+        self.dimension = dimension
+        # Requested number of lists, 0 when it follows the data size
+        self.requested_nlist = nlist
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        # List number of every store row, -1 for rows not in the index
+        self._assignments = np.full(0, -1, dtype=np.int32)
+        self._lists: List[set] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, iterations: int = 10, max_samples: int = 100000, seed: int = 0) -> None:
+        """
+        Learn the list centroids with spherical k-means.
+
+        Args:
+            vectors: L2-normalized training vectors, one per row
+            iterations: Number of k-means iterations
+            max_samples: Maximum number of vectors sampled for training
+            seed: Random seed for sampling and initialization
+        """
+        rng = np.random.default_rng(seed)
+        # Size the lists for every vector, not just the training sample
+        nlist = self.requested_nlist or int(4 * np.sqrt(len(vectors)))
+        if len(vectors) > max_samples:
+            vectors = vectors[rng.choice(len(vectors), max_samples, replace=False)]
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        nlist = max(1, min(nlist, len(vectors)))
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._nearest_lists(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            counts = np.bincount(assignments, minlength=nlist)
+
+            # Re-seed empty lists with random vectors
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+
+        self.nlist = nlist
+        self.centroids = centroids
+        self._lists = [set() for _ in range(nlist)]
+        self._list_arrays = [None] * nlist
+        self._assignments = np.full(len(self._assignments), -1, dtype=np.int32)
+        logger.info(f"Trained IVF index with {nlist} lists on {len(vectors)} vectors")
+
+    @staticmethod
+    def _nearest_lists(vectors: np.ndarray, centroids: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            scores = vectors[start:start + batch_size] @ centroids.T
+            assignments[start:start + batch_size] = np.argmax(scores, axis=1)
+        return assignments
+
+    def needs_retraining(self, size: int, growth: float = 4.0) -> bool:
+        """
+        Check whether the store outgrew the lists picked at training time.
+
+        With an automatic `nlist` (4 * sqrt(n)), training on n vectors gives
+        lists of nlist / 16 vectors on average, so nlist * nlist / 16 is the
+        size the index was trained for. A requested `nlist` is kept as is.
+
+        Args:
+            size: Current number of vectors in the store
+            growth: Factor past the trained-for size that triggers retraining
+
+        Returns:
+            True if the index should be retrained with more lists
+        """
+        if not self.trained or self.requested_nlist:
+            return False
+        return size > growth * self.nlist * (self.nlist / 16)
+
+    def _grow(self, size: int) -> None:
+        if size > len(self._assignments):
+            grown = np.full(max(size, 2 * len(self._assignments)), -1, dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+
+    def add(self, rows: Iterable[int], vectors: np.ndarray) -> None:
+        """
+        Insert (or re-insert) store rows into their closest lists.
+
+        Args:
+            rows: Store row numbers
+            vectors: L2-normalized vectors of those rows
+        """
+        rows = np.asarray(list(rows), dtype=np.int64)
+        if not self.trained or len(rows) == 0:
+            return
+        self.remove(rows)
+        self._grow(int(rows.max()) + 1)
+        assignments = self._nearest_lists(np.asarray(vectors, dtype=np.float32), self.centroids)
+        for row, list_id in zip(rows.tolist(), assignments.tolist()):
+            self._assignments[row] = list_id
+            self._lists[list_id].add(row)
+            self._list_arrays[list_id] = None
+
+    def remove(self, rows: Iterable[int]) -> None:
+        """
+        Remove store rows from the index.
+
+        Args:
+            rows: Store row numbers
+        """
+        for row in rows:
+            row = int(row)
+            if row >= len(self._assignments) or self._assignments[row] < 0:
+                continue
+            list_id = int(self._assignments[row])
+            self._lists[list_id].discard(row)
+            self._list_arrays[list_id] = None
+            self._assignments[row] = -1
+
+    def search_rows(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Return the candidate rows of the lists closest to a query.
+
+        Args:
+            query: L2-normalized query vector
+            nprobe: Number of lists to scan (default: self.nprobe)
+
+        Returns:
+            Array of candidate store rows
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+        arrays = []
+        for list_id in probes.tolist():
+            if self._list_arrays[list_id] is None:
+                self._list_arrays[list_id] = np.fromiter(
+                    self._lists[list_id], dtype=np.int64, count=len(self._lists[list_id])
+                )
+            arrays.append(self._list_arrays[list_id])
+        return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+
+    def compact(self, live_rows: List[int]) -> None:
+        """
+        Renumber rows after the store dropped deleted rows.
+
+        Args:
+            live_rows: Old row numbers of the surviving rows, in their new order
+        """
+        self._grow(max(live_rows, default=-1) + 1)
+        self._assignments = self._assignments[np.asarray(live_rows, dtype=np.int64)].copy()
+        self._rebuild_lists()
+
+    def _rebuild_lists(self) -> None:
+        self._lists = [set() for _ in range(self.nlist)]
+        self._list_arrays = [None] * self.nlist
+        for row, list_id in enumerate(self._assignments.tolist()):
+            if list_id >= 0:
+                self._lists[list_id].add(row)
+
+    def save(self, directory: str) -> None:
+        """
+        Write the centroids and row assignments next to the store files.
+
+        Args:
+            directory: Directory of the LocalVectorStore
+        """
+        if not self.trained:
+            return
+        centroids_path = os.path.join(directory, "ivf_centroids.npy")
+        assignments_path = os.path.join(directory, "ivf_assignments.npy")
+        np.save(centroids_path + ".tmp.npy", self.centroids)
+        np.save(assignments_path + ".tmp.npy", self._assignments)
+        os.replace(centroids_path + ".tmp.npy", centroids_path)
+        os.replace(assignments_path + ".tmp.npy", assignments_path)
+
+    def load(self, directory: str, size: int) -> bool:
+        """
+        Load centroids and row assignments saved by `save`.
+
+        Args:
+            directory: Directory of the LocalVectorStore
+            size: Number of rows in the store
+
+        Returns:
+            True if a matching index was loaded
+        """
+        centroids_path = os.path.join(directory, "ivf_centroids.npy")
+        assignments_path = os.path.join(directory, "ivf_assignments.npy")
+        if not (os.path.exists(centroids_path) and os.path.exists(assignments_path)):
+            return False
+
+        centroids = np.load(centroids_path)
+        assignments = np.load(assignments_path)
+        if len(assignments) != size or centroids.shape[1] != self.dimension:
+            logger.warning("Persisted IVF index does not match the vector store, it will be retrained")
+            return False
+
+        self.centroids = centroids
+        self.nlist = len(centroids)
+        self._assignments = assignments.astype(np.int32)
+        self._rebuild_lists()
+        return True
@@ -1,24 +1,30 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Query, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from fastapi.requests import Request
+from fastapi.concurrency import run_in_threadpool
 import os
+import json
+import time
 import tempfile
 import uuid
-import pinecone
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from pydantic import BaseModel
 import shutil
 from dotenv import load_dotenv
 
 # Import project modules
-from file_utils import parse_and_extract, extract_authors_and_organizations
-from embedding_utils import process_and_store_embeddings
-from qa_utils import create_qa_chain, answer_question
+from job_utils import IngestionJobManager, QueueFullError
+from qa_utils import QAChainRegistry, answer_question, stream_answer, get_answer_cache
+from vector_utils import get_vector_store
+from embedding_utils import get_embedding_model, get_embedding_cache
+from registry_utils import get_document_registry
+from conversation_utils import get_conversation_store
+from metrics_utils import metrics, timed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,8 +32,9 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-pine_api_key = os.getenv("PINECONE_API_KEY")
-pine_env = os.getenv("PINECONE_ENVIRONMENT", "gcp-starter")
+
+# Load the embedding model at startup instead of on the first request that needs it
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
 
 # Create FastAPI instance
 app = FastAPI(title="SciChat Dashboard", description="A web interface for the SciChat paper analysis system")
@@ -51,25 +58,26 @@ templates = Jinja2Templates(directory="templates")
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Initialize Pinecone client
-try:
-    pc = pinecone.Pinecone(api_key=pine_api_key, environment=pine_env)
-    logger.info("Connected to Pinecone")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    pc = None
-
-# Get or create index
+# Get the configured vector store
 def get_index():
-    index_name = "document-embeddings"
     try:
-        if pc and index_name in pc.list_indexes().names():
-            return pc.Index(index_name)
-        return None
+        return get_vector_store(create=False)
     except Exception as e:
-        logger.error(f"Error connecting to Pinecone index: {str(e)}")
+        logger.error(f"Error connecting to vector store: {str(e)}")
         return None
 
+# Shared QA chain, built once and reused by every /ask request
+qa_registry = QAChainRegistry(get_index)
+
+def invalidate_answers(document_id: str) -> None:
+    """Drop cached answers built from a paper that was (re-)indexed"""
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate_documents([document_id])
+
+# Background ingestion of uploaded papers
+job_manager = IngestionJobManager(on_indexed=invalidate_answers)
+
 # Pydantic models for API
 class DocumentMetadata(BaseModel):
     id: str
@@ -78,26 +86,80 @@ class DocumentMetadata(BaseModel):
     organizations: str
     emails: str
 
+class DocumentInfo(DocumentMetadata):
+    source: str = ""
+    page_count: int = 0
+    chunk_count: int = 0
+    vector_count: int = 0
+    created_at: float
+    updated_at: float
+
+class DocumentSummary(BaseModel):
+    document_id: str
+    status: str
+    sections: Dict[str, str] = {}
+    content_hash: str = ""
+    updated_at: Optional[float] = None
+
+class UploadResponse(BaseModel):
+    job_id: str
+    document_id: str
+    status: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    document_id: str
+    filename: str
+    status: str
+    stage: Optional[str] = None
+    document: Optional[DocumentMetadata] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
 class QuestionRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = None
     metadata_only: Optional[bool] = False
+    document_id: Optional[str] = None
+    include_timings: Optional[bool] = False
 
 class QuestionResponse(BaseModel):
     answer: str
     conversation_id: str
+    timings: Optional[Dict[str, Any]] = None
 
-# Store conversation history
-conversation_history = {}
+# Conversation history, bounded and truncated before it is fed to the chain
+conversation_store = get_conversation_store()
+
+@app.on_event("startup")
+async def warm_qa_chain():
+    """Build the shared QA chain before the first request arrives"""
+    try:
+        if qa_registry.get() is None:
+            logger.info("Search index not available yet, QA chain will be built on first use")
+    except Exception as e:
+        logger.error(f"Error building QA chain at startup: {str(e)}")
+    
+    if PRELOAD_MODELS:
+        try:
+            await run_in_threadpool(get_embedding_model)
+        except Exception as e:
+            logger.error(f"Error preloading embedding model: {str(e)}")
+
+@app.on_event("shutdown")
+def stop_ingestion():
+    """Let running ingestion jobs finish before the worker exits"""
+    job_manager.shutdown()
 
 # API routes
 @app.get("/", response_class=HTMLResponse)
 async def get_dashboard(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.post("/upload", response_model=DocumentMetadata)
-async def upload_paper(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    """Upload and process a scientific paper"""
+@app.post("/upload", response_model=UploadResponse, status_code=202)
+async def upload_paper(file: UploadFile = File(...)):
+    """Upload a scientific paper and queue it for processing"""
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
@@ -106,139 +168,238 @@ async def upload_paper(background_tasks: BackgroundTasks, file: UploadFile = Fil
         file_id = str(uuid.uuid4())
         file_path = os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
         
-        with open(file_path, "wb") as buffer:
+        with timed("ingest", "upload"), open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
-        # Extract document info
-        extracted_info, documents = parse_and_extract(file_path)
-        authors, organizations = extract_authors_and_organizations(file_path)
-        
-        # Create document data
-        document_data = {
-            "id": file_id,
-            "title": extracted_info["title"] or "Unknown Title",
-            "authors": ", ".join(authors) or "Unknown Authors",
-            "organizations": ", ".join(organizations) or "Unknown Organizations",
-            "emails": ", ".join(extracted_info["emails"]) or "No email information",
-            "content": extracted_info.get("abstract", "") or "No abstract available", 
-            "full_content": extracted_info["content"] or "No content available",
-        }
+        # Parse, extract, embed and index in the background
+        job = job_manager.submit(file_path, file_id, filename=file.filename)
         
-        # Process embeddings in the background
-        background_tasks.add_task(
-            process_and_store_embeddings,
-            [document_data]
+        return UploadResponse(
+            job_id=job["job_id"],
+            document_id=file_id,
+            status=job["status"]
         )
-        
-        # Return document metadata
-        return DocumentMetadata(
-            id=file_id,
-            title=document_data["title"],
-            authors=document_data["authors"],
-            organizations=document_data["organizations"],
-            emails=document_data["emails"]
+    
+    except QueueFullError as e:
+        os.remove(file_path)
+        logger.warning(f"Rejecting upload, ingestion queue is full: {str(e)}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many papers are being processed, please retry shortly",
+            headers={"Retry-After": "10"}
         )
-        
     except Exception as e:
         logger.error(f"Error processing upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Report the processing stage of an uploaded paper"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**job)
+
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """Ask a question about the uploaded papers"""
     try:
         # Get conversation history or create new one
         conversation_id = request.conversation_id or str(uuid.uuid4())
-        if conversation_id not in conversation_history:
-            conversation_history[conversation_id] = []
         
-        # Get Pinecone index
-        index = get_index()
-        if not index:
+        # Get the shared QA chain
+        qa_chain = qa_registry.get()
+        if not qa_chain:
             raise HTTPException(status_code=503, detail="Search index not available")
         
-        # Create QA chain
-        qa_chain = create_qa_chain(index)
-        
         # Get answer
-        chat_history = conversation_history[conversation_id]
-        answer = answer_question(
+        started = time.perf_counter()
+        timings = {}
+        chat_history = await run_in_threadpool(conversation_store.history, conversation_id)
+        # Run the blocking chain in a worker thread so concurrent requests don't queue up
+        answer = await run_in_threadpool(
+            answer_question,
             qa_chain, 
             request.question, 
             chat_history, 
-            metadata_only=request.metadata_only
+            metadata_only=request.metadata_only,
+            document_id=request.document_id,
+            timings=timings
         )
         
         # Update conversation history
-        conversation_history[conversation_id].append((request.question, answer))
+        await run_in_threadpool(conversation_store.append, conversation_id, request.question, answer)
+        timings["total"] = time.perf_counter() - started
         
         # Return response
         return QuestionResponse(
             answer=answer,
-            conversation_id=conversation_id
+            conversation_id=conversation_id,
+            timings=timings if request.include_timings else None
         )
         
     except Exception as e:
         logger.error(f"Error answering question: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing question: {str(e)}")
 
-@app.get("/documents", response_model=List[DocumentMetadata])
-async def list_documents():
-    """List all processed documents"""
-    try:
-        index = get_index()
-        if not index:
-            return []
-            
-        # Query unique document IDs from index
-        # This is a simplification - you'll need to implement this based on your vector DB structure
-        response = index.query(
-            vector=[0] * 384,  # Dummy vector
-            top_k=100,
-            include_metadata=True
-        )
-        
-        # Extract unique document IDs and metadata
-        documents = {}
-        for match in response.matches:
-            doc_id = match.metadata.get("document_id")
-            if doc_id and doc_id not in documents:
-                # Try to get title/author matches for this document
-                title_match = next((m for m in response.matches if 
-                                  m.metadata.get("document_id") == doc_id and 
-                                  m.metadata.get("type") == "title"), None)
-                                  
-                author_match = next((m for m in response.matches if 
-                                   m.metadata.get("document_id") == doc_id and 
-                                   m.metadata.get("type") == "authors"), None)
-                                   
-                org_match = next((m for m in response.matches if 
-                                m.metadata.get("document_id") == doc_id and 
-                                m.metadata.get("type") == "organizations"), None)
-                                
-                email_match = next((m for m in response.matches if 
-                                  m.metadata.get("document_id") == doc_id and 
-                                  m.metadata.get("type") == "emails"), None)
-                
-                documents[doc_id] = DocumentMetadata(
-                    id=doc_id,
-                    title=title_match.metadata.get("text", "Unknown Title") if title_match else "Unknown Title",
-                    authors=author_match.metadata.get("text", "Unknown Authors") if author_match else "Unknown Authors",
-                    organizations=org_match.metadata.get("text", "Unknown Organizations") if org_match else "Unknown Organizations",
-                    emails=email_match.metadata.get("text", "No email information") if email_match else "No email information"
-                )
+def sse_event(event: str, data: Dict) -> str:
+    """Format a Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Ask a question and stream the answer as Server-Sent Events.
+    
+    Emits a "start" event with the conversation ID, one "token" event per
+    piece of the answer, then "done" with the full answer and per-stage
+    timings, or "error".
+    """
+    conversation_id = request.conversation_id or str(uuid.uuid4())
+    
+    qa_chain = qa_registry.get()
+    if not qa_chain:
+        raise HTTPException(status_code=503, detail="Search index not available")
+    chat_history = await run_in_threadpool(conversation_store.history, conversation_id)
+    
+    # A sync generator: Starlette iterates it in a worker thread, so the
+    # blocking retrieval and LLM calls never run on the event loop
+    def events() -> Iterator[str]:
+        started = time.perf_counter()
+        first_token = None
+        pieces = []
+        timings = {}
+        yield sse_event("start", {"conversation_id": conversation_id})
+        try:
+            for piece in stream_answer(qa_chain, request.question, chat_history,
+                                       metadata_only=request.metadata_only,
+                                       document_id=request.document_id,
+                                       timings=timings):
+                if first_token is None:
+                    first_token = time.perf_counter() - started
+                pieces.append(piece)
+                yield sse_event("token", {"token": piece})
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield sse_event("error", {"detail": f"Error processing question: {str(e)}"})
+            return
         
-        return list(documents.values())
+        answer = "".join(pieces)
+        conversation_store.append(conversation_id, request.question, answer)
+        total = time.perf_counter() - started
+        logger.info(f"Streamed answer in {total:.2f}s, first token after {first_token or total:.2f}s")
+        yield sse_event("done", {
+            "conversation_id": conversation_id,
+            "answer": answer,
+            "time_to_first_token": first_token if first_token is not None else total,
+            "total_time": total,
+            "timings": timings,
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies such as nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/documents", response_model=List[DocumentInfo])
+async def list_documents(response: Response, limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """List processed documents from the document registry, newest first"""
+    try:
+        registry = get_document_registry()
+        documents = await run_in_threadpool(registry.list, limit, offset)
+        response.headers["X-Total-Count"] = str(await run_in_threadpool(registry.count))
+        return [DocumentInfo(**document) for document in documents]
         
     except Exception as e:
         logger.error(f"Error listing documents: {str(e)}")
         return []
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Report hit rates of the answer and embedding caches"""
+    answer_cache = get_answer_cache()
+    embedding_cache = get_embedding_cache()
+    return {
+        "answers": answer_cache.stats() if answer_cache is not None else None,
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Export stage timings, upserted vectors, cache lookups and LLM tokens for Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/conversations/stats")
+async def get_conversation_stats():
+    """Report live conversations and the memory they hold"""
+    return await run_in_threadpool(conversation_store.stats)
+
+# IDs of papers ingested from subfolders contain "/" (see ingest_utils.document_ids_for)
+@app.get("/documents/{document_id:path}/summary", response_model=DocumentSummary,
+         responses={202: {"model": DocumentSummary, "description": "Summaries are being computed"}})
+async def get_document_summary(document_id: str):
+    """
+    Return the section summaries of a paper.
+    
+    Summaries are computed once in the background, on the first request
+    (or after ingestion with SUMMARIZE_ON_INGEST), and stored with the
+    document. While they are being computed this returns
+    202; poll again later. When some sections failed, the others are
+    returned with the "partial" status while the failed ones are retried.
+    """
+    registry = get_document_registry()
+    document = await run_in_threadpool(registry.get, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    summary = await run_in_threadpool(registry.get_summary, document_id)
+    if summary and summary["status"] == "completed" and not job_manager.is_summarizing(document_id):
+        return DocumentSummary(
+            document_id=document_id,
+            status=summary["status"],
+            sections=summary["sections"],
+            content_hash=summary["content_hash"],
+            updated_at=summary["updated_at"]
+        )
+    
+    pending = {"document_id": document_id, "status": "pending", "sections": {}, "content_hash": "", "updated_at": None}
+    if summary and summary["status"] == "partial":
+        # Sections that succeeded are served while the failed ones are retried
+        pending.update(status="partial", sections=summary["sections"],
+                       content_hash=summary["content_hash"], updated_at=summary["updated_at"])
+    if job_manager.is_summarizing(document_id):
+        return JSONResponse(status_code=202, content=pending)
+    
+    # Papers not summarized yet, or whose summarization failed. Uploads are kept
+    # in UPLOAD_DIR; bulk ingestion records the absolute path of the PDF as its
+    # source, while uploads only record the client's file name
+    file_path = os.path.join(UPLOAD_DIR, f"{document_id}.pdf")
+    if not os.path.exists(file_path):
+        file_path = document["source"] if os.path.isabs(document["source"]) else ""
+    if file_path and os.path.exists(file_path):
+        job_manager.submit_summary(document_id, file_path=file_path)
+        return JSONResponse(status_code=202, content=pending)
+    if pending["status"] == "partial":
+        return JSONResponse(status_code=200, content=pending)
+    if summary:
+        raise HTTPException(status_code=500, detail=f"Summarization failed: {summary['error']}")
+    raise HTTPException(status_code=404, detail="No summary available for this document")
+
+# Declared after the summary route, which this path pattern would also match
+@app.get("/documents/{document_id:path}", response_model=DocumentInfo)
+async def get_document(document_id: str):
+    """Look up a processed document"""
+    document = await run_in_threadpool(get_document_registry().get, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return DocumentInfo(**document)
+
 @app.delete("/conversations/{conversation_id}")
 async def clear_conversation(conversation_id: str):
     """Clear a conversation history"""
-    if conversation_id in conversation_history:
-        conversation_history.pop(conversation_id)
+    await run_in_threadpool(conversation_store.delete, conversation_id)
     return {"status": "success"}
 
 # Run the application
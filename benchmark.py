@@ -0,0 +1,428 @@
+import argparse
+import json
+import logging
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def synthetic_vectors(size: int, dimension: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """
+    Generate clustered random vectors resembling sentence embeddings.
+
+    Args:
+        size: Number of vectors
+        dimension: Vector dimension
+        clusters: Number of topic clusters the vectors are drawn around
+        seed: Random seed
+
+    Returns:
+        float32 matrix of shape (size, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    noise = rng.standard_normal((size, dimension)).astype(np.float32) * 0.6
+    return centers[labels] + noise
+
+
+def bench_ann(args: argparse.Namespace) -> None:
+    """Compare recall@k and latency of the IVF index against exact search."""
+    from vector_utils import LocalVectorStore
+
+    vectors = synthetic_vectors(args.size + args.queries, args.dimension)
+    corpus, queries = vectors[:args.size], vectors[args.size:]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalVectorStore(directory, dimension=args.dimension, index_type="ivf",
+                                 nlist=args.nlist, min_train_size=args.size + 1)
+        batch_size = 10000
+        for start in range(0, args.size, batch_size):
+            store.upsert([
+                (f"doc{i // 50}_chunk_{i % 50}", corpus[i], {"type": "chunk", "document_id": f"doc{i // 50}"})
+                for i in range(start, min(start + batch_size, args.size))
+            ])
+
+        started = time.perf_counter()
+        store.rebuild_ann()
+        logger.info(f"Trained IVF index with {store.ann.nlist} lists in {time.perf_counter() - started:.2f}s")
+
+        exact_ids, exact_time = _run_queries(store, queries, args.k, exact=True)
+        print(f"{'mode':<14}{'recall@' + str(args.k):>12}{'ms/query':>12}")
+        print(f"{'exact':<14}{1.0:>12.3f}{1000 * exact_time:>12.3f}")
+
+        for nprobe in args.nprobe:
+            ann_ids, ann_time = _run_queries(store, queries, args.k, nprobe=nprobe)
+            recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(ann_ids, exact_ids)])
+            print(f"{'ivf nprobe=' + str(nprobe):<14}{recall:>12.3f}{1000 * ann_time:>12.3f}")
+
+
+def _run_queries(store, queries: np.ndarray, k: int, **kwargs) -> Tuple[List[List[str]], float]:
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        response = store.query(query, top_k=k, include_metadata=False, **kwargs)
+        results.append([match.id for match in response.matches])
+    return results, (time.perf_counter() - started) / len(queries)
+
+
+def _normalize(text: str) -> str:
+    # Ignore case, whitespace, punctuation and line-break hyphenation
+    return re.sub(r'\W+', '', text.lower())
+
+
+def bench_chunking(args: argparse.Namespace) -> None:
+    """Compare the fixed-size slicer with the structure-aware chunker on real PDFs."""
+    from chunk_utils import iter_structured_chunks, split_sentences
+    from embedding_utils import iter_chunks, get_embeddings
+    from file_utils import parse_pdf
+    from ingest_utils import find_pdfs
+
+    paths = find_pdfs(args.pdf_dir)[:args.max_papers]
+    if not paths:
+        logger.error(f"No PDFs found in {args.pdf_dir}")
+        return
+
+    # Queries are sentences sampled from each paper. A query is a hit when one
+    # of the top-k chunks of its paper contains the middle of the sentence.
+    rng = random.Random(0)
+    papers, queries = [], []
+    for paper, path in enumerate(paths):
+        pages = parse_pdf(path).page_texts
+        papers.append(pages)
+        sentences = [sentence for page in pages for sentence in split_sentences(" ".join(page.split()))
+                     if len(sentence.split()) >= 8]
+        for sentence in rng.sample(sentences, min(args.queries_per_paper, len(sentences))):
+            middle = _normalize(sentence)
+            start = max(0, len(middle) // 2 - 20)
+            queries.append((paper, sentence, middle[start:start + 40]))
+
+    chunkers = {
+        "fixed 1000/200": lambda pages: list(iter_chunks(pages)),
+        f"structured {args.max_tokens}t": lambda pages: [
+            chunk.text for chunk in iter_structured_chunks(pages, max_tokens=args.max_tokens)
+        ],
+    }
+    query_vectors = get_embeddings([sentence for _, sentence, _ in queries])
+    source_chars = sum(len(" ".join(pages)) for pages in papers)
+
+    print(f"{len(paths)} papers, {len(queries)} queries")
+    print(f"{'chunker':<18}{'vectors/paper':>14}{'chars/chunk':>12}{'stored/source':>14}"
+          f"{'hit@' + str(args.k):>8}{'embed s':>9}")
+    for name, chunker in chunkers.items():
+        chunk_texts, owners = [], []
+        for paper, pages in enumerate(papers):
+            texts = chunker(pages)
+            chunk_texts.extend(texts)
+            owners.extend([paper] * len(texts))
+        owners = np.asarray(owners)
+        normalized = [_normalize(text) for text in chunk_texts]
+
+        started = time.perf_counter()
+        vectors = get_embeddings(chunk_texts)
+        embed_seconds = time.perf_counter() - started
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        hits = 0
+        for (paper, _, span), query in zip(queries, query_vectors):
+            rows = np.flatnonzero(owners == paper)
+            scores = vectors[rows] @ query
+            top = rows[np.argsort(-scores)[:args.k]]
+            hits += any(span in normalized[row] for row in top)
+
+        stored_chars = sum(len(text) for text in chunk_texts)
+        print(f"{name:<18}{len(chunk_texts) / len(papers):>14.1f}{stored_chars / max(len(chunk_texts), 1):>12.0f}"
+              f"{stored_chars / max(source_chars, 1):>14.2f}{hits / max(len(queries), 1):>8.3f}{embed_seconds:>9.1f}")
+
+
+def bench_retrieval(args: argparse.Namespace) -> None:
+    """Compare recall and latency of sparse, dense and fused retrieval on real PDFs."""
+    from collections import Counter
+    from bm25_utils import BM25Index, tokenize
+    from chunk_utils import iter_structured_chunks, split_sentences
+    from embedding_utils import get_embeddings, SentenceTransformerEmbeddings
+    from file_utils import parse_pdf
+    from ingest_utils import find_pdfs
+    from vector_utils import LocalVectorStore, HybridVectorStore
+
+    paths = find_pdfs(args.pdf_dir)[:args.max_papers]
+    if not paths:
+        logger.error(f"No PDFs found in {args.pdf_dir}")
+        return
+
+    entries = []
+    for path in paths:
+        for i, chunk in enumerate(iter_structured_chunks(parse_pdf(path).page_texts)):
+            entries.append((f"{path}_chunk_{i}", chunk.text, {"type": "chunk", "document_id": path, "text": chunk.text}))
+    normalized = {vector_id: _normalize(text) for vector_id, text, _ in entries}
+    document_frequency = Counter(term for _, text, _ in entries for term in set(tokenize(text)))
+
+    # Two query sets from sampled sentences: the full sentence, and its rarest
+    # terms only (like a search for a gene, dataset or equation name)
+    rng = random.Random(0)
+    sentences = [sentence for _, text, _ in entries for sentence in split_sentences(text)
+                 if len(sentence.split()) >= 8]
+    queries = {"sentence": [], "keywords": []}
+    for sentence in rng.sample(sentences, min(args.queries, len(sentences))):
+        middle = _normalize(sentence)
+        start = max(0, len(middle) // 2 - 20)
+        span = middle[start:start + 40]
+        rare_terms = sorted(set(tokenize(sentence)), key=lambda term: document_frequency[term])[:args.keywords]
+        queries["sentence"].append((sentence, span))
+        queries["keywords"].append((" ".join(rare_terms), span))
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HybridVectorStore(LocalVectorStore(directory), BM25Index())
+        vectors = get_embeddings([text for _, text, _ in entries])
+        store.upsert([(vector_id, vector, metadata) for (vector_id, _, metadata), vector in zip(entries, vectors)])
+
+        print(f"{len(paths)} papers, {len(entries)} chunks, {len(queries['sentence'])} queries per set")
+        print(f"{'queries':<10}{'mode':<8}{'recall@' + str(args.k):>10}{'ms/query':>10}")
+        for query_set, pairs in queries.items():
+            for mode in ("sparse", "dense", "hybrid"):
+                retriever = store.as_retriever(SentenceTransformerEmbeddings(), {"k": args.k, "mode": mode})
+                hits = 0
+                started = time.perf_counter()
+                for query, span in pairs:
+                    documents = retriever.invoke(query)
+                    hits += any(span in _normalize(document.page_content) for document in documents)
+                elapsed = (time.perf_counter() - started) / max(len(pairs), 1)
+                print(f"{query_set:<10}{mode:<8}{hits / max(len(pairs), 1):>10.3f}{1000 * elapsed:>10.2f}")
+
+
+def bench_metadata(args: argparse.Namespace) -> None:
+    """Compare the registry fast path with the filtered vector search for metadata questions."""
+    from embedding_utils import determine_text_key, get_embedding, get_embeddings
+    from metadata_utils import MetadataLookup
+    from registry_utils import DocumentRegistry
+    from vector_utils import LocalVectorStore
+
+    rng = random.Random(0)
+    words = ["learning", "graph", "neural", "protein", "sparse", "attention", "quantum", "causal",
+             "bayesian", "retrieval", "diffusion", "robust", "federated", "molecular", "language", "vision"]
+    documents = []
+    for i in range(args.papers):
+        documents.append({
+            "id": f"paper_{i}",
+            "title": " ".join(rng.sample(words, 5)).title() + f" {i}",
+            "authors": f"Author {i}a, Author {i}b",
+            "organizations": f"University {i % 40}",
+            "emails": f"author{i}@example.org",
+        })
+    templates = ["Who wrote {title}?", "What is the title of {title}?",
+                 "Which university are the authors of {title} from?", "What is the email of the authors of {title}?"]
+    questions = [rng.choice(templates).format(title=document["title"])
+                 for document in rng.choices(documents, k=args.queries)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        registry = DocumentRegistry(f"{directory}/documents.sqlite3")
+        registry.upsert_many([{**document, "abstract": "", "source": "", "page_count": 0,
+                               "chunk_count": 0, "vector_count": 4} for document in documents])
+        store = LocalVectorStore(f"{directory}/vectors")
+        entries = [(f"{document['id']}_{field}", document[field], {"type": field, "document_id": document["id"],
+                                                                   "text": document[field]})
+                   for document in documents for field in ("title", "authors", "organizations", "emails")]
+        vectors = get_embeddings([text for _, text, _ in entries])
+        store.upsert([(vector_id, vector, metadata) for (vector_id, _, metadata), vector in zip(entries, vectors)])
+
+        # Previous path, LLM call excluded: embed the question, then a filtered vector query
+        started = time.perf_counter()
+        for question in questions:
+            store.query(get_embedding(question), top_k=4, filter={"type": determine_text_key(question)})
+        search_ms = 1000 * (time.perf_counter() - started) / len(questions)
+
+        lookup = MetadataLookup(registry)
+        lookup.answer(questions[0])  # Load the title cache
+        started = time.perf_counter()
+        answered = sum(lookup.answer(question) is not None for question in questions)
+        lookup_ms = 1000 * (time.perf_counter() - started) / len(questions)
+
+    print(f"{args.papers} papers, {len(questions)} questions, {answered / len(questions):.1%} answered by the fast path")
+    print(f"{'path':<28}{'ms/question':>12}")
+    print(f"{'embedding + vector search':<28}{search_ms:>12.3f}")
+    print(f"{'registry lookup':<28}{lookup_ms:>12.3f}")
+
+
+# Inline superscripts in the fixture lines, e.g. "John Smith^{1,2}" (tabs separate header columns)
+FIXTURE_SUPERSCRIPT = re.compile(r'\^\{([^}]*)\}')
+
+
+def _render_fixture(lines: List[dict], path: str) -> None:
+    """Write a fixture first page to a PDF, setting the size, weight and superscripts of each line."""
+    import fitz
+
+    with fitz.open() as doc:
+        page = doc.new_page()
+        y = 72.0
+        for line in lines:
+            size = line.get("size", 10)
+            font = "hebo" if line.get("bold") else "helv"
+            y += 1.4 * size
+            # Tabs move to the next of three header columns
+            for column, text in enumerate(line["text"].split("\t")):
+                x = 72.0 + 160.0 * column
+                # Even parts are regular text, odd parts superscripts
+                for i, part in enumerate(FIXTURE_SUPERSCRIPT.split(text)):
+                    if not part:
+                        continue
+                    superscript = i % 2 == 1
+                    fontsize = 0.6 * size if superscript else size
+                    page.insert_text((x, y - 0.35 * size if superscript else y), part, fontsize=fontsize, fontname=font)
+                    x += fitz.get_text_length(part, fontname=font, fontsize=fontsize)
+        doc.save(path)
+
+
+def _precision_recall(found: List[str], expected: List[str]) -> Tuple[int, int, int]:
+    """Count (true positives, found, expected) of a field, ignoring case and spacing."""
+    normalize = lambda values: {" ".join(value.lower().split()) for value in values}
+    found, expected = normalize(found), normalize(expected)
+    return len(found & expected), len(found), len(expected)
+
+
+def bench_layout(args: argparse.Namespace) -> None:
+    """
+    Measure the accuracy and per-page time of the layout metadata extractor on labelled first pages.
+
+    The bundled fixtures are synthetic pages rendered with PyMuPDF, written
+    alongside the extractor: their scores catch regressions but say little
+    about accuracy on real papers. Fixtures with a "pdf" path (relative to
+    the fixture file) instead of "lines" are parsed from that file.
+    """
+    import os
+    from file_utils import extract_layout_metadata, parse_pdf
+
+    with open(args.fixtures, "r", encoding="utf-8") as f:
+        papers = json.load(f)["papers"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        parsed = []
+        for paper in papers:
+            if "pdf" in paper:
+                path = os.path.join(os.path.dirname(args.fixtures), paper["pdf"])
+            else:
+                path = os.path.join(directory, f"{paper['name']}.pdf")
+                _render_fixture(paper["lines"], path)
+            parsed.append(parse_pdf(path))
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        results = [extract_layout_metadata(document) for document in parsed]
+    seconds = time.perf_counter() - started
+
+    titles = 0
+    counts = {field: [0, 0, 0] for field in ["authors", "organizations", "emails"]}
+    for paper, result in zip(papers, results):
+        expected = paper["expected"]
+        title_ok = " ".join(result["title"].lower().split()) == " ".join(expected["title"].lower().split())
+        titles += title_ok
+        if args.verbose and not title_ok:
+            print(f"{paper['name']}: title {result['title']!r}, expected {expected['title']!r}")
+        for field, total in counts.items():
+            for i, count in enumerate(_precision_recall(result[field], expected[field])):
+                total[i] += count
+            if args.verbose and set(result[field]) != set(expected[field]):
+                print(f"{paper['name']}: {field} {result[field]}, expected {expected[field]}")
+
+    print(f"{len(papers)} labelled first pages x {args.repeat} runs, "
+          f"{1e6 * seconds / max(len(papers) * args.repeat, 1):.1f} us/page")
+    print(f"{'field':<16}{'precision':>10}{'recall':>10}")
+    print(f"{'title':<16}{titles / len(papers):>10.1%}{titles / len(papers):>10.1%}")
+    for field, (correct, found, expected) in counts.items():
+        print(f"{field:<16}{correct / max(found, 1):>10.1%}{correct / max(expected, 1):>10.1%}")
+
+
+# Run in a fresh interpreter: import a module, report the time, peak RSS and loaded models
+IMPORT_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - started
+from model_utils import registry
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": seconds, "peak_rss_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024),
+                  "loaded": registry.loaded()}))
+"""
+
+
+def bench_imports(args: argparse.Namespace) -> None:
+    """Measure the cold-start import time of the entry point modules."""
+    print(f"{'module':<18}{'median s':>10}{'min s':>10}{'peak MiB':>10}  loaded models")
+    for module in args.modules:
+        runs = []
+        for _ in range(args.repeat):
+            result = subprocess.run([sys.executable, "-c", IMPORT_PROBE, module], capture_output=True, text=True)
+            if result.returncode != 0:
+                logger.error(f"Importing {module} failed: {result.stderr.strip().splitlines()[-1:]}")
+                break
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        if not runs:
+            continue
+        seconds = [run["seconds"] for run in runs]
+        peak = max(run["peak_rss_mb"] for run in runs)
+        loaded = ", ".join(runs[-1]["loaded"]) or "none"
+        print(f"{module:<18}{statistics.median(seconds):>10.2f}{min(seconds):>10.2f}{peak:>10.0f}  {loaded}")
+
+
+def main():
+    """Run one of the SciChat micro-benchmarks"""
+    parser = argparse.ArgumentParser(description="SciChat benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ann_parser = subparsers.add_parser("ann", help="Recall@k and latency of IVF vs exact local search")
+    ann_parser.add_argument("--size", type=int, default=200000, help="Number of indexed vectors")
+    ann_parser.add_argument("--dimension", type=int, default=384, help="Vector dimension")
+    ann_parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    ann_parser.add_argument("--k", type=int, default=10, help="Number of neighbours per query")
+    ann_parser.add_argument("--nlist", type=int, default=0, help="Number of IVF lists (0 = 4 * sqrt(n))")
+    ann_parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32], help="nprobe values to test")
+    ann_parser.set_defaults(func=bench_ann)
+
+    chunking_parser = subparsers.add_parser("chunking", help="Vectors per paper and hit rate of the chunkers")
+    chunking_parser.add_argument("--pdf-dir", required=True, help="Directory of PDF papers")
+    chunking_parser.add_argument("--max-papers", type=int, default=50, help="Maximum number of papers used")
+    chunking_parser.add_argument("--queries-per-paper", type=int, default=20, help="Sampled sentences per paper")
+    chunking_parser.add_argument("--k", type=int, default=5, help="Number of chunks retrieved per query")
+    chunking_parser.add_argument("--max-tokens", type=int, default=200, help="Token budget of structured chunks")
+    chunking_parser.set_defaults(func=bench_chunking)
+
+    retrieval_parser = subparsers.add_parser("retrieval", help="Recall and latency of sparse, dense and hybrid retrieval")
+    retrieval_parser.add_argument("--pdf-dir", required=True, help="Directory of PDF papers")
+    retrieval_parser.add_argument("--max-papers", type=int, default=50, help="Maximum number of papers used")
+    retrieval_parser.add_argument("--queries", type=int, default=300, help="Number of sampled query sentences")
+    retrieval_parser.add_argument("--keywords", type=int, default=3, help="Rarest terms kept in keyword queries")
+    retrieval_parser.add_argument("--k", type=int, default=10, help="Number of chunks retrieved per query")
+    retrieval_parser.set_defaults(func=bench_retrieval)
+
+    metadata_parser = subparsers.add_parser("metadata", help="Latency of the registry fast path for metadata questions")
+    metadata_parser.add_argument("--papers", type=int, default=500, help="Number of synthetic papers")
+    metadata_parser.add_argument("--queries", type=int, default=500, help="Number of metadata questions")
+    metadata_parser.set_defaults(func=bench_metadata)
+
+    layout_parser = subparsers.add_parser("layout", help="Accuracy and per-page time of layout metadata extraction")
+    layout_parser.add_argument("--fixtures", default="fixtures/layout_metadata.json", help="Labelled first pages")
+    layout_parser.add_argument("--repeat", type=int, default=20, help="Passes over the fixtures")
+    layout_parser.add_argument("--verbose", action="store_true", help="Print every mismatching field")
+    layout_parser.set_defaults(func=bench_layout)
+
+    imports_parser = subparsers.add_parser("imports", help="Cold-start import time of the app and CLI modules")
+    imports_parser.add_argument("--modules", nargs="+", default=["app", "main"], help="Modules to import")
+    imports_parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per module")
+    imports_parser.set_defaults(func=bench_imports)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+import os
+import re
+import json
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from lock_utils import file_lock, file_version
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Terms keep inner dots, dashes and underscores, so "BRCA1", "p-value", "3.14",
+# "ImageNet-1k" and "eq_2" stay single searchable tokens
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[._-][a-z0-9]+)*')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were "
+    "which with we our their these those can not".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase BM25 terms.
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of terms, stopwords removed
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Incrementally updatable inverted index with BM25 scoring.
+
+    Each term maps to two parallel arrays of document numbers (uint32) and
+    term frequencies (uint16). Postings of added documents are buffered and
+    merged into the arrays on the next search. Deleted documents are
+    tombstoned and their postings dropped when the index is persisted.
+
+    Several processes may share the directory: `refresh` picks up a version
+    persisted by another process, and `persist` replays this process's
+    unsaved changes on top of it under a file lock instead of overwriting it.
+
+    The index only keeps vector IDs and the `document_id` of each entry;
+    texts and other metadata stay in the vector store.
+    """
+
+    def __init__(self, directory: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Open the index persisted in a directory, or create an empty one.
+
+        Args:
+            directory: Directory holding bm25.json and bm25_postings.npz (None keeps it in memory)
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+        """
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+        if directory:
+            self._load()
+
+    def _reset(self) -> None:
+        self._ids: List[Optional[str]] = []
+        self._document_ids: List[str] = []
+        self._lengths = array("I")
+        self._id_to_doc: Dict[str, int] = {}
+        self._total_length = 0
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: Dict[str, Tuple[array, array]] = {}
+        self._tombstones = 0
+        self._dirty = False
+        self._loaded_version: Optional[Tuple[int, int]] = None
+        # Changes since the last persist, vector id -> (document id, text), or None when removed
+        self._unsaved: Dict[str, Optional[Tuple[str, str]]] = {}
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.directory, "bm25.json")
+
+    @property
+    def postings_path(self) -> str:
+        return os.path.join(self.directory, "bm25_postings.npz")
+
+    def __len__(self) -> int:
+        return len(self._id_to_doc)
+
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self._id_to_doc
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.directory, "bm25.lock")
+
+    def _load(self) -> None:
+        if not (os.path.exists(self.state_path) and os.path.exists(self.postings_path)):
+            return
+        self._loaded_version = file_version(self.state_path)
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        arrays = np.load(self.postings_path)
+        offsets, docs, freqs = arrays["offsets"], arrays["docs"], arrays["freqs"]
+
+        self._ids = state["ids"]
+        self._document_ids = state["document_ids"]
+        self._lengths = array("I", state["lengths"])
+        self._id_to_doc = {vector_id: doc for doc, vector_id in enumerate(self._ids)}
+        self._total_length = sum(self._lengths)
+        # Postings are views into the two large arrays
+        for i, term in enumerate(state["terms"]):
+            self._postings[term] = (docs[offsets[i]:offsets[i + 1]], freqs[offsets[i]:offsets[i + 1]])
+        logger.info(f"Loaded BM25 index with {len(self._ids)} entries and {len(self._postings)} terms")
+
+    def refresh(self) -> bool:
+        """
+        Reload the index if another process persisted a newer version.
+
+        Entries added or removed here but not persisted yet are kept: the
+        index is only reloaded when it has no unsaved changes.
+
+        Returns:
+            Whether the index was reloaded
+        """
+        if not self.directory:
+            return False
+        with self._lock:
+            version = file_version(self.state_path)
+            if self._dirty or version is None or version == self._loaded_version:
+                return False
+            self._reset()
+            self._load()
+            return True
+
+    def add(self, entries: Iterable[Tuple[str, str, str]]) -> None:
+        """
+        Index (or re-index) texts.
+
+        Args:
+            entries: (vector id, document id, text) tuples
+        """
+        with self._lock:
+            for vector_id, document_id, text in entries:
+                if vector_id in self._id_to_doc:
+                    self._remove_doc(self._id_to_doc[vector_id])
+                terms = Counter(tokenize(text))
+                doc = len(self._ids)
+                self._ids.append(vector_id)
+                self._document_ids.append(document_id)
+                length = sum(terms.values())
+                self._lengths.append(length)
+                self._total_length += length
+                self._id_to_doc[vector_id] = doc
+                self._unsaved[vector_id] = (document_id, text)
+                for term, count in terms.items():
+                    docs, freqs = self._pending.setdefault(term, (array("I"), array("H")))
+                    docs.append(doc)
+                    freqs.append(min(count, 65535))
+                self._dirty = True
+
+    def _remove_doc(self, doc: int) -> None:
+        self._id_to_doc.pop(self._ids[doc], None)
+        self._total_length -= self._lengths[doc]
+        self._ids[doc] = None
+        self._tombstones += 1
+        self._dirty = True
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """
+        Remove entries by vector ID.
+
+        Args:
+            ids: Vector IDs to remove
+        """
+        with self._lock:
+            for vector_id in ids:
+                if vector_id in self._id_to_doc:
+                    self._remove_doc(self._id_to_doc[vector_id])
+                    self._unsaved[vector_id] = None
+
+    def remove_document(self, document_id: str) -> None:
+        """
+        Remove every entry of a document.
+
+        Args:
+            document_id: ID of the document
+        """
+        with self._lock:
+            for doc, owner in enumerate(self._document_ids):
+                if owner == document_id and self._ids[doc] is not None:
+                    self._unsaved[self._ids[doc]] = None
+                    self._remove_doc(doc)
+
+    def _merge_pending(self) -> None:
+        for term, (docs, freqs) in self._pending.items():
+            new_docs = np.frombuffer(docs, dtype=np.uint32)
+            new_freqs = np.frombuffer(freqs, dtype=np.uint16)
+            if term in self._postings:
+                old_docs, old_freqs = self._postings[term]
+                new_docs = np.concatenate([old_docs, new_docs])
+                new_freqs = np.concatenate([old_freqs, new_freqs])
+            self._postings[term] = (new_docs, new_freqs)
+        self._pending = {}
+
+    def search(self, query: str, top_k: int = 10, document_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Rank entries against a query with BM25.
+
+        Args:
+            query: Query text
+            top_k: Number of results
+            document_id: Only return entries of this document
+
+        Returns:
+            List of (vector id, score) sorted by decreasing score
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if self._pending:
+                self._merge_pending()
+            live = len(self._id_to_doc)
+            if not terms or not live:
+                return []
+
+            average_length = self._total_length / live
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            for term in terms:
+                if term not in self._postings:
+                    continue
+                docs, freqs = self._postings[term]
+                # Document frequency counts tombstoned postings too, a small bias until compaction
+                idf = np.log(1 + (live - len(docs) + 0.5) / (len(docs) + 0.5))
+                tf = freqs.astype(np.float32)
+                norms = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norms)
+
+            # Drop removed entries and other documents among the matching ones only
+            candidates = np.flatnonzero(scores > 0)
+            if self._tombstones or document_id is not None:
+                candidates = np.asarray([
+                    doc for doc in candidates.tolist()
+                    if self._ids[doc] is not None and (document_id is None or self._document_ids[doc] == document_id)
+                ], dtype=np.int64)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [(self._ids[doc], float(scores[doc])) for doc in candidates.tolist()]
+
+    def persist(self) -> None:
+        """
+        Compact tombstoned entries and write the index files atomically.
+
+        When another process persisted the index since it was loaded, its
+        version is reloaded first and the changes made here replayed on it.
+        """
+        with self._lock:
+            if not self._dirty or not self.directory:
+                return
+            with file_lock(self.lock_path):
+                self._persist()
+
+    def _persist(self) -> None:
+        version = file_version(self.state_path)
+        if version is not None and version != self._loaded_version:
+            unsaved = self._unsaved
+            logger.info(f"BM25 index in {self.directory} changed on disk, merging {len(unsaved)} changes")
+            self._reset()
+            self._load()
+            self.remove(vector_id for vector_id, entry in unsaved.items() if entry is None)
+            self.add((vector_id, *entry) for vector_id, entry in unsaved.items() if entry is not None)
+        self._merge_pending()
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Renumber live documents and drop postings of removed ones
+        live = [doc for doc, vector_id in enumerate(self._ids) if vector_id is not None]
+        renumber = np.full(len(self._ids), -1, dtype=np.int64)
+        renumber[live] = np.arange(len(live))
+        terms, offsets, all_docs, all_freqs = [], [0], [], []
+        for term, (docs, freqs) in self._postings.items():
+            keep = renumber[docs] >= 0
+            if not keep.any():
+                continue
+            terms.append(term)
+            all_docs.append(renumber[docs[keep]].astype(np.uint32))
+            all_freqs.append(freqs[keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+
+        self._ids = [self._ids[doc] for doc in live]
+        self._document_ids = [self._document_ids[doc] for doc in live]
+        self._lengths = array("I", (self._lengths[doc] for doc in live))
+        self._id_to_doc = {vector_id: doc for doc, vector_id in enumerate(self._ids)}
+        self._tombstones = 0
+        docs = np.concatenate(all_docs) if all_docs else np.empty(0, dtype=np.uint32)
+        freqs = np.concatenate(all_freqs) if all_freqs else np.empty(0, dtype=np.uint16)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        self._postings = {
+            term: (docs[offsets[i]:offsets[i + 1]], freqs[offsets[i]:offsets[i + 1]])
+            for i, term in enumerate(terms)
+        }
+
+        tmp_postings = self.postings_path + ".tmp.npz"
+        tmp_state = self.state_path + ".tmp"
+        np.savez(tmp_postings, offsets=offsets, docs=docs, freqs=freqs)
+        with open(tmp_state, "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "document_ids": self._document_ids,
+                       "lengths": list(self._lengths), "terms": terms}, f)
+        os.replace(tmp_postings, self.postings_path)
+        os.replace(tmp_state, self.state_path)
+        self._loaded_version = file_version(self.state_path)
+        self._unsaved = {}
+        self._dirty = False
+        logger.info(f"Persisted BM25 index with {len(self._ids)} entries and {len(terms)} terms")
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Merge ranked ID lists with reciprocal rank fusion.
+
+    Args:
+        rankings: Lists of IDs, best first
+        k: RRF constant damping the weight of top ranks
+
+    Returns:
+        List of (id, fused score) sorted by decreasing score
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, vector_id in enumerate(ranking):
+            scores[vector_id] = scores.get(vector_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
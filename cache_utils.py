@@ -0,0 +1,377 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Any, Optional, Set
+
+import numpy as np
+
+from metrics_utils import CACHE_LOOKUPS
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+
+    Vectors are keyed by a SHA-256 hash of (model name, text) and stored as
+    raw float32 blobs. The cache is bounded to `max_entries` rows; when it
+    grows past that, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 500000, dimension: int = 384):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Path to the SQLite database file
+            max_entries: Maximum number of cached vectors before LRU eviction
+            dimension: Dimension of the cached vectors
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.dimension = dimension
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, "
+            "vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"Embedding cache opened at {path} with {self._size} entries")
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """
+        Build the content-addressed key for a text embedded with a model.
+
+        Args:
+            model_name: Name of the embedding model
+            text: Text that was embedded
+
+        Returns:
+            Hex digest identifying the (model name, text) pair
+        """
+        digest = hashlib.sha256()
+        digest.update(model_name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up cached embeddings for a list of texts.
+
+        Args:
+            model_name: Name of the embedding model
+            texts: Texts to look up
+
+        Returns:
+            Dictionary mapping positions in `texts` to their cached vectors.
+            Positions that are not cached are missing from the result.
+        """
+        if not texts:
+            return {}
+
+        keys = [self.make_key(model_name, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            unique_keys = list(set(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = {i: found[key] for i, key in enumerate(keys) if key in found}
+            self.hits += len(results)
+            self.misses += len(texts) - len(results)
+        CACHE_LOOKUPS.inc(len(results), cache="embedding", result="hit")
+        CACHE_LOOKUPS.inc(len(texts) - len(results), cache="embedding", result="miss")
+
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], embeddings: np.ndarray) -> None:
+        """
+        Store embeddings for a list of texts, evicting old entries if needed.
+
+        Args:
+            model_name: Name of the embedding model
+            texts: Texts that were embedded
+            embeddings: Matrix of embeddings, one row per text
+        """
+        if not texts:
+            return
+
+        now = time.time()
+        rows = [
+            (self.make_key(model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._size += self._conn.total_changes - before
+
+            if self._size > self.max_entries:
+                excess = self._size - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,)
+                )
+                self._size -= excess
+                self.evictions += excess
+
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report cache counters.
+
+        Returns:
+            Dictionary with hits, misses, hit rate, evictions and current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        """Remove every cached embedding and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+class AnswerCache:
+    """
+    In-memory semantic cache of generated answers.
+
+    An answer depends on the (standalone) question and on the chunks passed
+    to the LLM, so entries are keyed by both: the set of retrieved chunks,
+    each identified by its vector ID and content hash, and the retrieval
+    scope (e.g. the document a question was restricted to) must match exactly,
+    and the question embedding must be within `threshold` cosine similarity
+    of the cached one. Re-indexed chunks get a new content hash, so stale
+    answers are never served; `invalidate_documents` also frees their
+    entries eagerly. Entries expire after `ttl` seconds and the least
+    recently used ones are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, threshold: float = 0.95):
+        """
+        Args:
+            max_entries: Maximum number of cached answers before LRU eviction
+            ttl: Lifetime of an answer in seconds (0 keeps answers until evicted)
+            threshold: Minimum cosine similarity between a question and a cached one
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_chunks: Dict[str, Set[int]] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def make_key(chunk_ids: Iterable[str], scope: str = "") -> str:
+        """
+        Build the key of a set of retrieved chunks.
+
+        Args:
+            chunk_ids: Chunk identifiers, e.g. "<vector id>:<content hash>"
+            scope: Restriction the chunks were retrieved under ("" for the whole corpus)
+
+        Returns:
+            Hex digest independent of the retrieval order
+        """
+        digest = hashlib.sha256()
+        digest.update(scope.encode("utf-8"))
+        digest.update(b"\1")
+        for chunk_id in sorted(set(chunk_ids)):
+            digest.update(chunk_id.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _normalize(vector: Iterable[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        bucket = self._by_chunks[entry["key"]]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._by_chunks[entry["key"]]
+
+    def get(self, question_vector: Iterable[float], chunk_ids: Iterable[str], scope: str = "") -> Optional[str]:
+        """
+        Look up the answer of a similar question over the same chunks.
+
+        Args:
+            question_vector: Embedding of the standalone question
+            chunk_ids: Identifiers of the retrieved chunks
+            scope: Restriction the chunks were retrieved under, see make_key
+
+        Returns:
+            Cached answer, or None on a miss
+        """
+        key = self.make_key(chunk_ids, scope)
+        query = self._normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_chunks.get(key, ())):
+                entry = self._entries[entry_id]
+                if self.ttl and now - entry["created_at"] > self.ttl:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                score = float(entry["vector"] @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="answer", result="miss")
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="answer", result="hit")
+            self.saved_seconds += entry["seconds"]
+            return entry["answer"]
+
+    def put(self, question_vector: Iterable[float], chunk_ids: Iterable[str], answer: str,
+            document_ids: Iterable[str] = (), seconds: float = 0.0, scope: str = "") -> None:
+        """
+        Cache a generated answer.
+
+        Args:
+            question_vector: Embedding of the standalone question
+            chunk_ids: Identifiers of the retrieved chunks
+            answer: Generated answer
+            document_ids: Documents the chunks belong to, for invalidation
+            seconds: Time it took to generate the answer, counted as saved on each hit
+            scope: Restriction the chunks were retrieved under, see make_key
+        """
+        key = self.make_key(chunk_ids, scope)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "key": key,
+                "vector": self._normalize(question_vector),
+                "answer": answer,
+                "document_ids": set(document_ids),
+                "created_at": time.time(),
+                "seconds": seconds,
+            }
+            self._by_chunks.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """
+        Drop the answers built from chunks of re-indexed documents.
+
+        Args:
+            document_ids: IDs of the re-indexed documents
+
+        Returns:
+            Number of dropped answers
+        """
+        document_ids = set(document_ids)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry["document_ids"] & document_ids]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report cache counters.
+
+        Returns:
+            Dictionary with hits, misses, hit rate, LLM time saved, evictions,
+            expirations, invalidations and current size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_seconds": self.saved_seconds,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self) -> None:
+        """Remove every cached answer and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._by_chunks.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+            self.invalidations = 0
+            self.saved_seconds = 0.0
@@ -0,0 +1,304 @@
+import os
+import re
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Any
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Token budget of the chunks embedded for retrieval. all-MiniLM-L6-v2 truncates
+# its input at 256 word pieces, so larger chunks would be partly ignored.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+# Number of trailing sentences repeated at the start of the next chunk
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "0"))
+
+# Section names recognised without numbering, e.g. "Abstract" or "RELATED WORK"
+SECTION_NAMES = {
+    "abstract", "introduction", "background", "related work", "related works", "preliminaries",
+    "method", "methods", "methodology", "approach", "model", "experiments", "experimental setup",
+    "evaluation", "results", "discussion", "analysis", "limitations", "conclusion", "conclusions",
+    "future work", "acknowledgements", "acknowledgments", "references", "bibliography", "appendix",
+}
+
+# "3 Method", "2.1. Training Data", "IV. RESULTS", "A. Proofs"
+NUMBERED_HEADING = re.compile(r'^(\d{1,2}(?:\.\d{1,2})*\.?|[IVX]+\.|[A-Z]\.)\s+([A-Z][^.!?,;:]{1,80})$')
+# Table cells and list values: "76", "93.4", "1,024", "12%", "±0.3"
+NUMERIC_TOKEN = re.compile(r'^[±+-]?\d[\d.,]*%?$')
+# Words that make a sentence-case numbered line a heading, e.g. "4.2 Training details"
+HEADING_WORDS = {
+    word for name in SECTION_NAMES for word in name.split()
+} | {
+    "ablation", "ablations", "algorithm", "architecture", "baselines", "comparison", "data", "dataset",
+    "datasets", "definitions", "details", "formulation", "framework", "hyperparameters", "implementation",
+    "metrics", "notation", "overview", "performance", "problem", "proof", "proofs", "settings", "setup",
+    "study", "training",
+}
+# Words opening a sentence or list item rather than a title
+SENTENCE_STARTERS = {"we", "our", "this", "these", "it", "there", "here", "a", "an"}
+# Words ignored by the title-case ratio
+MINOR_WORDS = {"a", "an", "and", "as", "at", "by", "for", "from", "in", "of", "on", "or", "the", "to", "via", "vs", "with"}
+# Sentence ends followed by what looks like the start of a new sentence
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])["\')\]]?\s+(?=["\'(\[]?[A-Z0-9])')
+# Characters ending a complete sentence
+SENTENCE_ENDINGS = (".", "!", "?", ":", '."', ".)")
+# Words hyphenated across a line break
+LINE_HYPHENATION = re.compile(r'(\w)-\n(\w)')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of word-piece tokens of a text without a tokenizer.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count (about 1.3 word pieces per word)
+    """
+    return int(len(text.split()) * 1.3) + 1
+
+
+def _numbering_level(line: str) -> Optional[tuple]:
+    """Return the parent numbers and the last number of a "2.3 ..." line, or None."""
+    match = re.match(r'^(\d{1,2}(?:\.\d{1,2})*)\.?\s', line)
+    if not match:
+        return None
+    numbers = [int(number) for number in match.group(1).split(".")]
+    return tuple(numbers[:-1]), numbers[-1]
+
+
+def is_heading(line: str, next_line: Optional[str] = None) -> bool:
+    """
+    Decide whether a line of PDF text is a section heading.
+
+    Numbered lines only count as headings when their title has no other
+    numbers (table rows), does not read like a sentence (list items), is in
+    title case or contains a usual heading word, and the next line does not
+    carry the following number at the same level (numbered lists).
+
+    Args:
+        line: A single stripped line
+        next_line: The next non-empty stripped line, if any
+
+    Returns:
+        True for known section names and short numbered titles
+    """
+    if not line or len(line) > 90:
+        return False
+    normalized = re.sub(r'^(?:\d{1,2}(?:\.\d{1,2})*\.?|[IVX]+\.)\s*', '', line).strip().rstrip(':').lower()
+    if normalized in SECTION_NAMES:
+        return True
+
+    match = NUMBERED_HEADING.match(line)
+    if not match:
+        return False
+    words = match.group(2).split()
+    if len(words) > 8 or any(NUMERIC_TOKEN.match(word) for word in words):
+        return False
+    if words[0].lower() in SENTENCE_STARTERS:
+        return False
+    significant = [word for word in words if word.lower() not in MINOR_WORDS]
+    capitalized = sum(1 for word in significant if word[0].isupper())
+    if capitalized < 0.6 * len(significant) and not any(
+        word.lower().strip("()") in HEADING_WORDS for word in significant
+    ):
+        return False
+
+    level = _numbering_level(line)
+    if level and next_line:
+        following = _numbering_level(next_line)
+        if following == (level[0], level[1] + 1):
+            return False
+    return True
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split a paragraph into sentences.
+
+    Args:
+        text: Paragraph text with line breaks already joined
+
+    Returns:
+        List of non-empty sentences
+    """
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+class Chunk:
+    """A run of whole sentences from one section of a document."""
+
+    def __init__(self, text: str, section: str, page_start: int, page_end: int, tokens: int):
+        """
+        Args:
+            text: Chunk text
+            section: Title of the section the chunk belongs to ("" before the first heading)
+            page_start: 1-based page number where the chunk starts
+            page_end: 1-based page number where the chunk ends
+            tokens: Estimated token count
+        """
+        self.text = text
+        self.section = section
+        self.page_start = page_start
+        self.page_end = page_end
+        self.tokens = tokens
+
+    def metadata(self) -> Dict[str, Any]:
+        """Return the page and section metadata stored with the chunk."""
+        return {"section": self.section, "page": self.page_start, "page_end": self.page_end}
+
+    def __repr__(self) -> str:
+        return f"Chunk(section={self.section!r}, pages={self.page_start}-{self.page_end}, tokens={self.tokens})"
+
+
+def _iter_units(pages: Iterable[str]) -> Iterator[tuple]:
+    """
+    Turn page texts into a stream of ("heading", title, page) and
+    ("sentence", text, page) units.
+
+    A sentence running over a page break is emitted once, with the page
+    where it starts.
+    """
+    carry, carry_page = "", 0
+    for page_number, page in enumerate(pages, start=1):
+        paragraph: List[str] = []
+
+        def flush(keep_tail: bool) -> Iterator[tuple]:
+            nonlocal carry, carry_page
+            text = " ".join(([carry] if carry else []) + paragraph)
+            first_page = carry_page if carry else page_number
+            paragraph.clear()
+            carry = ""
+            sentences = split_sentences(text)
+            # Keep an unfinished last sentence for the next page
+            if keep_tail and sentences and not sentences[-1].endswith(SENTENCE_ENDINGS):
+                carry_page = page_number if len(sentences) > 1 else first_page
+                carry = sentences.pop()
+            for i, sentence in enumerate(sentences):
+                yield ("sentence", sentence, first_page if i == 0 else page_number)
+
+        lines = [line.strip() for line in LINE_HYPHENATION.sub(r'\1\2', page).split("\n")]
+        lines = [line for line in lines if line]
+        for i, line in enumerate(lines):
+            if is_heading(line, lines[i + 1] if i + 1 < len(lines) else None):
+                yield from flush(keep_tail=False)
+                yield ("heading", line, page_number)
+            else:
+                paragraph.append(line)
+        yield from flush(keep_tail=True)
+
+    if carry:
+        yield ("sentence", carry, carry_page)
+
+
+def iter_structured_chunks(pages: Iterable[str], max_tokens: int = CHUNK_TOKENS,
+                           overlap_sentences: int = CHUNK_OVERLAP_SENTENCES,
+                           token_counter: Callable[[str], int] = estimate_tokens) -> Iterator[Chunk]:
+    """
+    Split a document into section- and sentence-aligned chunks, streaming over pages.
+
+    Chunks never cross a section heading and only break between sentences,
+    except for single sentences longer than the budget, which are split by
+    words. Only the chunk being built is kept in memory.
+
+    Args:
+        pages: Page texts in reading order (page numbers start at 1)
+        max_tokens: Token budget per chunk
+        overlap_sentences: Number of trailing sentences repeated in the next chunk
+        token_counter: Function estimating the token count of a text
+
+    Yields:
+        Chunk objects
+    """
+    section = ""
+    sentences: List[tuple] = []  # (text, page, tokens)
+    tokens = 0
+    carried = 0  # Leading sentences repeated from the previous chunk
+
+    def emit() -> Optional[Chunk]:
+        nonlocal sentences, tokens, carried
+        # Nothing but overlap from the previous chunk
+        if len(sentences) <= carried:
+            return None
+        chunk = Chunk(
+            text=" ".join(text for text, _, _ in sentences),
+            section=section,
+            page_start=sentences[0][1],
+            page_end=sentences[-1][1],
+            tokens=tokens
+        )
+        sentences = sentences[-overlap_sentences:] if overlap_sentences else []
+        tokens = sum(count for _, _, count in sentences)
+        carried = len(sentences)
+        return chunk
+
+    for kind, text, page in _iter_units(pages):
+        if kind == "heading":
+            chunk = emit()
+            if chunk:
+                yield chunk
+            # Overlap never crosses a section boundary
+            sentences, tokens, carried = [], 0, 0
+            section = text
+            continue
+
+        count = token_counter(text)
+        if count > max_tokens:
+            # Split an overlong sentence (often a table or reference list) by words
+            chunk = emit()
+            if chunk:
+                yield chunk
+            words = text.split()
+            step = max(1, int(len(words) * max_tokens / count))
+            for start in range(0, len(words), step):
+                piece = " ".join(words[start:start + step])
+                yield Chunk(piece, section, page, page, token_counter(piece))
+            sentences, tokens, carried = [], 0, 0
+            continue
+
+        if tokens + count > max_tokens:
+            chunk = emit()
+            if chunk:
+                yield chunk
+            # Drop the overlap if it leaves no room for the new sentence
+            while sentences and tokens + count > max_tokens:
+                tokens -= sentences.pop(0)[2]
+                carried = max(0, carried - 1)
+        sentences.append((text, page, count))
+        tokens += count
+
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def split_documents(documents: List[Document], max_tokens: int = CHUNK_TOKENS,
+                    overlap_sentences: int = CHUNK_OVERLAP_SENTENCES) -> List[Document]:
+    """
+    Chunk per-page LangChain documents with the structure-aware chunker.
+
+    Args:
+        documents: One Document per page, in reading order
+        max_tokens: Token budget per chunk
+        overlap_sentences: Number of trailing sentences repeated in the next chunk
+
+    Returns:
+        Chunk Documents carrying the source metadata plus section and page numbers
+    """
+    base_metadata = dict(documents[0].metadata) if documents else {}
+    base_metadata.pop("page", None)
+    return [
+        Document(page_content=chunk.text, metadata={**base_metadata, **chunk.metadata()})
+        for chunk in iter_structured_chunks(
+            (document.page_content for document in documents),
+            max_tokens=max_tokens,
+            overlap_sentences=overlap_sentences
+        )
+    ]
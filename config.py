@@ -22,6 +22,9 @@ if not OPENAI_API_KEY:
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
 
-# Validate Pinecone key
-if not PINECONE_API_KEY:
+# Vector store backend: "pinecone" or "local"
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+
+# Validate Pinecone key (not needed by the local vector store)
+if VECTOR_STORE == "pinecone" and not PINECONE_API_KEY:
     raise ValueError("PINECONE_API_KEY is not set. Please add it to your .env file.")
\ No newline at end of file
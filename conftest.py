@@ -0,0 +1 @@
+# Lets the tests import the top-level modules when pytest runs from the repository root
@@ -0,0 +1,353 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from chunk_utils import estimate_tokens
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Conversation backend: "memory" (per process) or "sqlite" (shared by uvicorn workers)
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "memory").lower()
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(os.getcwd(), "index", "conversations.sqlite3"))
+# Conversations idle for longer than this many seconds are dropped
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "86400"))
+# Maximum number of conversations kept by the memory backend, least recently used dropped first
+CONVERSATION_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_MAX_CONVERSATIONS", "10000"))
+# Turns stored per conversation
+CONVERSATION_MAX_STORED_TURNS = int(os.getenv("CONVERSATION_MAX_STORED_TURNS", "50"))
+# Window of past turns passed to the QA chain
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "6"))
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "1500"))
+
+Turn = Tuple[str, str]
+
+
+def truncate_history(turns: List[Turn], max_turns: int = CONVERSATION_MAX_TURNS,
+                     max_tokens: int = CONVERSATION_MAX_TOKENS) -> List[Turn]:
+    """
+    Keep the most recent turns that fit a turn and token budget.
+
+    Args:
+        turns: (question, answer) turns, oldest first
+        max_turns: Maximum number of turns kept
+        max_tokens: Maximum estimated tokens of the kept questions and answers
+
+    Returns:
+        Most recent turns, oldest first. The last turn is always kept, with
+        its answer shortened if it alone exceeds the token budget.
+    """
+    window: List[Turn] = []
+    budget = max_tokens
+    for question, answer in reversed(turns[-max_turns:] if max_turns > 0 else []):
+        tokens = estimate_tokens(question) + estimate_tokens(answer)
+        if tokens > budget:
+            if not window:
+                # Follow-ups need at least the previous question
+                words = max(0, int((budget - estimate_tokens(question)) / 1.3))
+                window.append((question, " ".join(answer.split()[:words])))
+            break
+        window.append((question, answer))
+        budget -= tokens
+    window.reverse()
+    return window
+
+
+class ConversationStore(ABC):
+    """
+    Interface shared by the conversation store backends.
+
+    Conversations expire `ttl` seconds after their last use and keep at
+    most `max_stored_turns` turns. `history` returns the truncated window
+    passed to the QA chain.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL, max_stored_turns: int = CONVERSATION_MAX_STORED_TURNS,
+                 max_turns: int = CONVERSATION_MAX_TURNS, max_tokens: int = CONVERSATION_MAX_TOKENS):
+        """
+        Args:
+            ttl: Seconds of inactivity after which a conversation is dropped (0 keeps it)
+            max_stored_turns: Turns stored per conversation
+            max_turns: Turns in the history window
+            max_tokens: Token budget of the history window
+        """
+        self.ttl = ttl
+        self.max_stored_turns = max_stored_turns
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+
+    @abstractmethod
+    def append(self, conversation_id: str, question: str, answer: str) -> None:
+        """
+        Add a turn to a conversation, creating it if needed.
+
+        Args:
+            conversation_id: ID of the conversation
+            question: User's question
+            answer: Generated answer
+        """
+
+    @abstractmethod
+    def turns(self, conversation_id: str) -> List[Turn]:
+        """
+        Return the stored turns of a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            (question, answer) turns, oldest first; empty for unknown or expired conversations
+        """
+
+    @abstractmethod
+    def delete(self, conversation_id: str) -> None:
+        """
+        Remove a conversation.
+
+        Args:
+            conversation_id: ID of the conversation
+        """
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report store metrics.
+
+        Returns:
+            Dictionary with the number of live conversations, stored turns,
+            bytes of question and answer text held, and expired or evicted
+            conversation counts
+        """
+
+    def history(self, conversation_id: str) -> List[Turn]:
+        """
+        Return the history window passed to the QA chain.
+
+        Args:
+            conversation_id: ID of the conversation
+
+        Returns:
+            Most recent turns within the turn and token budget, oldest first
+        """
+        return truncate_history(self.turns(conversation_id), self.max_turns, self.max_tokens)
+
+
+def _turn_bytes(question: str, answer: str) -> int:
+    return len(question.encode("utf-8")) + len(answer.encode("utf-8"))
+
+
+class MemoryConversationStore(ConversationStore):
+    """Conversation store in process memory, bounded with LRU eviction."""
+
+    def __init__(self, max_conversations: int = CONVERSATION_MAX_CONVERSATIONS, **kwargs: Any):
+        """
+        Args:
+            max_conversations: Conversations kept before the least recently used is dropped
+            **kwargs: See ConversationStore
+        """
+        super().__init__(**kwargs)
+        self.max_conversations = max_conversations
+        self.expired = 0
+        self.evicted = 0
+        self._conversations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _drop(self, conversation_id: str) -> None:
+        conversation = self._conversations.pop(conversation_id)
+        self._bytes -= conversation["bytes"]
+
+    def _purge_expired(self, now: float) -> None:
+        # Least recently used first, so expired conversations are at the front
+        while self._conversations and self.ttl:
+            conversation_id, conversation = next(iter(self._conversations.items()))
+            if now - conversation["updated_at"] <= self.ttl:
+                break
+            self._drop(conversation_id)
+            self.expired += 1
+
+    def append(self, conversation_id: str, question: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = {"turns": deque(), "bytes": 0, "updated_at": now}
+                self._conversations[conversation_id] = conversation
+            turns = conversation["turns"]
+            turns.append((question, answer))
+            added = _turn_bytes(question, answer)
+            while len(turns) > self.max_stored_turns:
+                added -= _turn_bytes(*turns.popleft())
+            conversation["bytes"] += added
+            conversation["updated_at"] = now
+            self._bytes += added
+            self._conversations.move_to_end(conversation_id)
+
+            while len(self._conversations) > self.max_conversations:
+                self._drop(next(iter(self._conversations)))
+                self.evicted += 1
+
+    def turns(self, conversation_id: str) -> List[Turn]:
+        with self._lock:
+            self._purge_expired(time.time())
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return []
+            # Reading counts as activity, which keeps the LRU order sorted by last use
+            conversation["updated_at"] = time.time()
+            self._conversations.move_to_end(conversation_id)
+            return list(conversation["turns"])
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            if conversation_id in self._conversations:
+                self._drop(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge_expired(time.time())
+            return {
+                "backend": "memory",
+                "conversations": len(self._conversations),
+                "turns": sum(len(conversation["turns"]) for conversation in self._conversations.values()),
+                "bytes": self._bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max_conversations": self.max_conversations,
+            }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversation store in a SQLite database, shared by every process that
+    opens the same file (e.g. several uvicorn workers).
+    """
+
+    # Expired conversations are purged on at most one append per interval
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str, **kwargs: Any):
+        """
+        Open (or create) the conversation database.
+
+        Args:
+            path: Path to the SQLite database file
+            **kwargs: See ConversationStore
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # Other workers may hold the write lock briefly
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "conversation_id TEXT NOT NULL, "
+            "question TEXT NOT NULL, "
+            "answer TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns (conversation_id, id)")
+        self._conn.commit()
+        logger.info(f"Conversation store opened at {path}")
+
+    def _purge_expired(self, now: float) -> None:
+        if not self.ttl or now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        cursor = self._conn.execute(
+            "DELETE FROM turns WHERE conversation_id IN ("
+            "SELECT conversation_id FROM turns GROUP BY conversation_id HAVING MAX(created_at) < ?)",
+            (now - self.ttl,)
+        )
+        if cursor.rowcount:
+            logger.info(f"Purged {cursor.rowcount} turns of expired conversations")
+
+    def append(self, conversation_id: str, question: str, answer: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            self._conn.execute(
+                "INSERT INTO turns (conversation_id, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (conversation_id, question, answer, now)
+            )
+            self._conn.execute(
+                "DELETE FROM turns WHERE conversation_id = ? AND id NOT IN ("
+                "SELECT id FROM turns WHERE conversation_id = ? ORDER BY id DESC LIMIT ?)",
+                (conversation_id, conversation_id, self.max_stored_turns)
+            )
+            self._conn.commit()
+
+    def turns(self, conversation_id: str) -> List[Turn]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, answer, created_at FROM turns WHERE conversation_id = ? ORDER BY id",
+                (conversation_id,)
+            ).fetchall()
+        # Another worker may not have purged it yet
+        if rows and self.ttl and time.time() - rows[-1][2] > self.ttl:
+            return []
+        return [(question, answer) for question, answer, _ in rows]
+
+    def delete(self, conversation_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        cutoff = time.time() - self.ttl if self.ttl else 0.0
+        with self._lock:
+            conversations, turns, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(turns), 0), COALESCE(SUM(size), 0) FROM ("
+                "SELECT COUNT(*) AS turns, SUM(LENGTH(CAST(question AS BLOB)) + LENGTH(CAST(answer AS BLOB))) AS size "
+                "FROM turns GROUP BY conversation_id HAVING MAX(created_at) >= ?)",
+                (cutoff,)
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "conversations": conversations,
+            "turns": turns,
+            "bytes": size,
+        }
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """
+    Return the conversation store selected by the CONVERSATION_STORE setting.
+
+    Returns:
+        Shared ConversationStore instance
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            if CONVERSATION_STORE == "memory":
+                _store = MemoryConversationStore()
+            elif CONVERSATION_STORE == "sqlite":
+                _store = SQLiteConversationStore(CONVERSATION_DB_PATH)
+            else:
+                raise ValueError(f"Unknown CONVERSATION_STORE '{CONVERSATION_STORE}', expected 'memory' or 'sqlite'")
+        return _store
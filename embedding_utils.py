@@ -1,10 +1,21 @@
-from sentence_transformers import SentenceTransformer
-import pinecone
 import os
+import json
+import hashlib
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator, Callable
 import logging
+import queue
+import sys
+import threading
+from collections import OrderedDict
 import numpy as np
+from langchain_core.embeddings import Embeddings
+from cache_utils import EmbeddingCache
+from chunk_utils import iter_structured_chunks
+from metrics_utils import VECTORS_UPSERTED, observe_stage, timed
+from model_utils import register_model, get_model
+from vector_utils import VectorStore, get_vector_store
+from registry_utils import document_record, get_document_registry
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,24 +23,68 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-pine_api_key = os.getenv("PINECONE_API_KEY")
-pine_env = os.getenv("PINECONE_ENVIRONMENT")
-
-# Initialize Pinecone
-try:
-    pc = pinecone.Pinecone(api_key=pine_api_key, environment=pine_env)
-    logger.info("Pinecone initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    raise
-
-# Initialize the SentenceTransformer model
-try:
-    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-    logger.info("Embedding model loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load embedding model: {str(e)}")
-    raise
+
+# Number of texts passed to each SentenceTransformer.encode call
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384  # Dimension of the 'all-MiniLM-L6-v2' model
+
+# On-disk embedding cache, disabled when EMBEDDING_CACHE_PATH is empty
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getcwd(), "cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# In-memory LRU of question embeddings, which stay out of the on-disk cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+def _load_embedding_model():
+    from sentence_transformers import SentenceTransformer
+    
+    try:
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        logger.info("Embedding model loaded successfully")
+        return model
+    except Exception as e:
+        logger.error(f"Failed to load embedding model: {str(e)}")
+        raise
+
+# The model is loaded on first use and shared by ingestion and retrieval
+register_model("embedding", _load_embedding_model)
+
+def get_embedding_model():
+    """
+    Return the shared SentenceTransformer model, loading it on first use.
+    
+    Returns:
+        SentenceTransformer instance
+    """
+    return get_model("embedding")
+
+# The embedding cache is opened on first use
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_opened = False
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the shared embedding cache, opening it on first use.
+    
+    Returns:
+        EmbeddingCache at EMBEDDING_CACHE_PATH, or None if the cache is
+        disabled or could not be opened
+    """
+    global _embedding_cache, _embedding_cache_opened
+    with _embedding_cache_lock:
+        if not _embedding_cache_opened and EMBEDDING_CACHE_PATH:
+            try:
+                _embedding_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH,
+                    max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                    dimension=EMBEDDING_DIMENSION
+                )
+            except Exception as e:
+                # The cache is an optimization, keep embedding without it
+                logger.error(f"Failed to open embedding cache, continuing without it: {str(e)}")
+        _embedding_cache_opened = True
+        return _embedding_cache
 
 def determine_text_key(query: str) -> str:
     """
@@ -66,131 +121,561 @@ def get_embedding(text: str) -> List[float]:
     if not text or text.strip() == "":
         logger.warning("Attempted to create embedding for empty text")
         # Return zero vector with correct dimensions
-        return [0.0] * 384
+        return [0.0] * EMBEDDING_DIMENSION
+    
+    embedding_cache = get_embedding_cache()
+    if embedding_cache:
+        cached = embedding_cache.get_many(EMBEDDING_MODEL_NAME, [text])
+        if cached:
+            return cached[0].tolist()
     
     try:
         # Get embedding as numpy array and convert to list
-        embedding = embedding_model.encode(text, convert_to_tensor=False)
+        embedding = get_embedding_model().encode(text, convert_to_tensor=False)
+        if embedding_cache:
+            embedding_cache.put_many(EMBEDDING_MODEL_NAME, [text], [embedding])
         if isinstance(embedding, np.ndarray):
             return embedding.tolist()
         return embedding  # It's already a list
     except Exception as e:
         logger.error(f"Error generating embedding: {str(e)}")
         # Return zero vector with correct dimensions
-        return [0.0] * 384
+        return [0.0] * EMBEDDING_DIMENSION
 
-def process_and_store_embeddings(documents: List[Dict[str, Any]]) -> Optional[pinecone.Index]:
+
+def get_embeddings(texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
     """
-    Process documents and store embeddings in Pinecone.
+    Generate embeddings for many texts using batched SentenceTransformer calls.
     
     Args:
-        documents: List of document dictionaries containing extracted metadata
+        texts: Texts to generate embeddings for
+        batch_size: Number of texts per encode call (default: EMBEDDING_BATCH_SIZE)
         
     Returns:
-        Pinecone index object
+        Contiguous float32 matrix of shape (len(texts), EMBEDDING_DIMENSION).
+        Rows for empty texts are zero vectors.
     """
-    index_name = "document-embeddings"
-    dimension = 384  # Dimension of the 'all-MiniLM-L6-v2' model
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    embeddings = np.zeros((len(texts), EMBEDDING_DIMENSION), dtype=np.float32)
+    
+    # Only non-empty texts go to the model, empty ones keep their zero row
+    positions = [i for i, text in enumerate(texts) if text and text.strip()]
+    if len(positions) < len(texts):
+        logger.warning(f"Skipping {len(texts) - len(positions)} empty texts, using zero vectors")
+    
+    # Fill rows already in the embedding cache and only encode the rest
+    embedding_cache = get_embedding_cache()
+    if embedding_cache and positions:
+        cached = embedding_cache.get_many(EMBEDDING_MODEL_NAME, [texts[i] for i in positions])
+        for j, vector in cached.items():
+            embeddings[positions[j]] = vector
+        positions = [i for j, i in enumerate(positions) if j not in cached]
+    
+    for start in range(0, len(positions), batch_size):
+        batch_positions = positions[start:start + batch_size]
+        try:
+            batch_embeddings = get_embedding_model().encode(
+                [texts[i] for i in batch_positions],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            embeddings[batch_positions] = batch_embeddings
+            if embedding_cache:
+                embedding_cache.put_many(EMBEDDING_MODEL_NAME, [texts[i] for i in batch_positions], batch_embeddings)
+        except Exception as e:
+            # Leave the failed batch as zero vectors, same as get_embedding
+            logger.error(f"Error generating embeddings for batch at {start}: {str(e)}")
+    
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+_query_embeddings: "OrderedDict[str, List[float]]" = OrderedDict()
+_query_embeddings_lock = threading.Lock()
 
+def get_query_embedding(text: str) -> List[float]:
+    """
+    Embed a question, keeping recent questions in an in-memory LRU.
+    
+    Questions are one-off texts, so they are not written to the on-disk
+    embedding cache: that would commit to SQLite on every request and evict
+    chunk embeddings that re-ingestion reuses.
+    
+    Args:
+        text: Question to embed
+        
+    Returns:
+        Embedding vector as list of floats
+    """
+    with _query_embeddings_lock:
+        if text in _query_embeddings:
+            _query_embeddings.move_to_end(text)
+            return _query_embeddings[text]
+    
+    if not text or text.strip() == "":
+        logger.warning("Attempted to create embedding for empty text")
+        return [0.0] * EMBEDDING_DIMENSION
     try:
-        # Check if index exists, create if it doesn't
-        if index_name not in pc.list_indexes().names():
-            logger.info(f"Creating new Pinecone index: {index_name}")
-            pc.create_index(
-                name=index_name,
-                dimension=dimension,
-                metric="cosine",
-                spec=pinecone.ServerlessSpec(
-                    cloud="aws",
-                    region="us-east-1"
-                )
-            )
+        embedding = np.asarray(get_embedding_model().encode(text, convert_to_tensor=False), dtype=np.float32).tolist()
+    except Exception as e:
+        logger.error(f"Error generating query embedding: {str(e)}")
+        return [0.0] * EMBEDDING_DIMENSION
+    
+    with _query_embeddings_lock:
+        _query_embeddings[text] = embedding
+        while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return embedding
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """
+    LangChain Embeddings backed by the shared SentenceTransformer model.
+    
+    Lets retrievers embed queries with the same model instance used for
+    ingestion instead of loading a second copy. Documents go through the
+    on-disk embedding cache, queries through the in-memory query LRU.
+    """
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embeddings(texts).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return get_query_embedding(text)
+
+def iter_chunks(pages: Iterable[str], chunk_size: int = 1000, overlap: int = 200) -> Iterator[str]:
+    """
+    Split text into overlapping fixed-size character chunks, streaming over pages.
+    
+    Produces the same chunks as slicing the pages joined by spaces, but only
+    keeps the text of the chunk being built in memory. Ingestion uses the
+    structure-aware chunker in chunk_utils; this slicer is kept as the
+    baseline it is benchmarked against.
+    
+    Args:
+        pages: Page texts (or a single full text) in reading order
+        chunk_size: Maximum number of characters per chunk
+        overlap: Number of characters shared by consecutive chunks
         
-        # Connect to the index
-        index = pc.Index(index_name)
-        logger.info(f"Connected to Pinecone index: {index_name}")
+    Yields:
+        Non-empty chunks
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    for i, page in enumerate(pages):
+        buffer += (" " + page) if i > 0 else page
+        while len(buffer) >= chunk_size:
+            chunk = buffer[:chunk_size]
+            if len(chunk.strip()) > 0:  # Skip empty chunks
+                yield chunk
+            buffer = buffer[step:]
+    
+    # Tail chunks shorter than chunk_size
+    while buffer:
+        if len(buffer.strip()) > 0:
+            yield buffer[:chunk_size]
+        buffer = buffer[step:]
+
+def split_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """
+    Split text into overlapping fixed-size character chunks.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum number of characters per chunk
+        overlap: Number of characters shared by consecutive chunks
         
-        all_vectors = []  # Store all vectors to be upserted
+    Returns:
+        List of non-empty chunks
+    """
+    return list(iter_chunks([text], chunk_size, overlap))
 
-        for document in documents:
-            document_id = document.get("id", "")
-            
-            if not document_id:
-                logger.warning("Document missing ID field, skipping")
-                continue
-            
-            logger.info(f"Processing document: {document_id}")
-            
-            # Get metadata fields
-            title_text = document.get("title", "")
-            authors_text = document.get("authors", "")
-            orgs_text = document.get("organizations", "")
-            emails_text = document.get("emails", "")
-            content_text = document.get("content", "")  # This is typically the abstract
+def entry_hash(text: str, metadata: Dict[str, Any]) -> str:
+    """
+    Hash what determines a stored vector: the model, the embedded text and its metadata.
+    
+    Args:
+        text: Text that is embedded
+        metadata: Metadata stored with the vector (any "content_hash" key is ignored)
+        
+    Returns:
+        Hex SHA-256 digest
+    """
+    fields = {key: value for key, value in metadata.items() if key != "content_hash"}
+    payload = json.dumps([EMBEDDING_MODEL_NAME, text, fields], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def iter_vector_entries(documents: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Lazily produce the (vector id, text, metadata) entries for the metadata
+    fields and content chunks of each document.
+    
+    A document may provide its content as "pages", an iterable of page texts
+    (for example a generator reading the PDF page by page), instead of
+    "full_content".
+    
+    Every entry's metadata carries a "content_hash" (see entry_hash) used for
+    incremental re-indexing.
+    
+    Args:
+        documents: Document dictionaries containing extracted metadata
+        
+    Yields:
+        (vector id, text to embed, metadata) tuples
+    """
+    for vector_id, text, metadata in _iter_document_entries(documents):
+        metadata["content_hash"] = entry_hash(text, metadata)
+        yield vector_id, text, metadata
+
+def _iter_document_entries(documents: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    for document in documents:
+        document_id = document.get("id", "")
+        
+        if not document_id:
+            logger.warning("Document missing ID field, skipping")
+            continue
+        
+        logger.info(f"Processing document: {document_id}")
+        
+        # Metadata fields
+        for field in ["title", "authors", "organizations", "emails"]:
+            text = document.get(field, "")
+            yield (f"{document_id}_{field}", text,
+                   {"type": field, "document_id": document_id, "text": text})
+        
+        # Process full document content through chunking
+        pages = document.get("pages")
+        if pages is None:
             full_content = document.get("full_content", "")
-            
-            # Get embeddings for metadata fields
-            title_embedding = get_embedding(title_text)
-            author_embedding = get_embedding(authors_text)
-            org_embedding = get_embedding(orgs_text)
-            email_embedding = get_embedding(emails_text)
-            
-            # Add metadata vectors
-            all_vectors.extend([
-                (f"{document_id}_title", title_embedding, 
-                {"type": "title", "document_id": document_id, "text": title_text}),
-                
-                (f"{document_id}_authors", author_embedding, 
-                {"type": "authors", "document_id": document_id, "text": authors_text}),
-                
-                (f"{document_id}_organizations", org_embedding, 
-                {"type": "organizations", "document_id": document_id, "text": orgs_text}),
-                
-                (f"{document_id}_emails", email_embedding, 
-                {"type": "emails", "document_id": document_id, "text": emails_text}),
-            ])
-            
-            # Process full document content through chunking
             if not full_content or full_content.strip() == "":
                 logger.warning(f"Document {document_id} has empty content, skipping chunking")
                 continue
-                
-            # Split the content into chunks - simple method for now
-            chunks = []
-            chunk_size = 1000
-            overlap = 200
-            
-            for i in range(0, len(full_content), chunk_size - overlap):
-                chunk = full_content[i:i + chunk_size]
-                if len(chunk.strip()) > 0:  # Skip empty chunks
-                    chunks.append(chunk)
-            
-            logger.info(f"Document split into {len(chunks)} chunks")
-            
-            # Generate embeddings for each chunk
-            for i, chunk in enumerate(chunks):
-                chunk_embedding = get_embedding(chunk)
-                all_vectors.append(
-                    (f"{document_id}_chunk_{i}", chunk_embedding, 
-                    {"type": "chunk", "document_id": document_id, "chunk_id": i, "text": chunk})
-                )
+            pages = [full_content]
+        
+        # Section- and sentence-aligned chunks with their page numbers
+        chunk_count = 0
+        for i, chunk in enumerate(iter_structured_chunks(pages)):
+            chunk_count += 1
+            yield (f"{document_id}_chunk_{i}", chunk.text,
+                   {"type": "chunk", "document_id": document_id, "chunk_id": i, "text": chunk.text,
+                    **chunk.metadata()})
+        logger.info(f"Document split into {chunk_count} chunks")
+
+def iter_changed_entries(documents: Iterable[Dict[str, Any]], store: VectorStore,
+                         stats: Optional[Dict[str, int]] = None,
+                         on_document: Optional[Callable[[Dict[str, Any], List[Tuple[str, str, Dict[str, Any]]]], None]] = None
+                         ) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Diff documents against the vector store and yield only the entries that need upserting.
+    
+    Entries whose content hash matches the stored vector are skipped, and
+    passed to `store.backfill` for secondary indexes that miss them. Vectors
+    of a document that no longer correspond to any entry (e.g. chunks past
+    the new chunk count) are deleted.
+    
+    Every ingestion path goes through here, so the "chunk" and "diff" stages
+    are timed here, along with the "parse" and "extract" seconds measured
+    by extract_documents in worker processes.
+    
+    Args:
+        documents: Document dictionaries containing extracted metadata
+        store: VectorStore holding the previous version of the documents
+        stats: Optional dictionary whose "changed", "skipped" and "deleted" counters are incremented
+        on_document: Called with each document and all of its entries, before they are diffed
         
-        # Batch upsert to Pinecone
-        if all_vectors:
-            from tqdm.auto import tqdm
-            batch_size = 100
-            total_vectors = len(all_vectors)
+    Yields:
+        (vector id, text to embed, metadata) tuples of new or changed entries
+    """
+    stats = stats if stats is not None else {}
+    for key in ("changed", "skipped", "deleted"):
+        stats.setdefault(key, 0)
+    
+    for document in documents:
+        for stage, seconds in document.get("stage_seconds", {}).items():
+            observe_stage("ingest", stage, seconds)
+        # One document's entries at a time, to compare them with the stored ones
+        with timed("ingest", "chunk"):
+            entries = list(iter_vector_entries([document]))
+        if not entries:
+            continue
+        document_id = entries[0][2]["document_id"]
+        if on_document:
+            on_document(document, entries)
+        
+        with timed("ingest", "diff"):
+            stored = store.content_hashes(document_id)
+            entry_ids = {vector_id for vector_id, _, _ in entries}
+            orphans = [vector_id for vector_id in stored if vector_id not in entry_ids]
+            if orphans:
+                store.delete(ids=orphans)
+                stats["deleted"] += len(orphans)
             
-            for i in tqdm(range(0, total_vectors, batch_size), desc="Batches"):
-                batch = all_vectors[i:min(i+batch_size, total_vectors)]
-                index.upsert(vectors=batch)
+            changed, unchanged = [], []
+            for entry in entries:
+                if stored.get(entry[0]) == entry[2]["content_hash"]:
+                    unchanged.append(entry)
+                else:
+                    changed.append(entry)
+            if unchanged:
+                store.backfill(unchanged)
+        stats["changed"] += len(changed)
+        stats["skipped"] += len(unchanged)
+        yield from changed
+
+def build_vector_entries(documents: List[Dict[str, Any]]) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Build the (vector id, text, metadata) entries for the metadata fields and
+    content chunks of each document.
+    
+    Args:
+        documents: List of document dictionaries containing extracted metadata
+        
+    Returns:
+        List of (vector id, text to embed, metadata) tuples
+    """
+    return list(iter_vector_entries(documents))
+
+def embed_documents(documents: List[Dict[str, Any]], batch_size: Optional[int] = None) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+    """
+    Embed the metadata fields and content chunks of documents.
+    
+    All metadata fields and chunks of all documents are embedded together in
+    mini-batches of `batch_size` texts.
+    
+    Args:
+        documents: List of document dictionaries containing extracted metadata
+        batch_size: Number of texts per embedding batch (default: EMBEDDING_BATCH_SIZE)
+        
+    Returns:
+        List of (vector id, embedding, metadata) tuples ready for upsert
+    """
+    return embed_entries(build_vector_entries(documents), batch_size=batch_size)
+
+def embed_entries(entries: List[Tuple[str, str, Dict[str, Any]]], batch_size: Optional[int] = None) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+    """
+    Embed (vector id, text, metadata) entries in batched encode calls.
+    
+    Args:
+        entries: Entries from iter_vector_entries or iter_changed_entries
+        batch_size: Number of texts per embedding batch (default: EMBEDDING_BATCH_SIZE)
+        
+    Returns:
+        List of (vector id, embedding, metadata) tuples ready for upsert
+    """
+    if not entries:
+        return []
+    
+    # Embed every metadata field and chunk in batched encode calls
+    with timed("ingest", "embed"):
+        embeddings = get_embeddings([text for _, text, _ in entries], batch_size=batch_size)
+    return [
+        (vector_id, embedding.tolist(), metadata)
+        for (vector_id, _, metadata), embedding in zip(entries, embeddings)
+    ]
+
+def upsert_vectors(store: VectorStore, vectors: List[Tuple[str, List[float], Dict[str, Any]]], batch_size: int = 100) -> int:
+    """
+    Upsert vectors into a vector store in fixed-size batches and persist it.
+    
+    Args:
+        store: VectorStore to write to
+        vectors: List of (vector id, embedding, metadata) tuples
+        batch_size: Number of vectors per upsert call
+        
+    Returns:
+        Number of vectors upserted
+    """
+    from tqdm.auto import tqdm
+    total_vectors = len(vectors)
+    
+    for i in tqdm(range(0, total_vectors, batch_size), desc="Batches"):
+        batch = vectors[i:min(i+batch_size, total_vectors)]
+        with timed("ingest", "upsert"):
+            store.upsert(batch)
+        VECTORS_UPSERTED.inc(len(batch))
+    with timed("ingest", "persist"):
+        store.persist()
+    
+    return total_vectors
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Return the peak resident set size (memory high-water mark).
+    
+    Args:
+        children: Report the largest terminated child process instead of this process
+        
+    Returns:
+        Peak RSS in MiB, or None where the resource module is unavailable
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+_PIPELINE_DONE = object()
+
+class _PipelineError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+def _put(stage_queue: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    """Put an item on a bounded queue, giving up if the pipeline was stopped."""
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def stream_embeddings_to_store(entries: Iterable[Tuple[str, str, Dict[str, Any]]], store: VectorStore,
+                               batch_size: Optional[int] = None, upsert_batch_size: int = 100,
+                               embed_window: int = 512, queue_size: int = 4,
+                               on_upserted: Optional[Callable[[List[Tuple[str, str, Dict[str, Any]]]], None]] = None) -> int:
+    """
+    Embed and upsert a stream of entries with bounded memory.
+    
+    The pipeline has three stages connected by bounded queues: the calling
+    iterator produces entries (e.g. pages -> chunks), a worker thread embeds
+    them `embed_window` at a time, and the calling thread upserts the vectors
+    in batches of `upsert_batch_size`. At most `queue_size` windows wait
+    between two stages, so memory stays flat regardless of corpus size.
+    
+    When `entries` comes from iter_changed_entries, the producer thread reads
+    and deletes vectors of `store` while the calling thread upserts; stores
+    are thread-safe (see VectorStore), and as long as each document appears
+    once in the stream the two threads never touch the same IDs: orphans
+    are by definition not among the upserted entries.
+    
+    Args:
+        entries: (vector id, text, metadata) tuples, typically from iter_vector_entries
+        store: VectorStore to write to
+        batch_size: Number of texts per embedding call (default: EMBEDDING_BATCH_SIZE)
+        upsert_batch_size: Number of vectors per upsert call
+        embed_window: Number of entries embedded together
+        queue_size: Maximum number of windows buffered between stages
+        on_upserted: Called with the entries of each upserted batch, in order
+        
+    Returns:
+        Number of vectors upserted
+    """
+    stop = threading.Event()
+    to_embed: queue.Queue = queue.Queue(maxsize=queue_size)
+    to_upsert: queue.Queue = queue.Queue(maxsize=queue_size)
+    
+    def produce() -> None:
+        try:
+            window = []
+            for entry in entries:
+                window.append(entry)
+                if len(window) >= embed_window:
+                    if not _put(to_embed, window, stop):
+                        return
+                    window = []
+            if window:
+                _put(to_embed, window, stop)
+            _put(to_embed, _PIPELINE_DONE, stop)
+        except BaseException as e:
+            _put(to_embed, _PipelineError(e), stop)
+    
+    def embed() -> None:
+        while not stop.is_set():
+            try:
+                item = to_embed.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _PIPELINE_DONE or isinstance(item, _PipelineError):
+                _put(to_upsert, item, stop)
+                return
+            try:
+                with timed("ingest", "embed"):
+                    embeddings = get_embeddings([text for _, text, _ in item], batch_size=batch_size)
+            except BaseException as e:
+                _put(to_upsert, _PipelineError(e), stop)
+                return
+            if not _put(to_upsert, (item, embeddings), stop):
+                return
+    
+    workers = [
+        threading.Thread(target=produce, name="ingest-produce", daemon=True),
+        threading.Thread(target=embed, name="ingest-embed", daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+    
+    total_vectors = 0
+    try:
+        while True:
+            item = to_upsert.get()
+            if item is _PIPELINE_DONE:
+                break
+            if isinstance(item, _PipelineError):
+                raise item.error
             
-            logger.info(f"Successfully stored {total_vectors} vectors in Pinecone")
-            return index
-        else:
+            window, embeddings = item
+            for start in range(0, len(window), upsert_batch_size):
+                batch = window[start:start + upsert_batch_size]
+                with timed("ingest", "upsert"):
+                    store.upsert([
+                        (vector_id, embedding.tolist(), metadata)
+                        for (vector_id, _, metadata), embedding in zip(batch, embeddings[start:start + upsert_batch_size])
+                    ])
+                VECTORS_UPSERTED.inc(len(batch))
+                total_vectors += len(batch)
+                if on_upserted:
+                    on_upserted(batch)
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+    
+    return total_vectors
+
+def process_and_store_embeddings(documents: List[Dict[str, Any]], batch_size: Optional[int] = None) -> Optional[VectorStore]:
+    """
+    Process documents and store embeddings in the configured vector store.
+    
+    Entries are streamed through stream_embeddings_to_store, so vectors are
+    never accumulated for all documents at once. Re-processed documents are
+    diffed against the store: unchanged entries are skipped and orphaned
+    vectors deleted.
+    
+    Args:
+        documents: List of document dictionaries containing extracted metadata
+        batch_size: Number of texts per embedding batch (default: EMBEDDING_BATCH_SIZE)
+        
+    Returns:
+        VectorStore the vectors were written to
+    """
+    try:
+        # Connect to the vector store, creating the index if it doesn't exist
+        store = get_vector_store(create=True)
+        
+        stats = {}
+        records = []
+        total_vectors = stream_embeddings_to_store(
+            iter_changed_entries(documents, store, stats,
+                                 on_document=lambda document, entries: records.append(document_record(document, entries))),
+            store,
+            batch_size=batch_size
+        )
+        with timed("ingest", "persist"):
+            store.persist()
+        get_document_registry().upsert_many(records)
+        if not total_vectors and not stats["skipped"]:
             logger.warning("No vectors created for upsert")
-            return index
+            return store
+        
+        logger.info(f"Successfully stored {total_vectors} vectors, skipped {stats['skipped']} unchanged, "
+                    f"deleted {stats['deleted']} orphaned (peak RSS {peak_rss_mb() or 0:.0f} MiB)")
+        embedding_cache = get_embedding_cache()
+        if embedding_cache:
+            logger.info(f"Embedding cache stats: {embedding_cache.stats()}")
+        return store
     
     except Exception as e:
         logger.error(f"Error in processing and storing embeddings: {str(e)}")
-        return None
\ No newline at end of file
+        return None
@@ -1,136 +1,472 @@
-from langchain_community.document_loaders import PyPDFLoader
-import spacy
-import pdfplumber
+from langchain_core.documents import Document
 import fitz  # PyMuPDF
 import re
 import os
-import argparse
-import json
-from typing import Tuple, Dict, List, Any, Set
+import time
+import logging
+from typing import Tuple, Dict, List, Any, Iterator, Union, Optional
+from model_utils import register_model, get_model
 
-# Load spaCy NER model
-nlp = spacy.load('en_core_web_sm')
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
-def extract_bold_text_from_first_lines(file_path: str, num_lines: int = 3) -> List[str]:
+# Fall back to spaCy named entities when no organization matches the patterns.
+# Off by default: spaCy and its model are optional dependencies.
+SPACY_NER = os.getenv("SPACY_NER", "false").lower() in ("1", "true", "yes")
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "16"))
+# Pipeline components that named entity recognition does not need
+SPACY_DISABLED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+
+def _load_nlp():
+    import spacy
+    return spacy.load(SPACY_MODEL, exclude=SPACY_DISABLED_PIPES)
+
+# Loaded on first use by get_nlp
+register_model("spacy", _load_nlp)
+_nlp_failed = False
+
+# First-page lines scanned for the title, author, affiliation and email blocks
+LAYOUT_MAX_LINES = 40
+# Lines that start the body of the paper and end the header
+HEADER_END_PATTERN = re.compile(r'^(?:\d\.?\s*)?(?:abstract|introduction|keywords|index terms)\b', re.IGNORECASE)
+# Running heads, venue and preprint lines, which are never the title
+NON_TITLE_PATTERN = re.compile(
+    r'arxiv|preprint|proceedings|journal|conference|workshop|under review|copyright|doi|https?://|@',
+    re.IGNORECASE
+)
+# Words marking an affiliation
+AFFILIATION_PATTERN = re.compile(
+    r'Universit|Institut|College|Laborator|\bLabs?\b|School|Department|\bDept\b|Cent(?:er|re)\b|Faculty|'
+    r'Academy|Hospital|Research|Corporation|\bInc\b|\bLtd\b|GmbH|'
+    r'Microsoft|Google|Apple|Amazon|Facebook|IBM|Intel|NVIDIA|DeepMind|OpenAI'
+)
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+# Grouped addresses such as {alice,bob}@example.org
+BRACE_EMAIL_PATTERN = re.compile(
+    r'\{([A-Za-z0-9._%+-]+(?:\s*,\s*[A-Za-z0-9._%+-]+)*)\}@([A-Za-z0-9.-]+\.[A-Za-z]{2,})'
+)
+# Separators between the names of an author line
+AUTHOR_SEPARATOR_PATTERN = re.compile(r'\s*(?:,|;|&|\band\b|\s{3,})\s*')
+AFFILIATION_SEPARATOR_PATTERN = re.compile(r'\s*;\s*|\s{3,}')
+# Affiliation markers written as plain text ("1Stanford University", "*Google")
+AFFILIATION_MARKER_PATTERN = re.compile(r'(?:^|\s)[\d\*\u2020\u2021\u00a7\u00b6]+(?=[A-Z])')
+# Footnote markers trailing (or leading) an author name
+MARKER_CHARS = "0123456789*+#\u00b7\u2020\u2021\u00a7\u00b6\u2016\u2217\u22c6 "
+# Membership suffixes of author lines ("Wangmeng Zuo, Senior Member, IEEE")
+NON_NAME_PATTERN = re.compile(r'\b(?:(?:Senior |Student )?Member|Fellow|Student|IEEE|ACM|Corresponding|Equal)\b')
+# Lowercase words allowed inside a person name
+NAME_PARTICLES = {"van", "von", "de", "da", "del", "der", "di", "du", "la", "le", "dos", "bin"}
+# PyMuPDF span flags
+SUPERSCRIPT_FLAG = 1
+BOLD_FLAG = 16
+
+class ParsedDocument:
+    """
+    Result of a single PyMuPDF pass over a PDF.
+    
+    Holds the text of every page plus the first-page layout (lines of spans
+    with font name, flags, size and position), which is all the title, author
+    and organization extractors need, so the file is only opened once.
+    """
+    
+    def __init__(self, file_path: str, page_texts: List[str], first_page_lines: List[List[Dict[str, Any]]]):
+        """
+        Args:
+            file_path: Path to the PDF file
+            page_texts: Plain text of each page
+            first_page_lines: Lines of the first page, each a list of span dictionaries
+        """
+        self.file_path = file_path
+        self.page_texts = page_texts
+        self.first_page_lines = first_page_lines
+    
+    @property
+    def page_count(self) -> int:
+        return len(self.page_texts)
+    
+    @property
+    def text(self) -> str:
+        """Full text of the document, pages joined by spaces."""
+        return " ".join(self.page_texts)
+    
+    @property
+    def first_page_text(self) -> str:
+        return self.page_texts[0] if self.page_texts else ""
+    
+    def to_documents(self) -> List[Document]:
+        """
+        Convert the pages to LangChain documents, one per page.
+        
+        Returns:
+            List of Documents with source and page metadata
+        """
+        return [
+            Document(page_content=page_text, metadata={"source": self.file_path, "page": i})
+            for i, page_text in enumerate(self.page_texts)
+        ]
+
+def get_nlp():
     """
-    Extract bold text specifically from the first few lines of the first page.
+    Load the spaCy NER pipeline on first use.
+    
+    Only the components needed for named entities are loaded.
+    
+    Returns:
+        spaCy Language object, or None if spaCy or the model is not installed
+    """
+    global _nlp_failed
+    if _nlp_failed:
+        return None
+    try:
+        return get_model("spacy")
+    except (ImportError, OSError) as e:
+        _nlp_failed = True
+        logger.warning(f"spaCy NER unavailable, skipping entity extraction: {str(e)}")
+        return None
+
+def extract_entity_organizations(texts: List[str], batch_size: int = SPACY_BATCH_SIZE) -> List[List[str]]:
+    """
+    Find organization entities in several texts with one batched spaCy pass.
+    
+    Args:
+        texts: Texts to analyse, typically first pages of papers
+        batch_size: Number of texts per spaCy batch
+        
+    Returns:
+        List of organization names for each text (empty lists if spaCy is unavailable)
+    """
+    nlp = get_nlp()
+    if nlp is None or not texts:
+        return [[] for _ in texts]
+    
+    results = []
+    for doc in nlp.pipe(texts, batch_size=batch_size):
+        organizations = []
+        for ent in doc.ents:
+            name = " ".join(ent.text.split())
+            if ent.label_ == "ORG" and len(name) > 3 and name not in organizations:
+                organizations.append(name)
+        results.append(organizations)
+    return results
+
+def parse_pdf(file_path: str) -> ParsedDocument:
+    """
+    Open a PDF once and collect page texts and first-page layout.
     
     Args:
         file_path: Path to the PDF file
-        num_lines: Number of lines to check (default: 3)
         
     Returns:
-        List of strings containing bold text
+        ParsedDocument for the file
     """
-    bold_texts = []
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"PDF file not found: {file_path}")
     
-    try:
-        # Use PyMuPDF (fitz) for more robust font detection
-        doc = fitz.open(file_path)
-        if len(doc) > 0:
-            page = doc[0]  # First page
-            
-            # Get text blocks with line details
-            blocks = page.get_text("dict")["blocks"]
+    page_texts = []
+    first_page_lines = []
+    
+    with fitz.open(file_path) as doc:
+        for page_number, page in enumerate(doc):
+            if page_number > 0:
+                page_texts.append(page.get_text("text"))
+                continue
             
-            line_count = 0
-            for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        # Process only the first N lines
-                        if line_count >= num_lines:
-                            break
-                            
-                        bold_in_line = []
-                        for span in line["spans"]:
-                            # Check for bold text:
-                            # 1. Font name contains "Bold"
-                            # 2. Font has flags indicating bold (2^4 = 16 is bold bit)
-                            is_bold = ("Bold" in span["font"] or 
-                                       "bold" in span["font"].lower() or 
-                                       (span["flags"] & 16 != 0))
-                            
-                            if is_bold:
-                                bold_in_line.append(span["text"])
-                            
-                        if bold_in_line:
-                            bold_texts.append(" ".join(bold_in_line))
-                            
-                        line_count += 1
-                        
-                    if line_count >= num_lines:
-                        break
-                        
+            # First page: keep the span layout and build the text from it
+            line_texts = []
+            for block in page.get_text("dict")["blocks"]:
+                for line in block.get("lines", []):
+                    spans = [
+                        {
+                            "text": span["text"],
+                            "font": span["font"],
+                            "flags": span["flags"],
+                            "size": span["size"],
+                            "bbox": tuple(span["bbox"]),
+                        }
+                        for span in line["spans"]
+                    ]
+                    first_page_lines.append(spans)
+                    line_texts.append("".join(span["text"] for span in spans))
+            page_texts.append("\n".join(line_texts))
+    
+    return ParsedDocument(file_path, page_texts, first_page_lines)
+
+def _ensure_parsed(document: Union[str, ParsedDocument]) -> ParsedDocument:
+    """Accept either a ParsedDocument or a path, parsing the path if needed."""
+    if isinstance(document, ParsedDocument):
+        return document
+    return parse_pdf(document)
+
+def _is_bold(span: Dict[str, Any]) -> bool:
+    """Check the bold flag (2^4) and the font name, which some PDFs only mark."""
+    return bool(span["flags"] & BOLD_FLAG) or "bold" in span["font"].lower()
+
+def _first_page_rows(parsed: ParsedDocument) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yield the first-page lines of spans, rejoining lines PyMuPDF split on one row.
+    
+    A raised superscript often starts a new line ("Smith" / "¹, Zhang"), so a
+    line whose vertical middle falls within the previous line, to its right,
+    continues it; a wide gap becomes a block separator. Without layout, each
+    text line becomes one plain span.
+    """
+    if not parsed.first_page_lines:
+        for line in parsed.first_page_text.split("\n", LAYOUT_MAX_LINES)[:LAYOUT_MAX_LINES]:
+            yield [{"text": line, "font": "", "flags": 0, "size": 0.0, "bbox": (0.0, 0.0, 0.0, 0.0)}]
+        return
+    
+    row: List[Dict[str, Any]] = []
+    for spans in parsed.first_page_lines:
+        if not spans:
+            continue
+        if row:
+            left, top, right, bottom = row[-1]["bbox"]
+            x0, y0, _, y1 = spans[0]["bbox"]
+            if top < (y0 + y1) / 2 < bottom and x0 > left:
+                # Side-by-side header columns stay apart as separate blocks
+                if x0 - right > spans[0]["size"]:
+                    row.append({"text": "   ", "font": "", "flags": 0, "size": 0.0, "bbox": (right, top, x0, bottom)})
+                row.extend(spans)
+                continue
+            yield row
+        row = list(spans)
+    if row:
+        yield row
+
+def _header_lines(parsed: ParsedDocument) -> List[Dict[str, Any]]:
+    """
+    Walk the first-page spans once and describe each line of the paper header.
+    
+    Superscript spans (flagged by PyMuPDF, or small marker-only spans) are
+    dropped from the plain text and become separators in the split text, so
+    "Smith¹, Zhang²" and "¹MIT ²Google" split into their parts.
+    
+    Args:
+        parsed: Parsed PDF
+        
+    Returns:
+        Lines up to the abstract, each with its text, plain text, split text,
+        body font size, bold flag, bold text and leading marker flag
+    """
+    lines = []
+    for spans in _first_page_rows(parsed):
+        text = "".join(span["text"] for span in spans).strip()
+        if not text:
+            continue
+        if HEADER_END_PATTERN.match(text) or len(lines) >= LAYOUT_MAX_LINES:
+            break
+        
+        body_size = max((span["size"] for span in spans
+                         if span["text"].strip() and not span["flags"] & SUPERSCRIPT_FLAG), default=0.0)
+        plain, split, bold = [], [], []
+        chars = bold_chars = 0
+        leading_marker = False
+        for span in spans:
+            span_text = span["text"]
+            stripped = span_text.strip()
+            superscript = stripped and (span["flags"] & SUPERSCRIPT_FLAG or
+                                        (span["size"] < 0.8 * body_size and not stripped.strip(MARKER_CHARS + ",")))
+            if superscript:
+                leading_marker = leading_marker or not "".join(plain).strip()
+                split.append(" ; ")
+                continue
+            plain.append(span_text)
+            split.append(span_text)
+            if stripped:
+                chars += len(stripped)
+                if _is_bold(span):
+                    bold_chars += len(stripped)
+                    bold.append(span_text)
+        
+        lines.append({
+            "text": text,
+            "plain": " ".join("".join(plain).split()),
+            "split": "".join(split),
+            "size": body_size,
+            "bold": chars > 0 and 2 * bold_chars >= chars,
+            "bold_text": " ".join(bold),
+            "leading_marker": leading_marker,
+        })
+    return lines
+
+def _find_title(lines: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Locate the title lines of the header.
+    
+    The title is the run of lines set in the largest font. Without size
+    differences (or without layout) it is the first bold line, else the
+    first substantial line, as in plain-text extraction.
+    
+    Returns:
+        (first, last + 1) line indices of the title
+    """
+    candidates = [
+        i for i, line in enumerate(lines)
+        if len(line["plain"]) > 3 and not line["leading_marker"] and not NON_TITLE_PATTERN.search(line["text"])
+    ]
+    if not candidates:
+        return (0, 1) if lines else (0, 0)
+    
+    largest = max(lines[i]["size"] for i in candidates)
+    if largest - min(lines[i]["size"] for i in candidates) > 0.5:
+        start = next(i for i in candidates if lines[i]["size"] >= largest - 0.5)
+        end = start + 1
+        # Titles often wrap over several lines of the same size
+        while end < len(lines) and lines[end]["size"] >= largest - 0.5 and not lines[end]["leading_marker"]:
+            end += 1
+        return start, end
+    
+    substantial = [i for i in candidates if len(lines[i]["plain"]) > 10 and not AFFILIATION_PATTERN.search(lines[i]["text"])]
+    for i in substantial:
+        if lines[i]["bold"]:
+            return i, i + 1
+    start = substantial[0] if substantial else candidates[0]
+    return start, start + 1
+
+def _is_person_name(text: str) -> bool:
+    """Check that text looks like a person name: 2-4 capitalized words, plus name particles."""
+    words = [word for word in text.split() if word not in NAME_PARTICLES]
+    if not 2 <= len(words) <= 4 or AFFILIATION_PATTERN.search(text) or NON_NAME_PATTERN.search(text):
+        return False
+    for word in words:
+        letters = word.rstrip(".").replace("-", "").replace("'", "")
+        if not (letters and letters[0].isupper() and letters.isalpha()):
+            return False
+    return True
+
+def _split_names(text: str) -> Tuple[List[str], int]:
+    """Split an author line into names, returning (names, number of non-empty segments)."""
+    segments = [segment.strip(MARKER_CHARS) for segment in AUTHOR_SEPARATOR_PATTERN.split(text)]
+    segments = [
+        segment if segment.isupper() else _split_camel_case(segment)
+        for segment in segments if segment and not NON_NAME_PATTERN.fullmatch(segment)
+    ]
+    return [segment for segment in segments if _is_person_name(segment)], len(segments)
+
+def _split_affiliations(text: str) -> List[str]:
+    """Split an affiliation line into organizations, keeping the institution parts of each address."""
+    organizations = []
+    for affiliation in AFFILIATION_SEPARATOR_PATTERN.split(AFFILIATION_MARKER_PATTERN.sub(";", text)):
+        affiliation = EMAIL_PATTERN.sub("", affiliation).strip(MARKER_CHARS + ",.")
+        if not affiliation:
+            continue
+        parts = [part.strip(MARKER_CHARS + ".") for part in affiliation.split(",")]
+        parts = [part for part in parts if part]
+        # "Department of Physics, Stanford University, CA, USA" keeps the first two
+        organizations.extend([part for part in parts if AFFILIATION_PATTERN.search(part)] or parts[:1])
+    return organizations
+
+def find_emails(text: str) -> List[str]:
+    """
+    Find email addresses, expanding grouped ones such as {alice,bob}@example.org.
+    
+    Args:
+        text: Text to search
+        
+    Returns:
+        List of email addresses in order of appearance
+    """
+    emails = EMAIL_PATTERN.findall(text)
+    for usernames, domain in BRACE_EMAIL_PATTERN.findall(text):
+        for username in usernames.split(','):
+            emails.append(f"{username.strip()}@{domain}")
+    return emails
+
+def extract_layout_metadata(document: Union[str, ParsedDocument]) -> Dict[str, Any]:
+    """
+    Classify the first-page header of a paper into title, author, affiliation and email blocks.
+    
+    The spans are walked once. The title is found from font sizes and bold
+    flags, then each following line is classified: lines with addresses are
+    email blocks, lines made of person names are author blocks (superscript
+    markers split the names), and lines with institution words or a leading
+    marker are affiliation blocks. Scanning stops at the abstract, or after
+    three unclassified lines once authors or affiliations were found.
     
+    Args:
+        document: ParsedDocument, or path to the PDF file
+        
+    Returns:
+        Dictionary with title, authors, organizations, emails and bold_text
+        (bold text of the first three lines)
+    """
+    metadata = {"title": "", "authors": [], "organizations": [], "emails": [], "bold_text": []}
+    try:
+        lines = _header_lines(_ensure_parsed(document))
+        if not lines:
+            logger.warning("Could not extract text from first page")
+            return metadata
+        
+        start, end = _find_title(lines)
+        title_size = lines[start]["size"]
+        # Lines as large as the title are only authors when the font sizes tell nothing apart
+        sized = any(line["size"] < title_size for line in lines)
+        metadata["title"] = " ".join(line["plain"] for line in lines[start:end])
+        metadata["bold_text"] = [line["bold_text"] for line in lines[:3] if line["bold_text"]]
+        
+        authors, organizations, emails = [], [], []
+        unclassified = 0
+        for line in lines[end:]:
+            text = line["text"]
+            found = find_emails(text)
+            if found:
+                emails.extend(found)
+                continue
+            # A leading marker ("¹Stanford University") makes an affiliation even if it reads like a name
+            if line["leading_marker"] or AFFILIATION_MARKER_PATTERN.match(text):
+                organizations.extend(_split_affiliations(line["split"]))
+                unclassified = 0
+                continue
+            names, segments = _split_names(line["split"])
+            if names and 2 * len(names) >= segments and (not sized or line["size"] < title_size):
+                authors.extend(names)
+            elif AFFILIATION_PATTERN.search(text):
+                organizations.extend(_split_affiliations(line["split"]))
+            elif authors or organizations:
+                unclassified += 1
+                if unclassified >= 3:
+                    break
+                continue
+            unclassified = 0
+        
+        metadata["authors"] = list(dict.fromkeys(authors))
+        metadata["organizations"] = list(dict.fromkeys(organizations))
+        metadata["emails"] = list(dict.fromkeys(emails))
     except Exception as e:
-        print(f"Error extracting bold text: {str(e)}")
+        logger.error(f"Error extracting layout metadata: {str(e)}")
     
-    return bold_texts
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Layout metadata: {metadata}")
+    return metadata
 
-def parse_and_extract(file_path: str) -> Tuple[Dict[str, Any], List]:
+def parse_and_extract(document: Union[str, ParsedDocument], include_documents: bool = True) -> Tuple[Dict[str, Any], List]:
     """
     Parse and extract key information from a PDF.
     
     Args:
-        file_path: Path to the PDF file
+        document: ParsedDocument, or path to the PDF file
+        include_documents: Build the per-page LangChain documents (skip them to save memory)
         
     Returns:
         Tuple containing extracted info dictionary and document chunks
     """
-    # Validate file exists
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"PDF file not found: {file_path}")
-    
-    # Load the PDF document
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
+    # Open the PDF once, unless the caller already did
+    parsed = _ensure_parsed(document)
+    documents = parsed.to_documents() if include_documents else []
     
     # Extract text from the document
-    text = " ".join([doc.page_content for doc in documents])
-    
-    # Try to extract bold text from the first 3 lines to identify the title
-    bold_texts = extract_bold_text_from_first_lines(file_path, num_lines=3)
-    
-    # Extract title more intelligently
-    title = ""
-    
-    # First try: Look for bold text in the first 3 lines
-    if bold_texts:
-        # Check if any bold text looks like a title (substantial length, no metadata markers)
-        for bold_text in bold_texts:
-            if len(bold_text) > 10 and not any(x in bold_text.lower() for x in 
-                                             ['abstract', 'introduction', 'university', '@', 'journal']):
-                title = bold_text
-                break
-    
-    # Second try: Use the first few lines approach (fallback)
-    if not title and documents and len(documents) > 0:
-        first_page_lines = documents[0].page_content.split('\n')
-        # Usually title is in the first 5 lines and doesn't have common metadata markers
-        for line in first_page_lines[:5]:
-            line = line.strip()
-            if line and len(line) > 10 and not any(x in line.lower() for x in 
-                                                ['abstract', 'introduction', 'university', '@']):
-                title = line
-                break
-    
-    # Last resort fallback
-    if not title and len(first_page_lines) > 0:
-        title = first_page_lines[0]  # Fallback to first line
-    
-    # Extract emails using more robust regex
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    emails = re.findall(email_pattern, text)
-    
-    # Also look for email patterns in braces or brackets
-    brace_email_pattern = r'\{([A-Za-z0-9._%+-]+(?:,[A-Za-z0-9._%+-]+)*)\}@([A-Za-z0-9.-]+\.[A-Z|a-z]{2,})'
-    brace_matches = re.findall(brace_email_pattern, text, re.IGNORECASE)
-    for usernames, domain in brace_matches:
-        for username in usernames.split(','):
-            emails.append(f"{username.strip()}@{domain}")
+    text = parsed.text
     
-    # Use spaCy for content extraction and summary
-    doc = nlp(text[:50000])  # Limit to first 50K chars for processing speed
+    # Title, authors, affiliations and header emails from one pass over the first-page spans
+    layout = extract_layout_metadata(parsed)
+    title = layout["title"]
+    if not title and parsed.first_page_text:
+        title = parsed.first_page_text.split('\n')[0]  # Fallback to first line
+    
+    # Header emails first, then addresses found elsewhere (e.g. in footnotes)
+    emails = list(dict.fromkeys(layout["emails"] + find_emails(text)))
     
     # Create an initial summary from the abstract
     abstract = ""
@@ -142,211 +478,144 @@ def parse_and_extract(file_path: str) -> Tuple[Dict[str, Any], List]:
     # Combine all extracted information
     extracted_info = {
         "title": title,
+        "authors": layout["authors"],
+        "organizations": layout["organizations"],
         "emails": emails,
         "content": text,
         "abstract": abstract,
-        "bold_text_in_first_lines": bold_texts
+        "bold_text_in_first_lines": layout["bold_text"]
     }
     
     return extracted_info, documents
 
-def extract_authors_and_organizations(file_path: str) -> Tuple[List[str], List[str]]:
+def _split_camel_case(name: str) -> str:
+    """Insert a space before the second capital of a joined name ("JohnSmith" -> "John Smith")."""
+    if ' ' not in name and len(name) > 3:
+        # Find capital letters after the first one
+        capitals = [i for i in range(1, len(name)) if name[i].isupper()]
+        if capitals:
+            return name[:capitals[0]] + ' ' + name[capitals[0]:]
+    return name
+
+def extract_authors_and_organizations(document: Union[str, ParsedDocument]) -> Tuple[List[str], List[str]]:
     """
-    Extract authors and organizations using layout-based extraction with PDFPlumber.
+    Extract authors and organizations from the first-page layout of a paper.
     
     Args:
-        file_path: Path to the PDF file
+        document: ParsedDocument, or path to the PDF file
         
     Returns:
-        Tuple of (authors list, organizations list)
+        Tuple of (authors list, organizations list), see extract_layout_metadata
     """
-    authors = []
-    organizations = []
+    layout = extract_layout_metadata(document)
+    return layout["authors"], layout["organizations"]
+
+def build_document_data(document_id: str, extracted_info: Dict[str, Any], authors: List[str],
+                        organizations: List[str], pages: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Combine extracted information into the document dictionary used for embedding.
     
-    try:
-        # First attempt: Use pdfplumber to extract text and analyze
-        with pdfplumber.open(file_path) as pdf:
-            # Process the first page only - that's where author info usually is
-            if len(pdf.pages) > 0:
-                first_page = pdf.pages[0]
-                text = first_page.extract_text()
-                if not text:
-                    print(f"Warning: pdfplumber could not extract text from first page")
-                    return [], []
-                
-                # Debug: Print first page content
-                print(f"DEBUG - First page content: {text[:200]}...")
-                
-                # Extract lines from the text
-                lines = text.split("\n")
-                
-                # Look for author section - typically between title and abstract
-                found_title = False
-                abstract_found = False
-                
-                for i, line in enumerate(lines[:15]):  # Check first 15 lines
-                    # Skip empty lines
-                    if not line.strip():
-                        continue
-                    
-                    # Debug each line
-                    print(f"DEBUG - Line {i}: {line}")
-                    
-                    # Skip until we find the title
-                    if not found_title:
-                        if i >= 1 and len(line.strip()) > 10:
-                            found_title = True
-                            continue  # Skip the title line
-                    
-                    # Stop when we reach abstract
-                    if "Abstract" in line:
-                        abstract_found = True
-                        break
-                    
-                    # Area between title and abstract often contains authors
-                    if found_title and not abstract_found:
-                        # Common author patterns in academic papers
-                        # Include patterns for joined names with superscripts
-                        name_patterns = [
-                            # Standard format with space
-                            r'([A-Z][a-z]+\s+[A-Z][a-z]+)[ \t]*(?:[\d\*\†\‡\§\|\#\+]{1,2}|\[\d+\]|\{[^\}]+\}|(?:https?|mailto):[^\s]+)?\b',
-                            
-                            # Joined names with superscripts (CamelCase)
-                            r'([A-Z][a-z]+[A-Z][a-z]+)[\*\d\†\‡\§\|\#\+]{1,3}\b',
-                            
-                            # Name with middle initial
-                            r'\b([A-Z][a-z]+\s+[A-Z]\.?\s+[A-Z][a-z]+)\b',
-                            
-                            # Hyphenated names
-                            r'\b([A-Z][a-z]+-[A-Z][a-z]+\s+[A-Z][a-z]+)\b',
-                            
-                            # Names with particles
-                            r'\b([A-Z][a-z]+\s+(?:van|von|de|da|del)\s+[A-Z][a-z]+)\b',
-                            
-                            # Abbreviated first name
-                            r'\b([A-Z][a-z]*\.?\s+[A-Z][a-z]+)\b',
-                            
-                            # Names with 'and' prefix
-                            r'\band([A-Z][a-z]+[A-Z][a-z]+)\b',
-                            
-                            # CamelCase names without superscripts
-                            r'([A-Z][a-z]+[A-Z][a-z]+)\b'
-                        ]
-                        
-                        for pattern in name_patterns:
-                            found_names = re.findall(pattern, line)
-                            if found_names:
-                                print(f"DEBUG - Found names: {found_names} with pattern {pattern}")
-                                # Clean up names
-                                for name in found_names:
-                                    # Handle 'and' prefix
-                                    if name.startswith('and'):
-                                        name = name[3:]  # Remove 'and'
-                                    
-                                    # Add spaces between camel case names
-                                    if ' ' not in name and len(name) > 3:
-                                        # Find capital letters after the first one
-                                        capitals = [i for i in range(1, len(name)) if name[i].isupper()]
-                                        if capitals:
-                                            # Insert space before the second capital letter
-                                            name = name[:capitals[0]] + ' ' + name[capitals[0]:]
-                                    
-                                    authors.append(name)
-                        
-                        # If we have at least one author, check for organizations
-                        if authors and i < 10:  # Only check in lines close to authors
-                            # Organization patterns - updated to handle joined text
-                            org_patterns = [
-                                # Standard university/institute pattern with numbering
-                                r'(?:\d+)?([A-Z][a-zA-Z]*\s+(?:University|Institute|College|Laboratory|Lab|School|Department|Dept|Center)(?:\s+of\s+[A-Za-z]+)?)',
-                                
-                                # CamelCase University pattern with numbering
-                                r'(?:\d+)?([A-Z][a-zA-Z]*(?:University|Institute|College)(?:of)?[A-Z][a-zA-Z]*(?:and)?[A-Z][a-zA-Z]*)',
-                                
-                                # Tech company research labs pattern
-                                r'(?:\d+)?((?:Microsoft|Google|Apple|Amazon|Facebook|IBM|Intel)\s*(?:Research|Labs|AI|Corporation))',
-                                
-                                # General "of" pattern
-                                r'(?:\d+)?([A-Z][a-zA-Z]*\s+of\s+[A-Z][a-zA-Z]+)',
-                                
-                                # Simplified institute pattern
-                                r'(?:\d+)?([A-Za-z]+\s+(?:Institute|University))',
-                            ]
-                            for pattern in org_patterns:
-                                found_orgs = re.findall(pattern, line)
-                                organizations.extend([org.strip() for org in found_orgs if org.strip()])
+    Args:
+        document_id: ID of the document
+        extracted_info: Dictionary returned by parse_and_extract
+        authors: List of author names
+        organizations: List of organization names
+        pages: Page texts; when given they replace the joined full content so
+            the chunker can stream over the pages
+        
+    Returns:
+        Document dictionary with id, metadata fields, abstract and full content (or pages)
+    """
+    document_data = {
+        "id": document_id,
+        "title": extracted_info["title"] or "Unknown Title",
+        "authors": ", ".join(authors) or "Unknown Authors",
+        "organizations": ", ".join(organizations) or "Unknown Organizations",
+        "emails": ", ".join(extracted_info["emails"]) or "No email information",
+        "content": extracted_info.get("abstract", "") or "No abstract available", 
+        "full_content": extracted_info["content"] or "No content available",
+    }
+    if pages is not None and any(page.strip() for page in pages):
+        document_data["pages"] = pages
+        del document_data["full_content"]
+    return document_data
 
-                # Second pass for superscript-based affiliation extraction
-                if not authors:
-                    # Try to find authors based on superscripts or common markers
-                    superscript_patterns = [
-                        r'([A-Z][a-z]+\s+[A-Z][a-z]+)[\d\*\†\‡\§\|\#]+',
-                        r'([A-Z][a-z]+[A-Z][a-z]+)[\d\*\†\‡\§\|\#\+]{1,3}',  # CamelCase with superscript
-                    ]
-                    for pattern in superscript_patterns:
-                        for line in lines[:10]:  # Check first 10 lines
-                            names = re.findall(pattern, line)
-                            if names:
-                                print(f"DEBUG - Found names with superscripts: {names}")
-                                # Add spaces to CamelCase names
-                                for name in names:
-                                    if ' ' not in name and len(name) > 3:
-                                        capitals = [i for i in range(1, len(name)) if name[i].isupper()]
-                                        if capitals:
-                                            name = name[:capitals[0]] + ' ' + name[capitals[0]:]
-                                    authors.append(name)
+def _extract_parsed(parsed: ParsedDocument) -> Tuple[Dict[str, Any], List[str], List[str]]:
+    """Run the extractors on a parsed PDF, returning (extracted info, authors, organizations)."""
+    # Title, emails, abstract and the layout-based authors and organizations in one pass
+    extracted_info, _ = parse_and_extract(parsed, include_documents=False)
+    return extracted_info, extracted_info["authors"], extracted_info["organizations"]
+
+def extract_documents(file_paths: List[str], document_ids: Optional[List[Optional[str]]] = None,
+                      skip_errors: bool = False) -> List[Optional[Dict[str, Any]]]:
+    """
+    Parse several PDFs and extract everything needed to embed them.
     
-    except Exception as e:
-        print(f"Error extracting authors/organizations: {str(e)}")
-        return [], []
-    
-    # Deduplicate and clean results
-    authors = list(set(authors))
-    
-    # Filter out false positives from author extraction
-    authors = [author for author in authors if len(author.split()) >= 2 and 
-               not any(word.lower() in author.lower() for word in ["university", "institute", "abstract"])]
-    
-    # Format CamelCase names that might have been missed
-    formatted_authors = []
-    for author in authors:
-        if ' ' not in author and len(author) > 3:
-            # Find all capital letters after the first position
-            capitals = [i for i in range(1, len(author)) if author[i].isupper()]
-            if capitals:
-                # Insert space before the first capital letter after position 0
-                formatted_name = author[:capitals[0]] + ' ' + author[capitals[0]:]
-                formatted_authors.append(formatted_name)
-            else:
-                formatted_authors.append(author)
-        else:
-            formatted_authors.append(author)
-    
-    # Clean and deduplicate organizations
-    organizations = list(set(organizations))
-    
-    # Format CamelCase organizations
-    formatted_orgs = []
-    for org in organizations:
-        # Try to break CamelCase organization names
-        if len(org) > 10 and ' ' not in org:
-            # Look for common organization keywords
-            for keyword in ['University', 'Institute', 'College', 'Research', 'Technology', 'Science']:
-                if keyword in org:
-                    index = org.index(keyword)
-                    # Add space before keyword if not at the beginning
-                    if index > 0:
-                        org = org[:index] + ' ' + org[index:]
-                    break
-        formatted_orgs.append(org)
+    Papers without pattern-matched organizations share one batched spaCy
+    pass when SPACY_NER is enabled. This is a module-level function so it
+    can run in worker processes.
     
-    # Remove organizations that are subsets of other organizations
-    filtered_orgs = []
-    for org1 in formatted_orgs:
-        if not any(org1 != org2 and org1 in org2 for org2 in formatted_orgs):
-            filtered_orgs.append(org1)
+    Args:
+        file_paths: Paths to the PDF files
+        document_ids: ID of each document (default: the file names)
+        skip_errors: Log failing files and return None for them instead of raising
+        
+    Returns:
+        Document dictionaries in input order, see build_document_data, with
+        the "parse" and "extract" seconds of each paper in "stage_seconds"
+    """
+    document_ids = document_ids or [None] * len(file_paths)
+    extracted: List[Optional[Tuple[ParsedDocument, Dict[str, Any], List[str], List[str]]]] = []
+    stage_seconds = []
+    for file_path in file_paths:
+        try:
+            # Open the PDF once and share the result between the extractors
+            started = time.perf_counter()
+            parsed = parse_pdf(file_path)
+            parsed_at = time.perf_counter()
+            extracted.append((parsed, *_extract_parsed(parsed)))
+            stage_seconds.append({"parse": parsed_at - started, "extract": time.perf_counter() - parsed_at})
+        except Exception as e:
+            if not skip_errors:
+                raise
+            logger.error(f"Error extracting {file_path}: {str(e)}")
+            extracted.append(None)
+            stage_seconds.append({})
     
-    print(f"DEBUG - Final authors: {formatted_authors}")
-    print(f"DEBUG - Final organizations: {filtered_orgs}")
+    # Entity-based organizations for the papers the layout extractor missed, in one batch
+    if SPACY_NER:
+        missing = [i for i, item in enumerate(extracted) if item is not None and not item[3]]
+        entity_orgs = extract_entity_organizations([extracted[i][0].first_page_text for i in missing])
+        for i, organizations in zip(missing, entity_orgs):
+            extracted[i][3].extend(organizations)
     
-    return formatted_authors, filtered_orgs
+    documents = []
+    for file_path, document_id, item, seconds in zip(file_paths, document_ids, extracted, stage_seconds):
+        if item is None:
+            documents.append(None)
+            continue
+        parsed, extracted_info, authors, organizations = item
+        # Use the filename as ID by default
+        document_id = document_id or os.path.basename(file_path)
+        document_data = build_document_data(document_id, extracted_info, authors, organizations,
+                                            pages=parsed.page_texts)
+        document_data["source"] = os.path.abspath(file_path)
+        # Worker processes have their own metrics, iter_changed_entries records these
+        document_data["stage_seconds"] = seconds
+        documents.append(document_data)
+    return documents
+
+def extract_document(file_path: str, document_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse a PDF once and extract everything needed to embed it.
+    
+    This is a module-level function so it can run in worker processes.
+    
+    Args:
+        file_path: Path to the PDF file
+        document_id: ID of the document (default: the file name)
+        
+    Returns:
+        Document dictionary, see build_document_data
+    """
+    return extract_documents([file_path], [document_id])[0]
@@ -0,0 +1,283 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from collections import deque
+from itertools import islice
+from typing import List, Dict, Any, Optional, Set, Tuple, Deque, Iterator
+
+from file_utils import extract_documents, SPACY_NER, SPACY_BATCH_SIZE
+from embedding_utils import iter_changed_entries, stream_embeddings_to_store, peak_rss_mb
+from vector_utils import get_vector_store
+from registry_utils import document_record, get_document_registry
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path: str) -> str:
+    """
+    Hash a file's content.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        Hex SHA-256 digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_pdfs(pdf_dir: Optional[str] = None, pattern: Optional[str] = None) -> List[str]:
+    """
+    Collect the PDF files to ingest.
+
+    Args:
+        pdf_dir: Directory searched recursively for *.pdf files
+        pattern: Glob pattern such as "papers/2023/**/*.pdf"
+
+    Returns:
+        Sorted list of unique PDF paths
+    """
+    paths = set()
+    if pdf_dir:
+        paths.update(glob.glob(os.path.join(pdf_dir, "**", "*.pdf"), recursive=True))
+    if pattern:
+        paths.update(path for path in glob.glob(pattern, recursive=True) if path.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def document_ids_for(paths: List[str], root: Optional[str] = None) -> List[str]:
+    """
+    Derive document IDs from the paths of the PDFs, relative to their root directory.
+
+    Papers with the same file name in different folders ("a/paper.pdf" and
+    "b/paper.pdf") get different IDs, while files directly in the root keep
+    their file name as ID.
+
+    Args:
+        paths: PDF files to ingest
+        root: Directory the paths were collected from (default: their common
+            directory; also used when some path lies outside `root`)
+
+    Returns:
+        One ID per path, with "/" separating folders
+    """
+    if not paths:
+        return []
+    directories = [os.path.dirname(os.path.abspath(path)) for path in paths]
+    if root is None or any(os.path.commonpath([os.path.abspath(root), directory]) != os.path.abspath(root)
+                           for directory in directories):
+        root = os.path.commonpath(directories)
+    return [os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/") for path in paths]
+
+
+class IngestManifest:
+    """
+    Append-only record of the PDFs whose vectors are durably stored.
+
+    Each line is a JSON object with the file hash, path and document ID, so an
+    interrupted bulk run can be restarted and skip the files already done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.completed.add(json.loads(line)["hash"])
+            logger.info(f"Manifest {path} lists {len(self.completed)} completed files")
+
+    def __contains__(self, file_hash: str) -> bool:
+        return file_hash in self.completed
+
+    def add(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Record completed files.
+
+        Args:
+            records: Dictionaries with at least a "hash" key
+        """
+        # Re-indexed files are already listed
+        records = [record for record in records if record["hash"] not in self.completed]
+        if not records:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(record["hash"] for record in records)
+
+
+def bulk_ingest(paths: List[str], workers: int = 4, embed_batch_size: Optional[int] = None,
+                upsert_batch_size: int = 100, manifest_path: str = "ingest_manifest.jsonl",
+                embed_window: int = 512, queue_size: int = 4, checkpoint_every: int = 50,
+                papers_per_task: Optional[int] = None, reindex: bool = False,
+                root: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ingest many PDFs: parse in a process pool, embed in shared batches and
+    upsert in fixed-size batches.
+
+    Papers flow through a streaming pipeline (parsed papers -> chunks ->
+    embedding windows -> upsert batches) with bounded buffers between the
+    stages, so memory use does not grow with the number of papers.
+
+    Files listed in the manifest are skipped. A file is only added to the
+    manifest after all of its vectors were upserted and the store persisted,
+    so the run can be resumed after an interruption.
+
+    Papers already in the store are diffed by content hash: only new or
+    changed vectors are embedded and upserted, and orphaned ones deleted.
+
+    Args:
+        paths: PDF files to ingest
+        workers: Number of parsing processes
+        embed_batch_size: Number of texts per embedding call (default: EMBEDDING_BATCH_SIZE)
+        upsert_batch_size: Number of vectors per upsert call
+        manifest_path: Path of the resume manifest
+        embed_window: Number of texts, across papers, collected before embedding them
+        queue_size: Maximum number of embedding windows buffered between stages
+        checkpoint_every: Number of upsert batches between store checkpoints
+        papers_per_task: Number of PDFs handed to a worker at once, so their spaCy
+            NER runs as one batch (default: SPACY_BATCH_SIZE with SPACY_NER, else 1)
+        reindex: Re-extract files listed in the manifest too (e.g. nightly runs
+            after extractor changes); unchanged vectors are still skipped
+        root: Directory the paths were collected from, document IDs are the
+            paths relative to it (see document_ids_for)
+
+    Returns:
+        Dictionary of run statistics
+    """
+    manifest = IngestManifest(manifest_path)
+    store = get_vector_store(create=True)
+    registry = get_document_registry()
+
+    pending_files: List[Tuple[str, str, str]] = []
+    skipped = 0
+    queued_hashes = set()
+    for path, document_id in zip(paths, document_ids_for(paths, root)):
+        file_hash = file_sha256(path)
+        if (file_hash in manifest and not reindex) or file_hash in queued_hashes:
+            skipped += 1
+        else:
+            queued_hashes.add(file_hash)
+            pending_files.append((path, file_hash, document_id))
+    logger.info(f"Ingesting {len(pending_files)} PDFs ({skipped} already in the manifest or duplicated)")
+
+    stats = {"papers": 0, "failed": 0, "skipped": skipped, "chunks": 0, "vectors": 0,
+             "changed": 0, "unchanged_vectors": 0, "deleted": 0}
+    diff_stats: Dict[str, int] = {}
+    # (manifest record, registry record) of papers whose entries were produced, in production order
+    produced: Deque[List[Optional[Dict[str, Any]]]] = deque()
+    done_since_checkpoint: List[List[Optional[Dict[str, Any]]]] = []
+    batches_since_checkpoint = 0
+    started = time.perf_counter()
+
+    task_size = papers_per_task or (SPACY_BATCH_SIZE if SPACY_NER else 1)
+    tasks = [pending_files[i:i + task_size] for i in range(0, len(pending_files), task_size)]
+
+    def submit(pool: ProcessPoolExecutor, task: List[Tuple[str, str, str]]):
+        return pool.submit(extract_documents, [path for path, _, _ in task],
+                           [document_id for _, _, document_id in task], skip_errors=True)
+
+    def iter_documents(pool: ProcessPoolExecutor) -> Iterator[Dict[str, Any]]:
+        # Keep a bounded number of parsed papers in flight
+        pending_tasks = iter(tasks)
+        in_flight = {}
+        for task in islice(pending_tasks, 2 * workers):
+            in_flight[submit(pool, task)] = task
+
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = in_flight.pop(future)
+                for next_task in islice(pending_tasks, 1):
+                    in_flight[submit(pool, next_task)] = next_task
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to parse {', '.join(path for path, _, _ in task)}: {str(e)}")
+                    stats["failed"] += len(task)
+                    continue
+
+                for (path, file_hash, _), document_data in zip(task, results):
+                    if document_data is None:
+                        stats["failed"] += 1
+                        continue
+                    stats["papers"] += 1
+                    produced.append([{"hash": file_hash, "path": path, "document_id": document_data.get("id", "")}, None])
+                    if stats["papers"] % 50 == 0:
+                        elapsed = time.perf_counter() - started
+                        logger.info(f"{stats['papers']} papers parsed ({stats['papers'] / elapsed:.2f} papers/s)")
+                    yield document_data
+
+    def on_document(document: Dict[str, Any], entries) -> None:
+        # Runs right after iter_documents yielded this paper, so it is the last one produced
+        produced[-1][1] = document_record(document, entries)
+
+    def on_upserted(batch) -> None:
+        nonlocal batches_since_checkpoint
+        stats["vectors"] += len(batch)
+        stats["chunks"] += sum(1 for _, _, metadata in batch if metadata["type"] == "chunk")
+
+        # Entries arrive in order, so every paper produced before the one
+        # owning the last upserted entry is fully stored
+        current = batch[-1][2]["document_id"]
+        while produced and produced[0][0]["document_id"] != current:
+            done_since_checkpoint.append(produced.popleft())
+
+        batches_since_checkpoint += 1
+        if batches_since_checkpoint >= checkpoint_every:
+            checkpoint()
+
+    def checkpoint() -> None:
+        nonlocal batches_since_checkpoint, done_since_checkpoint
+        store.persist()
+        registry.upsert_many([record for _, record in done_since_checkpoint if record])
+        manifest.add([record for record, _ in done_since_checkpoint])
+        done_since_checkpoint = []
+        batches_since_checkpoint = 0
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        stream_embeddings_to_store(
+            iter_changed_entries(iter_documents(pool), store, diff_stats, on_document=on_document),
+            store,
+            batch_size=embed_batch_size,
+            upsert_batch_size=upsert_batch_size,
+            embed_window=embed_window,
+            queue_size=queue_size,
+            on_upserted=on_upserted
+        )
+
+    # The stream is drained, every produced paper is stored
+    done_since_checkpoint.extend(produced)
+    produced.clear()
+    checkpoint()
+
+    stats["changed"] = diff_stats.get("changed", 0)
+    stats["unchanged_vectors"] = diff_stats.get("skipped", 0)
+    stats["deleted"] = diff_stats.get("deleted", 0)
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["papers_per_second"] = stats["papers"] / elapsed if elapsed else 0.0
+    stats["chunks_per_second"] = stats["chunks"] / elapsed if elapsed else 0.0
+    stats["peak_rss_mb"] = peak_rss_mb()
+    stats["peak_worker_rss_mb"] = peak_rss_mb(children=True)
+    logger.info(f"Ingestion memory high-water mark: {stats['peak_rss_mb'] or 0:.0f} MiB "
+                f"(largest parsing worker {stats['peak_worker_rss_mb'] or 0:.0f} MiB)")
+    return stats
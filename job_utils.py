@@ -0,0 +1,260 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+from file_utils import (parse_pdf, parse_and_extract, build_document_data,
+                        extract_entity_organizations, SPACY_NER)
+from embedding_utils import embed_entries, iter_changed_entries, upsert_vectors
+from vector_utils import get_vector_store
+from registry_utils import document_record, get_document_registry
+from metrics_utils import timed
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Number of papers ingested concurrently (and size of the parsing process pool)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Maximum number of queued or running jobs before uploads are rejected
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "16"))
+# Number of jobs kept for status lookups, oldest finished jobs are dropped first
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+# Summarize the sections of every ingested paper in the background. Off by default:
+# summaries are then computed on the first request for them, so uploads cost no LLM calls
+SUMMARIZE_ON_INGEST = os.getenv("SUMMARIZE_ON_INGEST", "false").lower() in ("1", "true", "yes")
+# Papers summarized concurrently (each one already sends its sections in parallel)
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+
+# Ingestion stages, in the order they complete
+STAGES = ["parsed", "extracted", "embedded", "indexed"]
+
+
+class QueueFullError(Exception):
+    """Raised when too many ingestion jobs are already queued or running."""
+
+
+class IngestionJobManager:
+    """
+    Runs paper ingestion off the request path and tracks its progress.
+
+    PDF parsing runs in a bounded process pool so it never blocks the event
+    loop or holds the GIL. Metadata extraction, embedding and upserting run
+    in the coordinating thread, which shares the already loaded embedding
+    model and vector store with the web app. Section summaries are computed
+    on their own threads, after indexing or on request, so they never delay it.
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS, max_pending: int = INGEST_MAX_PENDING,
+                 history: int = INGEST_JOB_HISTORY, on_indexed: Optional[Callable[[str], None]] = None,
+                 summarize: bool = SUMMARIZE_ON_INGEST):
+        """
+        Args:
+            max_workers: Number of papers ingested concurrently
+            max_pending: Maximum number of queued or running jobs
+            history: Number of jobs kept for status lookups
+            on_indexed: Called with the document ID once a paper's vectors are stored
+            summarize: Summarize the sections of each paper once it is indexed
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self.on_indexed = on_indexed
+        self.summarize = summarize
+        self._summarizing = set()
+        self._summary_threads = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                # Spawn rather than fork: the parent holds model and thread state
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+
+    def submit(self, file_path: str, document_id: str, filename: str = "") -> Dict[str, Any]:
+        """
+        Queue a PDF for ingestion.
+
+        Args:
+            file_path: Path to the uploaded PDF file
+            document_id: ID under which the document is stored
+            filename: Original file name, for display
+
+        Returns:
+            Snapshot of the new job
+
+        Raises:
+            QueueFullError: If `max_pending` jobs are already queued or running
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"{self._pending} ingestion jobs already pending")
+            self._pending += 1
+
+            now = time.time()
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "document_id": document_id,
+                "filename": filename,
+                "status": "queued",
+                "stage": None,
+                "document": None,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            self._trim_history()
+            job = dict(self._jobs[job_id])
+
+        self._threads.submit(self._run, job_id, file_path, document_id, filename)
+        logger.info(f"Queued ingestion job {job_id} for {filename or file_path}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a job.
+
+        Args:
+            job_id: ID returned by `submit`
+
+        Returns:
+            Snapshot of the job, or None if it is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def pending(self) -> int:
+        """Return the number of queued or running jobs."""
+        with self._lock:
+            return self._pending
+
+    def _trim_history(self) -> None:
+        # Drop the oldest finished jobs, never the pending ones
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id]["status"] in ("completed", "failed"):
+                self._jobs.pop(job_id)
+                excess -= 1
+
+    def _update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def _run(self, job_id: str, file_path: str, document_id: str, filename: str = "") -> None:
+        """Ingest one paper, recording each completed stage on the job."""
+        try:
+            self._update(job_id, status="running")
+            pool = self._get_process_pool()
+
+            # Parsing runs in a worker process, so it is timed here
+            with timed("ingest", "parse"):
+                parsed = pool.submit(parse_pdf, file_path).result()
+            self._update(job_id, stage="parsed")
+
+            with timed("ingest", "extract"):
+                extracted_info, _ = parse_and_extract(parsed, include_documents=False)
+                authors, organizations = extracted_info["authors"], extracted_info["organizations"]
+                if SPACY_NER and not organizations:
+                    organizations = extract_entity_organizations([parsed.first_page_text])[0]
+            document_data = build_document_data(document_id, extracted_info, authors, organizations,
+                                                pages=parsed.page_texts)
+            self._update(job_id, stage="extracted", document={
+                field: document_data[field]
+                for field in ["id", "title", "authors", "organizations", "emails"]
+            })
+
+            # Re-uploads only re-embed the entries that changed
+            store = get_vector_store(create=True)
+            diff_stats = {}
+            records = []
+            # Chunking and the diff against the stored entries (timed there), then the batched embedding
+            entries = list(iter_changed_entries(
+                [document_data], store, diff_stats,
+                on_document=lambda document, entries: records.append(document_record(document, entries, source=os.path.basename(filename)))
+            ))
+            vectors = embed_entries(entries)
+            self._update(job_id, stage="embedded")
+
+            upsert_vectors(store, vectors)
+            get_document_registry().upsert_many(records)
+            if self.on_indexed:
+                self.on_indexed(document_id)
+            self._update(job_id, stage="indexed", status="completed")
+            if self.summarize:
+                self.submit_summary(document_id, pages=parsed.page_texts)
+            logger.info(f"Ingestion job {job_id} stored {len(vectors)} vectors for document {document_id} "
+                        f"({diff_stats['skipped']} unchanged, {diff_stats['deleted']} deleted)")
+
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            self._update(job_id, status="failed", error=str(e))
+
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def submit_summary(self, document_id: str, pages: Optional[List[str]] = None,
+                       file_path: Optional[str] = None) -> bool:
+        """
+        Queue the section summaries of a paper.
+
+        Args:
+            document_id: ID of the document
+            pages: Page texts of the paper
+            file_path: PDF to parse when `pages` is not given
+
+        Returns:
+            False if the paper is already being summarized
+        """
+        with self._lock:
+            if document_id in self._summarizing:
+                return False
+            self._summarizing.add(document_id)
+        self._summary_threads.submit(self._summarize, document_id, pages, file_path)
+        return True
+
+    def is_summarizing(self, document_id: str) -> bool:
+        """Return True if the paper's summaries are queued or being computed."""
+        with self._lock:
+            return document_id in self._summarizing
+
+    def _summarize(self, document_id: str, pages: Optional[List[str]], file_path: Optional[str]) -> None:
+        """Compute and store the section summaries of one paper."""
+        try:
+            # Imported here: the LLM client settings are only needed for summaries
+            from summary_utils import summarize_document
+
+            if pages is None:
+                pages = self._get_process_pool().submit(parse_pdf, file_path).result().page_texts
+            summarize_document(document_id, pages)
+        except Exception as e:
+            logger.error(f"Summarizing document {document_id} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(document_id)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and wait for running jobs to finish."""
+        self._threads.shutdown(wait=True)
+        self._summary_threads.shutdown(wait=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
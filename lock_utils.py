@@ -0,0 +1,51 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a file, shared by every process on the machine.
+
+    Index directories are written by the API and by CLI bulk ingestion; the
+    lock serializes their persists. Without fcntl (Windows) it does nothing.
+
+    Args:
+        path: Lock file, created if needed
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def file_version(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Identify the current version of a file written with os.replace.
+
+    Persisted indexes compare it with the version they loaded to notice
+    writes by other processes.
+
+    Args:
+        path: Path to the file
+
+    Returns:
+        (inode, modification time in nanoseconds), or None if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns
+    except OSError:
+        return None
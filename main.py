@@ -3,12 +3,14 @@ import sys
 import argparse
 import logging
 from typing import Dict, Any
-from file_utils import parse_and_extract, extract_authors_and_organizations
+from file_utils import extract_document
 from embedding_utils import process_and_store_embeddings
+from ingest_utils import find_pdfs, bulk_ingest
 from qa_utils import create_qa_chain, answer_question
+from metadata_utils import classify_metadata_question
+from conversation_utils import truncate_history
+from vector_utils import get_vector_store, VECTOR_STORE
 from dotenv import load_dotenv
-import pinecone
-import re
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,7 +20,6 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 pine_api_key = os.getenv("PINECONE_API_KEY")
-pine_env = os.getenv("PINECONE_ENVIRONMENT", "gcp-starter")
 
 def process_pdf(file_path: str) -> Dict[str, Any]:
     """
@@ -33,56 +34,8 @@ def process_pdf(file_path: str) -> Dict[str, Any]:
     logger.info(f"Processing PDF: {file_path}")
     
     try:
-        # Extract basic information and full content using parse_and_extract
-        # This will return extracted_info and documents
-        extracted_info, documents = parse_and_extract(file_path)
-        
-        # Extract authors and organizations using extract_authors_and_organizations
-        authors, organizations = extract_authors_and_organizations(file_path)
-        
-        # If we still don't have authors, try to extract from the first page
-        if not authors and documents and len(documents) > 0:
-            logger.info("Trying to extract authors from first page content")
-            first_page = documents[0].page_content
-            
-            # Look for lines with multiple capitalized words, common in author lists
-            lines = first_page.split('\n')
-            for line in lines[:10]:  # Check first 10 lines
-                # Skip very short lines, abstract, title-like lines
-                if len(line) < 10 or "abstract" in line.lower() or line.isupper():
-                    continue
-                
-                # Look for lines with multiple capitalized words (potential author names)
-                words = line.split()
-                cap_words = [w for w in words if w and w[0].isupper()]
-                
-                # If line has several capitalized words and not too many words total, might be author list
-                if len(cap_words) >= 2 and len(words) < 15 and not any(w.endswith('.') for w in words[-2:]):
-                    # Extract potential names (First Last pairs)
-                    for i in range(len(words) - 1):
-                        if words[i] and words[i+1] and words[i][0].isupper() and words[i+1][0].isupper():
-                            potential_author = f"{words[i]} {words[i+1]}"
-                            # Filter out organization-like names
-                            if not any(org_word in potential_author.lower() for org_word in 
-                                      ["university", "institute", "department", "abstract"]):
-                                authors.append(potential_author)
-        
-        # Clean up authors (remove any with numbers or special characters)
-        authors = [author for author in authors if re.match(r'^[A-Za-z\s\.\-]+$', author)]
-        
-        # Get the filename for ID
-        file_id = os.path.basename(file_path)
-        
-        # Combined extracted information
-        document_data = {
-            "id": file_id,
-            "title": extracted_info["title"] or "Unknown Title",
-            "authors": ", ".join(authors) or "Unknown Authors",
-            "organizations": ", ".join(organizations) or "Unknown Organizations",
-            "emails": ", ".join(extracted_info["emails"]) or "No email information",
-            "content": extracted_info.get("abstract", "") or "No abstract available", 
-            "full_content": extracted_info["content"] or "No content available",
-        }
+        # Parse the PDF and extract its metadata and content
+        document_data = extract_document(file_path)
         
         # Log extraction results
         logger.info(f"Extracted document ID: {document_data['id']}")
@@ -102,6 +55,14 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="SciChat - Chat with scientific papers")
     parser.add_argument("--pdf", type=str, help="Path to the PDF file to process")
+    parser.add_argument("--pdf-dir", type=str, help="Directory of PDF files to process in bulk (searched recursively)")
+    parser.add_argument("--glob", type=str, help="Glob pattern of PDF files to process in bulk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of PDF parsing processes for bulk mode")
+    parser.add_argument("--batch-size", type=int, default=None, help="Number of texts per embedding batch")
+    parser.add_argument("--upsert-batch-size", type=int, default=100, help="Number of vectors per upsert batch in bulk mode")
+    parser.add_argument("--manifest", type=str, default="ingest_manifest.jsonl", help="Manifest of completed files used to resume bulk runs")
+    parser.add_argument("--reindex", action="store_true", help="Re-extract files already in the manifest, only re-embedding changed chunks")
+    parser.add_argument("--summarize", action="store_true", help="Print section summaries of the PDF (stored, only recomputed when it changes)")
     parser.add_argument("--process_only", action="store_true", help="Only process the PDF without starting the chat")
     args = parser.parse_args()
     
@@ -111,29 +72,18 @@ def main():
         return
     
     # Check environment variables
-    if not pine_api_key:
-        logger.error("Pinecone API key not found. Please set PINE_API_KEY in your .env file.")
-        return
-    
-    # Initialize Pinecone
-    try:
-        logger.info("Connecting to Pinecone...")
-        pc = pinecone.init(api_key=pine_api_key, environment=pine_env)
-    except Exception as e:
-        logger.error(f"Failed to initialize Pinecone: {str(e)}")
+    if VECTOR_STORE == "pinecone" and not pine_api_key:
+        logger.error("Pinecone API key not found. Please set PINECONE_API_KEY in your .env file.")
         return
     
     # Connect to the existing index
-    index_name = "document-embeddings"
     try:
-        if index_name in pc.list_indexes().names():
-            logger.info(f"Connecting to existing Pinecone index: {index_name}")
-            index = pc.Index(index_name)
-        else:
-            logger.info(f"Index {index_name} does not exist yet.")
-            index = None
+        logger.info(f"Connecting to {VECTOR_STORE} vector store...")
+        index = get_vector_store(create=False)
+        if not index:
+            logger.info("Vector index does not exist yet.")
     except Exception as e:
-        logger.error(f"Error connecting to Pinecone index: {str(e)}")
+        logger.error(f"Error connecting to vector store: {str(e)}")
         return
     
     # Process PDF if provided
@@ -147,8 +97,8 @@ def main():
             document_data = process_pdf(args.pdf)
             
             # Generate and store embeddings
-            logger.info("Generating embeddings and storing in Pinecone...")
-            index = process_and_store_embeddings([document_data])
+            logger.info("Generating embeddings and storing in the vector store...")
+            index = process_and_store_embeddings([document_data], batch_size=args.batch_size)
             
             if index:
                 logger.info("Document processing completed successfully!")
@@ -156,8 +106,15 @@ def main():
                 logger.error("Failed to process document. Check logs for details.")
                 return
             
+            if args.summarize:
+                from summary_utils import summarize_document
+                
+                sections = summarize_document(document_data["id"], document_data["pages"])
+                for title, summary in sections.items():
+                    print(f"\n== {title} ==\n{summary}")
+            
             # Exit if only processing was requested
-            if args.process_only:
+            if args.process_only and not (args.pdf_dir or args.glob):
                 return
                 
         except Exception as e:
@@ -165,9 +122,39 @@ def main():
             if args.process_only:
                 return
     
+    # Process a directory or glob of PDFs in bulk
+    if args.pdf_dir or args.glob:
+        paths = find_pdfs(args.pdf_dir, args.glob)
+        if not paths:
+            logger.error("No PDF files found for bulk processing")
+            return
+        
+        logger.info(f"Bulk processing {len(paths)} PDF files with {args.workers} workers")
+        stats = bulk_ingest(
+            paths,
+            workers=args.workers,
+            embed_batch_size=args.batch_size,
+            upsert_batch_size=args.upsert_batch_size,
+            manifest_path=args.manifest,
+            reindex=args.reindex,
+            root=args.pdf_dir
+        )
+        
+        print(f"Processed {stats['papers']} papers ({stats['failed']} failed, {stats['skipped']} skipped), "
+              f"{stats['chunks']} chunks, {stats['vectors']} vectors in {stats['seconds']:.1f}s")
+        print(f"Throughput: {stats['papers_per_second']:.2f} papers/sec, {stats['chunks_per_second']:.1f} chunks/sec")
+        print(f"Incremental index: {stats['changed']} vectors upserted, {stats['unchanged_vectors']} unchanged skipped, "
+              f"{stats['deleted']} orphaned deleted")
+        if stats.get("peak_rss_mb") is not None:
+            print(f"Peak memory: {stats['peak_rss_mb']:.0f} MiB (largest parsing worker {stats['peak_worker_rss_mb']:.0f} MiB)")
+        
+        index = get_vector_store(create=True)
+        if args.process_only:
+            return
+    
     # Check if we have a valid index before proceeding to chat
     if not index:
-        logger.error("No valid Pinecone index found. Please process a PDF first.")
+        logger.error("No valid vector index found. Please process a PDF first.")
         return
     
     # Create QA chain for the chatbot
@@ -210,14 +197,13 @@ def main():
             continue
             
         # Determine if this is a metadata-specific question
-        metadata_question = any(word in question.lower() for word in 
-                               ["author", "who wrote", "organization", "university", 
-                                "email", "contact", "title", "called"])
+        metadata_question = classify_metadata_question(question) is not None
         
         try:
             # Get the answer
             print("\nThinking...")
-            answer = answer_question(qa_chain, question, chat_history, metadata_only=metadata_question)
+            answer = answer_question(qa_chain, question, truncate_history(chat_history),
+                                     metadata_only=metadata_question)
             
             # Display the answer
             print(f"\nBot: {answer}")
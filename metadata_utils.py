@@ -0,0 +1,216 @@
+import re
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from registry_utils import DocumentRegistry, get_document_registry
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Optional tail naming the paper ("of this paper", "of Attention Is All You Need")
+PAPER_TAIL = r"(?:\s+(?:of|in|for|on|behind)\s+.+)?"
+# Whole metadata questions per field, checked in order against the normalized question
+FIELD_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("emails", re.compile(
+        r"(?:what (?:is|are) (?:the )?(?:authors'? |author'?s? |their )?"
+        r"(?:e-?mails?|e-?mail address(?:es)?|contact (?:details|information|address(?:es)?))" + PAPER_TAIL + r"|"
+        r"how (?:can|do|could) i (?:contact|reach|e-?mail) (?:the )?(?:authors?|them)" + PAPER_TAIL + r"|"
+        r"(?:authors'? )?(?:e-?mails?|e-?mail address(?:es)?|contact (?:details|information))" + PAPER_TAIL + r")"
+    )),
+    ("organizations", re.compile(
+        r"(?:(?:which|what) (?:universit(?:y|ies)|institut(?:e|es|ion|ions)|organi[sz]ations?|labs?|"
+        r"compan(?:y|ies)|affiliations?) (?:(?:is|are|was|were|do|does|did) )?"
+        r"(?:the )?(?:authors?|they|it|this paper|the paper)(?: (?:from|affiliated with|belong to|work (?:at|for)))?" + PAPER_TAIL + r"|"
+        r"what (?:is|are) (?:the )?(?:authors'? )?affiliations?" + PAPER_TAIL + r"|"
+        r"where (?:is|are|was|were) (?:the )?(?:authors?|they|it|this paper|the paper) from|"
+        r"(?:authors'? )?affiliations?" + PAPER_TAIL + r")"
+    )),
+    ("authors", re.compile(
+        r"(?:who (?:wrote|authored|published) (?:it|(?:this|the|that) (?:paper|article|study|work))" + PAPER_TAIL + r"|"
+        r"who (?:is|are|was|were) (?:the )?(?:authors?|writers?)" + PAPER_TAIL + r"|"
+        r"(?:what|who) (?:is|are) the (?:names? of the )?authors?'?s?(?: names?)?" + PAPER_TAIL + r"|"
+        r"(?:list|name) the authors" + PAPER_TAIL + r"|"
+        r"(?:the )?authors?" + PAPER_TAIL + r"|"
+        r"(?:which|what) (?:paper|papers|article) (?:was|were|is) (?:written|authored) by .+)"
+    )),
+    ("title", re.compile(
+        r"(?:what(?: is|'s) (?:the )?(?:title|name)(?: of (?:this|the) (?:paper|article|study|work|document))?|"
+        r"what(?: is|'s) (?:this|the) (?:paper|article)(?:'s title| called)|"
+        r"what is (?:this|the) (?:paper|article) titled|"
+        r"(?:the )?title(?: of (?:this|the) (?:paper|article|study|work|document))?)"
+    )),
+]
+# Requests such as "please tell me" in front of the question itself
+POLITE_PREFIX = re.compile(r"^(?:please,?\s+|(?:can|could) you (?:please )?(?:tell me|say|list)\s+|tell me\s+|do you know\s+)+")
+# Questions about the content need retrieval even if they mention a metadata word
+CONTENT_PATTERN = re.compile(
+    r"\b(why|how does|how did|how do (?:the|they|we|you|it)|explain|describe|summari[sz]e|compare|method|methods|results?|findings?|"
+    r"find|found|show|shows|showed|propose|proposes|proposed|evaluate|evaluates|evaluated|evaluation|say|says|said|"
+    r"think|argue|argues|claim|claims|conclude|concludes|report|reports|release|released|code|model|models|"
+    r"table|figure|fig|section|equation|experiments?|dataset|datasets|limitations?|contributions?|approach)\b"
+)
+# Longer questions are rarely pure metadata lookups
+MAX_METADATA_WORDS = 20
+# "who wrote <title>", only answered when the rest of the question is a registered title
+TITLED_AUTHORS_PATTERN = re.compile(r"who (?:wrote|authored|published) (.+)")
+
+# Values written by file_utils.build_document_data when extraction failed
+MISSING_VALUES = {"", "Unknown Title", "Unknown Authors", "Unknown Organizations", "No email information"}
+
+FIELD_LABELS = {
+    "title": "The title is",
+    "authors": "The authors are",
+    "organizations": "The affiliated organizations are",
+    "emails": "The contact emails are",
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase a question and drop whitespace runs, end punctuation and polite prefixes."""
+    text = " ".join(question.lower().split()).strip(" ?.!")
+    return POLITE_PREFIX.sub("", text)
+
+
+def classify_metadata_question(question: str) -> Optional[str]:
+    """
+    Recognise questions that only ask for a metadata field.
+
+    The whole question must be a metadata question ("who wrote this paper?",
+    "what is the title?"); questions that merely mention authors or a title
+    ("what did the authors find?") need retrieval.
+
+    Args:
+        question: User's question
+
+    Returns:
+        "title", "authors", "organizations" or "emails", or None for
+        questions that need retrieval over the paper content
+    """
+    text = normalize_question(question)
+    if len(text.split()) > MAX_METADATA_WORDS or CONTENT_PATTERN.search(text):
+        return None
+    for field, pattern in FIELD_PATTERNS:
+        if pattern.fullmatch(text):
+            return field
+    return None
+
+
+class MetadataLookup:
+    """
+    Answers metadata questions from the document registry, without embedding
+    the question, querying the vector store or calling the LLM.
+
+    The registry titles are kept in memory as word sets, so that a question
+    naming a paper ("who wrote Attention Is All You Need?") resolves to it.
+    They are reloaded when the registry changes.
+    """
+
+    def __init__(self, registry: Optional[DocumentRegistry] = None, min_title_overlap: float = 0.6):
+        """
+        Args:
+            registry: Document registry (default: the shared one)
+            min_title_overlap: Share of a title's words the question must contain to select that paper
+        """
+        self._registry = registry
+        self.min_title_overlap = min_title_overlap
+        self._titles: List[Tuple[str, set]] = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def registry(self) -> DocumentRegistry:
+        return self._registry or get_document_registry()
+
+    def _title_words(self) -> List[Tuple[str, set]]:
+        version = self.registry.version()
+        with self._lock:
+            if version != self._version:
+                self._titles = [
+                    (document_id, set(WORD_PATTERN.findall(title.lower())))
+                    for document_id, title in self.registry.titles()
+                ]
+                self._version = version
+            return self._titles
+
+    def resolve_document(self, question: str) -> Optional[str]:
+        """
+        Find the paper a metadata question is about.
+
+        Args:
+            question: User's question
+
+        Returns:
+            ID of the paper named in the question, the only paper if there is
+            one, or None when the question is ambiguous
+        """
+        titles = self._title_words()
+        if len(titles) == 1:
+            return titles[0][0]
+        return self.match_title(question)
+
+    def match_title(self, text: str, exact: bool = False) -> Optional[str]:
+        """
+        Find the paper whose title a text names.
+
+        Args:
+            text: Question or part of a question
+            exact: Also require most of the text's words to be in the title
+
+        Returns:
+            ID of the best matching paper, or None if no title overlaps enough
+        """
+        text_words = set(WORD_PATTERN.findall(text.lower()))
+        best_id, best_overlap = None, 0.0
+        for document_id, words in self._title_words():
+            if not words:
+                continue
+            overlap = len(words & text_words) / len(words)
+            if exact:
+                overlap = min(overlap, len(words & text_words) / max(len(text_words), 1))
+            if overlap > best_overlap:
+                best_id, best_overlap = document_id, overlap
+        return best_id if best_overlap >= self.min_title_overlap else None
+
+    def answer(self, question: str, document_id: Optional[str] = None) -> Optional[str]:
+        """
+        Answer a pure metadata question from the registry.
+
+        Args:
+            question: User's question
+            document_id: Paper the conversation is about, if known
+
+        Returns:
+            Answer string, or None if the question needs the regular
+            retrieval path (not a metadata question, ambiguous paper, or the
+            field was not extracted)
+        """
+        field = classify_metadata_question(question)
+        if field is None:
+            # "who wrote <title>" is only a metadata question if the title is a registered paper
+            titled = TITLED_AUTHORS_PATTERN.fullmatch(normalize_question(question))
+            document_id = self.match_title(titled.group(1), exact=True) if titled else None
+            if document_id is None:
+                return None
+            field = "authors"
+
+        document_id = document_id or self.resolve_document(question)
+        document = self.registry.get(document_id) if document_id else None
+        if not document:
+            return None
+
+        value = document.get(field, "")
+        if value in MISSING_VALUES:
+            return None
+
+        logger.info(f"Answered {field} question for {document_id} from the document registry")
+        if field == "title":
+            return f"{FIELD_LABELS[field]} \"{value}\"."
+        return f"{FIELD_LABELS[field]}: {value} (paper: \"{document['title']}\")."
+
+
+# Shared by the web app and the CLI
+metadata_lookup = MetadataLookup()
@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+# Prefix of every exported metric name
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "scichat")
+# Upper bounds of the stage duration buckets, in seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic counter, one value per combination of label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        """
+        Args:
+            name: Metric name (without prefix)
+            description: Text of the HELP line
+            labels: Label names
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """
+        Add to the counter.
+
+        Args:
+            amount: Non-negative increment
+            **labels: Value of every label of the counter
+        """
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for some label values."""
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def samples(self, name: str) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labels:
+            values = [((), 0.0)]  # Export 0 before the first increment
+        return [f"{name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, one per combination
+    of label values, with their sum and count.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        """
+        Args:
+            name: Metric name (without prefix)
+            description: Text of the HELP line
+            labels: Label names
+            buckets: Increasing bucket upper bounds (+Inf is added)
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Label values -> (count per bucket, with a last +Inf bucket, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Record one observation.
+
+        Args:
+            value: Observed value, e.g. seconds
+            **labels: Value of every label of the histogram
+        """
+        key = tuple(str(labels[name]) for name in self.labels)
+        bucket = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bucket] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        """Return the number of observations for some label values."""
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            return sum(self._values[key][0]) if key in self._values else 0
+
+    def samples(self, name: str) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(counts), total[0]) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    In-process collection of counters and histograms, rendered in the
+    Prometheus text exposition format.
+
+    Metrics live in the memory of one process: each app worker exports its
+    own, and work done in ingestion subprocesses is timed by the caller.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        """
+        Args:
+            prefix: Prepended to every metric name, separated by an underscore
+        """
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        """Create and register a counter, see Counter."""
+        return self._register(Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        """Create and register a histogram, see Histogram."""
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self) -> str:
+        """
+        Export every metric.
+
+        Returns:
+            Metrics in the Prometheus text format (version 0.0.4)
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            name = f"{self.prefix}_{metric.name}" if self.prefix else metric.name
+            lines.append(f"# HELP {name} {metric.description}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every module of the process
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "stage_duration_seconds",
+    "Time spent in each stage of paper ingestion and question answering",
+    labels=("pipeline", "stage")
+)
+VECTORS_UPSERTED = metrics.counter("vectors_upserted_total", "Vectors written to the vector store")
+CACHE_LOOKUPS = metrics.counter(
+    "cache_lookups_total", "Answer and embedding cache lookups by result", labels=("cache", "result")
+)
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Estimated tokens sent to and generated by the LLM", labels=("purpose", "kind")
+)
+
+
+def observe_stage(pipeline: str, stage: str, seconds: float) -> None:
+    """
+    Record the duration of a pipeline stage.
+
+    Args:
+        pipeline: "ingest", "qa" or "summary"
+        stage: Stage name, e.g. "parse", "embed", "retrieve" or "generate"
+        seconds: Time spent in the stage
+    """
+    STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=stage)
+
+
+@contextmanager
+def timed(pipeline: str, stage: str, timings: Optional[Dict[str, Any]] = None) -> Iterator[None]:
+    """
+    Time a block as one stage, also when it raises.
+
+    Args:
+        pipeline: "ingest", "qa" or "summary"
+        stage: Stage name
+        timings: Per-request breakdown the seconds are added to under `stage`
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        observe_stage(pipeline, stage, seconds)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of lazily created models and clients.
+
+    Modules register a factory under a name at import time, which is cheap.
+    The factory only runs on the first `get`, and every later caller gets the
+    same instance. Each name has its own lock, so loading a slow model does
+    not block access to the others.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        """
+        Register the factory of a model or client.
+
+        Args:
+            name: Registry key, e.g. "embedding"
+            factory: Callable creating the instance on first use
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        """
+        Return the shared instance, creating it on first use.
+
+        Args:
+            name: Registry key
+
+        Returns:
+            The model or client
+
+        Raises:
+            KeyError: If nothing is registered under `name`
+        """
+        if name in self._instances:
+            return self._instances[name]
+
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"No model registered under '{name}'")
+            lock = self._locks[name]
+
+        with lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                logger.info(f"Loaded {name} in {time.perf_counter() - started:.2f}s")
+            return self._instances[name]
+
+    def is_loaded(self, name: str) -> bool:
+        """Return True if the instance registered under `name` was already created."""
+        return name in self._instances
+
+    def loaded(self) -> List[str]:
+        """Return the names of the instances created so far."""
+        return list(self._instances)
+
+    def unload(self, name: Optional[str] = None) -> None:
+        """
+        Drop created instances so the next `get` recreates them.
+
+        Args:
+            name: Registry key, or None to drop every instance
+        """
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+
+# Shared by every module of the process
+registry = ModelRegistry()
+
+
+def register_model(name: str, factory: Callable[[], Any]) -> None:
+    """Register a factory with the shared registry, see ModelRegistry.register."""
+    registry.register(name, factory)
+
+
+def get_model(name: str) -> Any:
+    """Return a shared instance from the registry, see ModelRegistry.get."""
+    return registry.get(name)
@@ -1,14 +1,23 @@
 import os
 from langchain_openai import OpenAI
 from langchain.chains import ConversationalRetrievalChain
-from langchain_pinecone import Pinecone
 from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-import pinecone
 from dotenv import load_dotenv
+import re
+import hashlib
 import logging
-from embedding_utils import determine_text_key
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from langchain_core.prompts import format_document
+from bm25_utils import tokenize
+from cache_utils import AnswerCache
+from chunk_utils import estimate_tokens
+from embedding_utils import determine_text_key, SentenceTransformerEmbeddings
+from metadata_utils import metadata_lookup
+from metrics_utils import LLM_TOKENS, observe_stage
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,27 +25,93 @@ logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
-pine_api_key = os.getenv("PINECONE_API_KEY")
-pine_env = os.getenv("PINECONE_ENVIRONMENT")
 openai_key = os.getenv("OPENAI_API_KEY")
 
-# Initialize embeddings model
-embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# LLM answering questions: "openai", or "fake" to stream a canned answer without an API key
+QA_LLM = os.getenv("QA_LLM", "openai").lower()
+# Delay between the characters streamed by the fake LLM, in seconds
+FAKE_LLM_DELAY = float(os.getenv("FAKE_LLM_DELAY", "0.01"))
+FAKE_LLM_ANSWER = ("This is a placeholder answer streamed by the fake LLM. It lets the streaming "
+                   "endpoint and the chat interface be exercised locally without an OpenAI API key.")
 
-# Initialize Pinecone
-try:
-    pine_env = os.getenv("PINECONE_ENVIRONMENT")
-    logger.info("Pinecone initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Pinecone: {str(e)}")
-    raise
+# Semantic answer cache, disabled when ANSWER_CACHE_MAX_ENTRIES is 0
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Minimum cosine similarity between a question and a cached one over the same chunks
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Follow-up handling: "auto" rewrites follow-ups locally when possible and
+# only calls the LLM for ones it cannot resolve, "llm" always calls the LLM
+CONDENSE_MODE = os.getenv("CONDENSE_MODE", "auto").lower()
+# Words pointing back at the conversation ("what are its limitations?")
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|theirs|this|that|these|those|he|she|his|her|former|latter|"
+    r"above|previous|same|aforementioned)\b"
+)
+# Openings continuing the previous question ("and for BERT?", "what about recall?")
+CONTINUATION_PATTERN = re.compile(
+    r"^(and|or|but|also|so|what about|how about|what else|anything else|why not|"
+    r"tell me more|more on|elaborate|go on|continue)\b"
+)
+# Words that do not say what a question is about
+QUESTION_WORDS = frozenset("what how why when where which who whom whose does do did could would should "
+                           "about more else tell me explain describe".split())
+# References to the paper itself, which retrieval resolves without the history
+PAPER_REFERENCE = re.compile(r"\b(this|the|that) (paper|work|study|article|publication|manuscript)\b")
+# Terms a follow-up needs besides its references to be rewritten without the LLM
+FOLLOW_UP_MIN_TERMS = 2
+
+# Query embeddings share the ingestion model, which is loaded on first use
+embedding = SentenceTransformerEmbeddings()
+
+# Answers generated for this process, shared by every request and created on first use
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """
+    Return the shared answer cache, creating it on first use.
+    
+    Returns:
+        AnswerCache instance, or None if ANSWER_CACHE_MAX_ENTRIES is 0
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None and ANSWER_CACHE_MAX_ENTRIES > 0:
+            _answer_cache = AnswerCache(
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                ttl=ANSWER_CACHE_TTL,
+                threshold=ANSWER_CACHE_THRESHOLD
+            )
+        return _answer_cache
+
+def create_llm():
+    """
+    Create the LLM used to condense questions and generate answers.
+    
+    Returns:
+        LangChain LLM selected by QA_LLM
+    """
+    if QA_LLM == "fake":
+        from langchain_core.language_models.fake import FakeStreamingListLLM
+        
+        logger.info("Using the fake LLM, answers are canned")
+        return FakeStreamingListLLM(responses=[FAKE_LLM_ANSWER], sleep=FAKE_LLM_DELAY)
+    
+    # Using OpenAI instead of ChatOpenAI and gpt-3.5-turbo-instruct,
+    # which is a completion model
+    return OpenAI(
+        model="gpt-3.5-turbo-instruct", 
+        temperature=0.3,
+        openai_api_key=openai_key
+    )
 
 def create_qa_chain(index):
     """
     Creates a ConversationalRetrievalChain for RAG.
     
     Args:
-        index: Pinecone index object
+        index: VectorStore holding the document embeddings
         
     Returns:
         ConversationalRetrievalChain object
@@ -74,22 +149,13 @@ def create_qa_chain(index):
             input_variables=["context", "question"]
         )
         
-        # Initialize the LLM (OpenAI model) - FIXED: Using OpenAI instead of ChatOpenAI
-        # and using gpt-3.5-turbo-instruct which is a completion model
-        llm = OpenAI(
-            model="gpt-3.5-turbo-instruct", 
-            temperature=0.3,
-            openai_api_key=openai_key
-        )
+        # Initialize the LLM
+        llm = create_llm()
         
-        # Create a retriever that wraps the Pinecone index
-        retriever = Pinecone(
-            index=index, 
-            embedding=embedding, 
-            text_key='text'
-        ).as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 10}  
+        # Create a retriever that wraps the vector store
+        retriever = index.as_retriever(
+            embedding=embedding,
+            search_kwargs={"k": 10}
         )
         
         # Create the conversational chain
@@ -109,7 +175,324 @@ def create_qa_chain(index):
         logger.error(f"Error creating QA chain: {str(e)}")
         raise
 
-def answer_question(qa_chain, question, chat_history, metadata_only=False):
+class QAChainRegistry:
+    """
+    Long-lived holder of the QA chain shared by every request.
+    
+    The chain (LLM client, retriever and prompt) is built once, on the first
+    call to `get` after the vector index becomes available, and reused until
+    `reset` is called. Per-request settings are applied to shallow copies by
+    `answer_question`, so the shared chain is never mutated.
+    """
+    
+    def __init__(self, index_provider: Callable[[], Any]):
+        """
+        Args:
+            index_provider: Callable returning the vector store, or None if it is not available yet
+        """
+        self._index_provider = index_provider
+        self._qa_chain = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        """
+        Return the shared QA chain, building it if needed.
+        
+        Returns:
+            ConversationalRetrievalChain, or None if the vector index is not available
+        """
+        if self._qa_chain is not None:
+            return self._qa_chain
+        with self._lock:
+            if self._qa_chain is None:
+                index = self._index_provider()
+                if not index:
+                    return None
+                self._qa_chain = create_qa_chain(index)
+            return self._qa_chain
+    
+    def reset(self) -> None:
+        """Drop the shared chain so the next `get` rebuilds it."""
+        with self._lock:
+            self._qa_chain = None
+
+def _copy_model(model, update: Dict[str, Any]):
+    """Shallow-copy a LangChain pydantic model with some fields replaced."""
+    if hasattr(model, "model_copy"):
+        return model.model_copy(update=update)
+    return model.copy(update=update)
+
+def scoped_chain(qa_chain, search_kwargs: Dict[str, Any]):
+    """
+    Return a request-scoped copy of the QA chain using its own search parameters.
+    
+    Only the chain and retriever objects are copied; the LLM client, vector
+    store and prompt are shared with the original chain.
+    
+    Args:
+        qa_chain: The shared ConversationalRetrievalChain
+        search_kwargs: Retriever search parameters for this request
+        
+    Returns:
+        ConversationalRetrievalChain copy
+    """
+    retriever = _copy_model(qa_chain.retriever, {"search_kwargs": search_kwargs})
+    return _copy_model(qa_chain, {"retriever": retriever})
+
+def build_search_kwargs(qa_chain, question: str, metadata_only: bool = False,
+                        document_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the retriever search parameters for a question.
+    
+    Args:
+        qa_chain: The shared ConversationalRetrievalChain
+        question: User's question
+        metadata_only: If True, only search specific metadata fields
+        document_id: Only retrieve from this paper, if given
+        
+    Returns:
+        New search_kwargs dictionary
+    """
+    search_kwargs = {key: value for key, value in qa_chain.retriever.search_kwargs.items() if key != "filter"}
+    search_filter = {}
+    if metadata_only:
+        text_key = determine_text_key(question)
+        logger.info(f"Metadata search: Using text_key '{text_key}'")
+        
+        # Focus the search on the specific field
+        search_filter["type"] = text_key
+    # For general questions, prioritize content chunks but don't exclude metadata
+    if document_id:
+        search_filter["document_id"] = document_id
+    if search_filter:
+        search_kwargs["filter"] = search_filter
+    return search_kwargs
+
+def format_chat_history(chat_history: Sequence[Tuple[str, str]]) -> str:
+    """
+    Render (question, answer) turns the way ConversationalRetrievalChain does.
+    
+    Args:
+        chat_history: Previous conversation turns
+        
+    Returns:
+        History text for the question-condensing prompt
+    """
+    return "".join(f"\nHuman: {human}\nAssistant: {ai}" for human, ai in chat_history)
+
+def rewrite_follow_up(question: str, chat_history: Sequence[Tuple[str, str]]) -> Optional[str]:
+    """
+    Make a follow-up question standalone without calling the LLM.
+    
+    Self-contained questions are kept as they are. Questions referring back
+    to the conversation that still name what they ask about ("what are its
+    main limitations?") get the previous question appended, which gives the
+    embedding, BM25 and the answer prompt the missing subject.
+    
+    Args:
+        question: User's question
+        chat_history: Previous conversation turns (not empty)
+        
+    Returns:
+        Standalone question, or None if the question is too elliptical
+        ("why?", "and them?") to be resolved without the LLM
+    """
+    text = PAPER_REFERENCE.sub(" ", question.lower()).strip()
+    continuation = CONTINUATION_PATTERN.match(text)
+    if not continuation and not REFERENCE_PATTERN.search(text):
+        # "Why?" or "Examples?" only make sense with the history
+        return question if len(text.split()) > 2 else None
+    
+    remainder = REFERENCE_PATTERN.sub(" ", CONTINUATION_PATTERN.sub(" ", text, count=1))
+    terms = [term for term in tokenize(remainder) if term not in QUESTION_WORDS]
+    if len(terms) < FOLLOW_UP_MIN_TERMS:
+        return None
+    previous_question = chat_history[-1][0]
+    return f"{question} (following up on: {previous_question})"
+
+def condense_question(qa_chain, question: str, chat_history: Sequence[Tuple[str, str]],
+                      mode: str = CONDENSE_MODE) -> Tuple[str, str]:
+    """
+    Rewrite a follow-up question into a standalone one.
+    
+    The first turn needs no rewriting. In "auto" mode follow-ups go through
+    rewrite_follow_up first and only fall back to the chain's LLM when it
+    cannot resolve them.
+    
+    Args:
+        qa_chain: The shared ConversationalRetrievalChain
+        question: User's question
+        chat_history: Previous conversation turns
+        mode: "auto" or "llm"
+        
+    Returns:
+        (standalone question, method), the method being "first_turn",
+        "heuristic" or "llm"
+    """
+    if not chat_history:
+        return question, "first_turn"
+    if mode == "auto":
+        rewritten = rewrite_follow_up(question, chat_history)
+        if rewritten is not None:
+            return rewritten, "heuristic"
+    
+    get_chat_history = qa_chain.get_chat_history or format_chat_history
+    generator = qa_chain.question_generator
+    inputs = {"question": question, "chat_history": get_chat_history(list(chat_history))}
+    standalone_question = generator.invoke(inputs)[generator.output_key]
+    LLM_TOKENS.inc(estimate_tokens(generator.prompt.format(**inputs)), purpose="condense", kind="prompt")
+    LLM_TOKENS.inc(estimate_tokens(standalone_question), purpose="condense", kind="completion")
+    return standalone_question, "llm"
+
+def retrieve_documents(qa_chain, question: str, search_kwargs: Dict[str, Any]) -> List[Document]:
+    """
+    Retrieve the context chunks of a standalone question.
+    
+    Args:
+        qa_chain: The shared ConversationalRetrievalChain
+        question: Standalone question
+        search_kwargs: Retriever search parameters for this request
+        
+    Returns:
+        Retrieved documents, best first
+    """
+    return scoped_chain(qa_chain, search_kwargs).retriever.invoke(question)
+
+def stream_combine_documents(qa_chain, question: str, documents: List[Document]) -> Iterator[str]:
+    """
+    Generate the answer from the retrieved chunks with the chain's LLM,
+    streaming it as it is produced.
+    
+    Builds the same prompt as the chain's "stuff" documents chain.
+    
+    Args:
+        qa_chain: The shared ConversationalRetrievalChain
+        question: Standalone question
+        documents: Retrieved documents
+        
+    Yields:
+        Pieces of the answer text
+    """
+    combine_chain = qa_chain.combine_docs_chain
+    context = combine_chain.document_separator.join(
+        format_document(document, combine_chain.document_prompt) for document in documents
+    )
+    llm_chain = combine_chain.llm_chain
+    prompt = llm_chain.prompt.format(**{combine_chain.document_variable_name: context, "question": question})
+    LLM_TOKENS.inc(estimate_tokens(prompt), purpose="answer", kind="prompt")
+    pieces = []
+    try:
+        for piece in llm_chain.llm.stream(prompt):
+            pieces.append(piece)
+            yield piece
+    finally:
+        # Also counted when the client disconnects mid-answer
+        LLM_TOKENS.inc(estimate_tokens("".join(pieces)), purpose="answer", kind="completion")
+
+def chunk_id(document: Document) -> str:
+    """
+    Identify a retrieved chunk by vector ID and content, for the answer cache.
+    
+    Args:
+        document: Retrieved document
+        
+    Returns:
+        "<vector id>:<content hash>", which changes when the chunk is re-indexed
+    """
+    vector_id = document.metadata.get("vector_id") or getattr(document, "id", None) or ""
+    content_hash = document.metadata.get("content_hash") or hashlib.sha256(
+        document.page_content.encode("utf-8")).hexdigest()
+    return f"{vector_id}:{content_hash}"
+
+def log_timings(question: str, timings: Dict[str, Any]) -> None:
+    """Log the per-stage timings recorded by stream_answer."""
+    stages = ", ".join(f"{stage} {1000 * seconds:.0f} ms" for stage, seconds in timings.items()
+                       if isinstance(seconds, float))
+    method = timings.get("condense_method")
+    logger.info(f"Answer stages for '{question[:50]}': {stages}" + (f" (condense: {method})" if method else ""))
+
+def stream_answer(qa_chain, question, chat_history, metadata_only=False, document_id=None,
+                  timings: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    """
+    Answer a question, streaming the answer as the LLM produces it.
+    
+    Runs the stages of the ConversationalRetrievalChain one by one: condense
+    the question, retrieve chunks, then generate the answer. Pure metadata
+    questions (title, authors, organizations, emails) are answered from the
+    document registry, and answers to similar questions over the same chunks
+    come from the answer cache, both without an LLM call and in one piece.
+    
+    Args:
+        qa_chain: The ConversationalRetrievalChain
+        question: User's question
+        chat_history: Previous conversation history
+        metadata_only: If True, only search specific metadata fields
+        document_id: Paper the conversation is about, if known; retrieval is restricted to it
+        timings: Filled with the seconds spent in each stage ("metadata",
+            "condense", "retrieve", "cache", "generate") and the
+            "condense_method" (see condense_question)
+        
+    Yields:
+        Pieces of the answer text
+    """
+    timings = {} if timings is None else timings
+    clock = time.perf_counter()
+    
+    def lap(stage: str) -> float:
+        nonlocal clock
+        now = time.perf_counter()
+        timings[stage] = now - clock
+        clock = now
+        observe_stage("qa", stage, timings[stage])
+        return timings[stage]
+    
+    # Fast path: a dictionary lookup instead of embedding, search and LLM
+    answer = metadata_lookup.answer(question, document_id=document_id)
+    lap("metadata")
+    if answer is not None:
+        log_timings(question, timings)
+        yield answer
+        return
+    
+    # Apply this request's search parameters to a copy of the shared chain
+    search_kwargs = build_search_kwargs(qa_chain, question, metadata_only=metadata_only, document_id=document_id)
+    standalone_question, timings["condense_method"] = condense_question(qa_chain, question, chat_history)
+    lap("condense")
+    documents = retrieve_documents(qa_chain, standalone_question, search_kwargs)
+    lap("retrieve")
+    
+    question_vector = None
+    chunk_ids = [chunk_id(document) for document in documents]
+    answer_cache = get_answer_cache()
+    if answer_cache is not None and documents:
+        # Served from the query embedding LRU, the retriever just embedded the same text
+        question_vector = embedding.embed_query(standalone_question)
+        answer = answer_cache.get(question_vector, chunk_ids, scope=document_id or "")
+        lap("cache")
+        if answer is not None:
+            logger.info(f"Answer cache hit for question: {question[:50]}...")
+            log_timings(question, timings)
+            yield answer
+            return
+    
+    # Get the answer
+    pieces = []
+    for piece in stream_combine_documents(qa_chain, standalone_question, documents):
+        pieces.append(piece)
+        yield piece
+    generate_seconds = lap("generate")
+    
+    # Only complete answers are cached, not ones abandoned by the client
+    if question_vector is not None:
+        answer_cache.put(
+            question_vector, chunk_ids, "".join(pieces),
+            document_ids=[document.metadata.get("document_id", "") for document in documents],
+            seconds=generate_seconds, scope=document_id or ""
+        )
+    log_timings(question, timings)
+
+def answer_question(qa_chain, question, chat_history, metadata_only=False, document_id=None,
+                    timings: Optional[Dict[str, Any]] = None):
     """
     Answer user questions based on the document.
     
@@ -118,32 +501,16 @@ def answer_question(qa_chain, question, chat_history, metadata_only=False):
         question: User's question
         chat_history: Previous conversation history
         metadata_only: If True, only search specific metadata fields
+        document_id: Paper the conversation is about, if known; retrieval is restricted to it
+        timings: Filled with per-stage timings, see stream_answer
         
     Returns:
         Answer string
     """
     try:
-        # Determine if this is a metadata-specific query
-        if metadata_only:
-            text_key = determine_text_key(question)
-            logger.info(f"Metadata search: Using text_key '{text_key}'")
-            
-            # Update the retriever's search parameters to focus on the specific field
-            qa_chain.retriever.search_kwargs["filter"] = {"type": text_key}
-        else:
-            # For general questions, prioritize content chunks but don't exclude metadata
-            if "filter" in qa_chain.retriever.search_kwargs:
-                qa_chain.retriever.search_kwargs.pop("filter")
-        
-        # Get the answer
-        result = qa_chain({"question": question, "chat_history": chat_history})
-        
-        # Enhance the answer with source information
-        answer = result["answer"]
-        
-        logger.info(f"Generated answer for question: {question[:50]}...")
-        return answer
+        return "".join(stream_answer(qa_chain, question, chat_history, metadata_only=metadata_only,
+                                     document_id=document_id, timings=timings))
     
     except Exception as e:
         logger.error(f"Error answering question: {str(e)}")
-        return f"I'm sorry, I encountered an error while processing your question. Error: {str(e)}"
\ No newline at end of file
+        return f"I'm sorry, I encountered an error while processing your question. Error: {str(e)}"
@@ -0,0 +1,283 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+DOCUMENT_REGISTRY_PATH = os.getenv("DOCUMENT_REGISTRY_PATH", os.path.join(os.getcwd(), "index", "documents.sqlite3"))
+
+# Columns of the documents table, in order
+COLUMNS = [
+    "id", "title", "authors", "organizations", "emails", "abstract", "source",
+    "page_count", "chunk_count", "vector_count", "content_hash", "created_at", "updated_at",
+]
+
+
+class DocumentRegistry:
+    """
+    Persistent catalogue of ingested documents backed by SQLite.
+
+    One row per document holds the extracted metadata plus page, chunk and
+    vector counts. It is written at ingestion time, after the document's
+    vectors are stored, so listing documents never has to query the vector
+    store. Section summaries are stored next to it, keyed by the content
+    hash of the text they were computed from, and dropped when the document
+    is re-ingested with different content.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (or create) the registry database.
+
+        Args:
+            path: Path to the SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, "
+            "title TEXT NOT NULL, "
+            "authors TEXT NOT NULL, "
+            "organizations TEXT NOT NULL, "
+            "emails TEXT NOT NULL, "
+            "abstract TEXT NOT NULL, "
+            "source TEXT NOT NULL, "
+            "page_count INTEGER NOT NULL, "
+            "chunk_count INTEGER NOT NULL, "
+            "vector_count INTEGER NOT NULL, "
+            "content_hash TEXT NOT NULL DEFAULT '', "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        # Registries created before content hashes were recorded
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "content_hash" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_updated_at ON documents (updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "document_id TEXT PRIMARY KEY, "
+            "content_hash TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "sections TEXT NOT NULL, "
+            "error TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info(f"Document registry opened at {path} with {self.count()} documents")
+
+    def upsert_many(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Insert or update documents, keeping the creation time of existing ones.
+
+        The summaries of documents whose content hash changed are deleted, so
+        they are recomputed from the new content.
+
+        Args:
+            records: Dictionaries from document_record
+        """
+        if not records:
+            return
+        now = time.time()
+        rows = [
+            tuple(record.get(column, "") for column in COLUMNS[:-2]) + (now, now)
+            for record in records
+        ]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:] if column != "created_at")
+        hashes = {record["id"]: record["content_hash"] for record in records if record.get("content_hash")}
+        with self._lock:
+            ids = list(hashes)
+            stale = []
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                stale.extend(
+                    row["id"] for row in self._conn.execute(
+                        f"SELECT id, content_hash FROM documents WHERE id IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    if row["content_hash"] != hashes[row["id"]]
+                )
+            if stale:
+                self._conn.executemany("DELETE FROM summaries WHERE document_id = ?", [(document_id,) for document_id in stale])
+                logger.info(f"Dropped the summaries of {len(stale)} re-ingested documents whose content changed")
+            self._conn.executemany(
+                f"INSERT INTO documents ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}",
+                rows
+            )
+            self._conn.commit()
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a document by ID.
+
+        Args:
+            document_id: ID of the document
+
+        Returns:
+            Document dictionary, or None if it is not registered
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE id = ?", (document_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """
+        List documents, most recently added first.
+
+        Args:
+            limit: Maximum number of documents to return
+            offset: Number of documents to skip
+
+        Returns:
+            List of document dictionaries
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents ORDER BY created_at DESC, id LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def titles(self) -> List[Tuple[str, str]]:
+        """Return (document ID, title) pairs of every document."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute("SELECT id, title FROM documents").fetchall()]
+
+    def version(self) -> Tuple[int, float]:
+        """
+        Return a cheap fingerprint of the registry contents.
+
+        Returns:
+            (number of documents, latest update time), which changes whenever
+            a document is added, updated or deleted, also by other processes
+        """
+        with self._lock:
+            count, updated_at = self._conn.execute("SELECT COUNT(*), MAX(updated_at) FROM documents").fetchone()
+        return count, updated_at or 0.0
+
+    def count(self) -> int:
+        """Return the number of registered documents."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def delete(self, document_id: str) -> None:
+        """
+        Remove a document from the registry.
+
+        Args:
+            document_id: ID of the document
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            self._conn.execute("DELETE FROM summaries WHERE document_id = ?", (document_id,))
+            self._conn.commit()
+
+    def get_summary(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up the stored section summaries of a document.
+
+        Args:
+            document_id: ID of the document
+
+        Returns:
+            Dictionary with document_id, content_hash, status ("completed",
+            "partial" or "failed"), sections (title -> summary), error and updated_at, or
+            None if the document was never summarized
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM summaries WHERE document_id = ?", (document_id,)).fetchone()
+        if not row:
+            return None
+        summary = dict(row)
+        summary["sections"] = json.loads(summary["sections"])
+        return summary
+
+    def put_summary(self, document_id: str, content_hash: str, status: str,
+                    sections: Optional[Dict[str, str]] = None, error: str = "") -> None:
+        """
+        Store the section summaries of a document, replacing older ones.
+
+        Args:
+            document_id: ID of the document
+            content_hash: Hash of the content the summaries were computed from
+            status: "completed", "partial" (some sections failed) or "failed"
+            sections: Section title -> summary
+            error: Error message of a failed summarization
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (document_id, content_hash, status, sections, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (document_id, content_hash, status, json.dumps(sections or {}), error, time.time())
+            )
+            self._conn.commit()
+
+
+def document_record(document: Dict[str, Any], entries: List[Tuple[str, str, Dict[str, Any]]],
+                    source: str = "") -> Dict[str, Any]:
+    """
+    Build the registry row of a document from its extracted data and vector entries.
+
+    Args:
+        document: Document dictionary, see file_utils.build_document_data
+        entries: All (vector id, text, metadata) entries of the document
+        source: Original file name of an upload (default: the document's "source", the absolute path of the PDF)
+
+    Returns:
+        Dictionary with the registry columns (timestamps are set on write)
+    """
+    pages = document.get("pages")
+    return {
+        "id": document["id"],
+        "title": document.get("title", ""),
+        "authors": document.get("authors", ""),
+        "organizations": document.get("organizations", ""),
+        "emails": document.get("emails", ""),
+        "abstract": document.get("content", ""),
+        "source": source or document.get("source", ""),
+        "page_count": len(pages) if pages is not None else 0,
+        "chunk_count": sum(1 for _, _, metadata in entries if metadata["type"] == "chunk"),
+        "vector_count": len(entries),
+        "content_hash": hashlib.sha256("\n".join(sorted(
+            f"{vector_id}:{metadata.get('content_hash', '')}" for vector_id, _, metadata in entries
+        )).encode("utf-8")).hexdigest(),
+    }
+
+
+_registry: Optional[DocumentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_document_registry() -> DocumentRegistry:
+    """
+    Return the shared document registry, opening it on first use.
+
+    Returns:
+        DocumentRegistry at DOCUMENT_REGISTRY_PATH
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DocumentRegistry(DOCUMENT_REGISTRY_PATH)
+        return _registry
@@ -160,11 +160,11 @@ function showSection(element) {
 // API functions
 async function loadPapers() {
     try {
-        const response = await fetch('/documents');
+        const response = await fetch('/documents?limit=100');
         papers = await response.json();
         
-        // Update stats
-        stats.paperCount = papers.length;
+        // Update stats, the registry reports the total beyond the first page
+        stats.paperCount = parseInt(response.headers.get('X-Total-Count') || papers.length, 10);
         
         // Update UI
         updatePapersTable();
@@ -200,6 +200,80 @@ async function askQuestion(question, conversationId, metadata = false) {
     }
 }
 
+// Stream an answer from /ask/stream (Server-Sent Events), calling onToken
+// with each piece of text as it arrives
+async function askQuestionStream(question, conversationId, onToken, metadata = false) {
+    const started = performance.now();
+    let firstTokenAt = null;
+    let answer = '';
+    
+    const response = await fetch('/ask/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify({
+            question: question,
+            conversation_id: conversationId,
+            metadata_only: metadata
+        }),
+    });
+    if (!response.ok || !response.body) {
+        throw new Error(`Streaming request failed with status ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+    
+    while (result === null) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            const payload = data ? JSON.parse(data) : {};
+            
+            if (event === 'token') {
+                if (firstTokenAt === null) {
+                    firstTokenAt = performance.now();
+                    console.info(`Time to first token: ${Math.round(firstTokenAt - started)} ms`);
+                }
+                answer += payload.token;
+                onToken(payload.token);
+            } else if (event === 'done') {
+                result = payload;
+            } else if (event === 'error') {
+                throw new Error(payload.detail);
+            }
+        }
+    }
+    
+    console.info(`Total answer latency: ${Math.round(performance.now() - started)} ms`);
+    return {
+        answer: result ? result.answer : answer,
+        conversation_id: result ? result.conversation_id : conversationId
+    };
+}
+
 // Chat functions
 function createNewConversation() {
     currentConversationId = generateUUID();
@@ -272,6 +346,8 @@ function appendMessage(sender, text) {
         stats.questionCount++;
         updateDashboardStats();
     }
+    
+    return textEl;
 }
 
 async function sendMessage() {
@@ -294,14 +370,43 @@ async function sendMessage() {
     chatMessagesEl.appendChild(typingIndicator);
     chatMessagesEl.scrollTop = chatMessagesEl.scrollHeight;
     
-    // Get answer from API
-    const response = await askQuestion(question, currentConversationId);
-    
-    // Remove typing indicator
-    chatMessagesEl.removeChild(typingIndicator);
-    
-    // Add bot message to chat
-    appendMessage('bot', response.answer);
+    // Stream the answer into a bot message as it is generated
+    let textEl = null;
+    const conversation = conversations[currentConversationId];
+    try {
+        const response = await askQuestionStream(question, currentConversationId, token => {
+            if (textEl === null) {
+                chatMessagesEl.removeChild(typingIndicator);
+                textEl = appendMessage('bot', '');
+            }
+            textEl.textContent += token;
+            chatMessagesEl.scrollTop = chatMessagesEl.scrollHeight;
+        });
+        
+        if (textEl === null) {
+            chatMessagesEl.removeChild(typingIndicator);
+            textEl = appendMessage('bot', '');
+        }
+        textEl.textContent = response.answer;
+        
+        // Keep the complete answer in the stored conversation
+        if (conversation) {
+            conversation.messages[conversation.messages.length - 1].text = response.answer;
+        }
+    } catch (error) {
+        console.error('Error streaming answer, falling back to /ask:', error);
+        if (textEl === null) {
+            // Nothing was shown yet, ask again without streaming
+            const response = await askQuestion(question, currentConversationId);
+            chatMessagesEl.removeChild(typingIndicator);
+            appendMessage('bot', response.answer);
+        } else {
+            textEl.textContent += ' [The answer was interrupted.]';
+            if (conversation) {
+                conversation.messages[conversation.messages.length - 1].text = textEl.textContent;
+            }
+        }
+    }
 }
 
 // Upload functions
@@ -350,6 +455,9 @@ async function uploadPaper(event) {
         // Clear progress interval
         clearInterval(progressInterval);
         
+        if (response.status === 429) {
+            throw new Error('Too many papers are being processed, please retry shortly');
+        }
         if (!response.ok) {
             throw new Error('Upload failed');
         }
@@ -358,8 +466,9 @@ async function uploadPaper(event) {
         uploadProgressEl.style.width = '100%';
         uploadStatusEl.textContent = 'Processing...';
         
-        // Get paper details
-        const paperData = await response.json();
+        // Wait for the background job to extract the paper details
+        const upload = await response.json();
+        const paperData = await waitForJob(upload.job_id);
         
         // Update UI
         uploadStatusEl.textContent = 'Upload complete!';
@@ -394,6 +503,34 @@ async function uploadPaper(event) {
     }
 }
 
+// Poll an ingestion job until it completes, returning the paper details
+async function waitForJob(jobId) {
+    const stageLabels = {
+        parsed: 'Parsing complete, extracting metadata...',
+        extracted: 'Metadata extracted, generating embeddings...',
+        embedded: 'Embeddings generated, indexing...',
+        indexed: 'Indexed'
+    };
+    
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error('Could not get processing status');
+        }
+        
+        const job = await response.json();
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Processing failed');
+        }
+        if (job.status === 'completed') {
+            return job.document;
+        }
+        
+        uploadStatusEl.textContent = stageLabels[job.stage] || 'Waiting for a worker...';
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // UI update functions
 function updatePapersTable() {
     papersTableBodyEl.innerHTML = '';
@@ -1,28 +1,47 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os
+import time
+import random
+import hashlib
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
 from langchain_openai import OpenAI
 from config import OPENAI_API_KEY
+from chunk_utils import split_documents, estimate_tokens
+from metrics_utils import LLM_TOKENS, observe_stage
+from model_utils import register_model, get_model
+from registry_utils import DocumentRegistry, get_document_registry
 
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
-def summarize_sections(documents, section_titles):
-    """
-    Summarize each section of the paper using LangChain with GPT-3.5 Turbo.
-    """
-    for document in documents:
-        lines = document.page_content.split("\n")
-        # Skip the first 5 lines *only if* they contain metadata (title, authors, etc.)
-        if "Abstract" not in lines[0:5]:  # Ensure you're not skipping the Abstract
-            document.page_content = "\n".join(lines[5:])
-        
-        
-    # Split the document into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=150)
-    chunks = text_splitter.split_documents(documents)
-
-    # Initialize a dictionary to store section-wise content
-    summaries = {}
+# Token budget of the chunks a section summary is built from
+SUMMARY_CHUNK_TOKENS = 500
+# Section summaries requested from the LLM at the same time
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Retries of a failed section request, with exponential backoff from SUMMARY_RETRY_DELAY seconds
+SUMMARY_MAX_RETRIES = int(os.getenv("SUMMARY_MAX_RETRIES", "3"))
+SUMMARY_RETRY_DELAY = float(os.getenv("SUMMARY_RETRY_DELAY", "1.0"))
+
+# Sections summarized for every paper, with the fallback titles tried in order
+SECTION_TITLES = {
+    "Abstract": ["Summary"],
+    "Introduction": ["Background", "Motivation"],
+    "Methods": ["Methodology", "Method", "Approach", "Model"],
+    "Results": ["Experiments", "Evaluation", "Findings"],
+    "Discussion": ["Analysis", "Limitations"],
+    "Conclusion": ["Conclusions", "Future Work"],
+}
+# Part of the content hash, bump it when the prompt or model changes
+SUMMARY_VERSION = "1"
 
+
+def _create_summarization_chain():
     # Initialize LangChain LLM
     llm = OpenAI(model="gpt-3.5-turbo-instruct", temperature=0.3, max_tokens =300, openai_api_key=OPENAI_API_KEY)
 
@@ -38,29 +57,217 @@ def summarize_sections(documents, section_titles):
         )
     )
 
-    summarization_chain = LLMChain(llm=llm, prompt=prompt_template)
+    return LLMChain(llm=llm, prompt=prompt_template)
+
 
+# The LLM client is created on first use and shared by every summary
+register_model("summarization", _create_summarization_chain)
+
+
+def assign_sections(chunks, section_titles: Dict[str, List[str]]) -> Dict[str, str]:
+    """
+    Collect the text of each section in one pass over the chunks.
+
+    A section takes the chunks under a heading matching its title, else the
+    chunks mentioning its title, trying each fallback title in order.
+
+    Args:
+        chunks: Chunk Documents with a "section" metadata field
+        section_titles: Section title -> list of fallback titles
+
+    Returns:
+        Section title -> concatenated text ("" when nothing matched)
+    """
+    options = {option.lower() for title, fallbacks in section_titles.items() for option in [title] + fallbacks}
+    by_heading: Dict[str, List[str]] = {option: [] for option in options}
+    by_content: Dict[str, List[str]] = {option: [] for option in options}
+
+    # Lowercase every chunk once, and test it against every title option
+    for chunk in chunks:
+        heading = chunk.metadata["section"].lower()
+        content = chunk.page_content.lower()
+        for option in options:
+            if option in heading:
+                by_heading[option].append(chunk.page_content)
+            if option in content:
+                by_content[option].append(chunk.page_content)
+
+    sections = {}
     for section_title, fallbacks in section_titles.items():
-        # Extract all chunks for the primary or fallback titles
-        section_text = None
+        sections[section_title] = ""
         for title_option in [section_title] + fallbacks:
-            section_text = " ".join([
-                chunk.page_content for chunk in chunks
-                if title_option.lower() in chunk.page_content.lower()
-            ])
+            # Prefer chunks under a matching heading, then chunks mentioning the title
+            option = title_option.lower()
+            section_text = " ".join(by_heading[option]) or " ".join(by_content[option])
             if section_text.strip():  # If content is found, stop looking at fallbacks
+                sections[section_title] = section_text
                 break
-        
+    return sections
+
+
+async def _summarize_section(chain, semaphore: asyncio.Semaphore, section_title: str, content: str,
+                             max_retries: int) -> str:
+    """Summarize one section, retrying failed requests with exponential backoff."""
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            try:
+                started = time.perf_counter()
+                inputs = {"section_title": section_title, "content": content}
+                summary = (await chain.ainvoke(inputs))[chain.output_key]
+                seconds = time.perf_counter() - started
+                observe_stage("summary", "section", seconds)
+                LLM_TOKENS.inc(estimate_tokens(chain.prompt.format(**inputs)), purpose="summary", kind="prompt")
+                LLM_TOKENS.inc(estimate_tokens(summary), purpose="summary", kind="completion")
+                logger.info(f"Summarized section '{section_title}' in {seconds:.1f}s")
+                return summary
+            except Exception as e:
+                if attempt == max_retries:
+                    logger.error(f"Error summarizing section '{section_title}': {str(e)}")
+                    raise
+                # Jitter keeps parallel retries from hitting a rate limit together
+                delay = SUMMARY_RETRY_DELAY * 2 ** attempt * (1 + random.random())
+                logger.warning(f"Retrying section '{section_title}' in {delay:.1f}s after error: {str(e)}")
+                await asyncio.sleep(delay)
+
+
+async def summarize_sections_async(documents, section_titles, max_concurrency: int = SUMMARY_CONCURRENCY,
+                                   max_retries: int = SUMMARY_MAX_RETRIES,
+                                   errors: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Summarize each section of the paper with concurrent LLM requests.
+
+    A section whose requests keep failing does not cancel the others: it is
+    left out of the result and its error recorded in `errors`.
+
+    Args:
+        documents: One Document per page, in reading order (left unmodified)
+        section_titles: Section title -> list of fallback titles
+        max_concurrency: Maximum number of section requests in flight
+        max_retries: Retries of a failed section request
+        errors: Optional dictionary receiving section title -> error message of failed sections
+
+    Returns:
+        Section title -> summary, in the order of `section_titles`, without the failed sections
+    """
+    pages = []
+    for document in documents:
+        lines = document.page_content.split("\n")
+        # Skip the first 5 lines *only if* they contain metadata (title, authors, etc.)
+        if "Abstract" not in lines[0:5]:  # Ensure you're not skipping the Abstract
+            lines = lines[5:]
+        pages.append(Document(page_content="\n".join(lines), metadata=dict(document.metadata)))
+
+    # Split the document into section-aligned chunks
+    chunks = split_documents(pages, max_tokens=SUMMARY_CHUNK_TOKENS)
+    sections = assign_sections(chunks, section_titles)
 
-        # Summarize content for other sections
-        if section_text and section_text.strip():
-            summaries[section_title] = summarization_chain.run({
-                "section_title": section_title,
-                "content": section_text
-            })
+    chain = get_model("summarization")
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    started = time.perf_counter()
+    found = [title for title, text in sections.items() if text.strip()]
+    results = await asyncio.gather(*(
+        _summarize_section(chain, semaphore, title, sections[title], max_retries) for title in found
+    ), return_exceptions=True)
 
-        # Handle missing content
+    summaries = {}
+    for title, result in zip(found, results):
+        if isinstance(result, Exception):
+            if errors is not None:
+                errors[title] = str(result)
         else:
-            summaries[section_title] = f"No content found for {section_title}."
+            summaries[title] = result
+    logger.info(f"Summarized {len(summaries)} of {len(found)} sections in {time.perf_counter() - started:.1f}s")
+
+    # Handle missing content
+    return {
+        title: summaries.get(title, f"No content found for {title}.")
+        for title in section_titles
+        if title in summaries or title not in found
+    }
+
+
+def summarize_sections(documents, section_titles, errors: Optional[Dict[str, str]] = None):
+    """
+    Summarize each section of the paper using LangChain with GPT-3.5 Turbo.
+
+    Blocking wrapper around summarize_sections_async, for callers without an
+    event loop (or in a worker thread).
+    """
+    return asyncio.run(summarize_sections_async(documents, section_titles, errors=errors))
+
+
+def summary_content_hash(pages: List[str], section_titles: Dict[str, List[str]] = SECTION_TITLES) -> str:
+    """
+    Hash the inputs of a paper's summaries.
+
+    Args:
+        pages: Page texts of the paper
+        section_titles: Sections that are summarized
+
+    Returns:
+        Hex digest that changes when the paper, the sections or the summary settings change
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{SUMMARY_VERSION}\0{SUMMARY_CHUNK_TOKENS}\0".encode("utf-8"))
+    for title, fallbacks in section_titles.items():
+        digest.update(("\0".join([title] + fallbacks) + "\n").encode("utf-8"))
+    for page in pages:
+        digest.update(page.encode("utf-8"))
+        digest.update(b"\f")
+    return digest.hexdigest()
+
+
+def summarize_document(document_id: str, pages: List[str], registry: Optional[DocumentRegistry] = None,
+                       force: bool = False) -> Dict[str, str]:
+    """
+    Summarize a paper's sections and store them in the document registry.
+
+    Summaries already stored for the same content are returned without any
+    LLM call. When some sections fail, the others are stored with the
+    "partial" status, and the next call only summarizes the failed ones.
+
+    Args:
+        document_id: ID of the document
+        pages: Page texts of the paper
+        registry: Document registry (default: the shared one)
+        force: Recompute even if summaries of the same content are stored
+
+    Returns:
+        Section title -> summary, without the sections that failed
+    """
+    registry = registry or get_document_registry()
+    content_hash = summary_content_hash(pages)
+    stored = registry.get_summary(document_id)
+    previous: Dict[str, str] = {}
+    if not force and stored and stored["content_hash"] == content_hash:
+        if stored["status"] == "completed":
+            logger.info(f"Summaries of document {document_id} are up to date")
+            return stored["sections"]
+        if stored["status"] == "partial":
+            previous = stored["sections"]
+
+    documents = [
+        Document(page_content=page, metadata={"document_id": document_id, "page": number})
+        for number, page in enumerate(pages, start=1)
+    ]
+    missing = {title: fallbacks for title, fallbacks in SECTION_TITLES.items() if title not in previous}
+    errors: Dict[str, str] = {}
+    try:
+        summaries = summarize_sections(documents, missing, errors=errors)
+    except Exception as e:
+        registry.put_summary(document_id, content_hash, "partial" if previous else "failed", previous, error=str(e))
+        raise
+
+    summaries.update(previous)
+    sections = {title: summaries[title] for title in SECTION_TITLES if title in summaries}
+    if not errors:
+        registry.put_summary(document_id, content_hash, "completed", sections)
+        return sections
 
-    return summaries
\ No newline at end of file
+    error = "; ".join(f"{title}: {message}" for title, message in errors.items())
+    if not sections:
+        registry.put_summary(document_id, content_hash, "failed", error=error)
+        raise RuntimeError(f"Every section failed: {error}")
+    logger.warning(f"Stored partial summaries of document {document_id}, failed sections: {', '.join(errors)}")
+    registry.put_summary(document_id, content_hash, "partial", sections, error=error)
+    return sections
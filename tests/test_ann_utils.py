@@ -0,0 +1,57 @@
+import numpy as np
+
+from ann_utils import IVFFlatIndex
+
+
+def normalized(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_index(nlist=8):
+    rng = np.random.default_rng(0)
+    vectors = normalized(rng.standard_normal((400, 16)).astype(np.float32))
+    index = IVFFlatIndex(16, nlist=nlist, nprobe=2)
+    index.train(vectors)
+    index.add(range(len(vectors)), vectors)
+    return index, vectors
+
+
+def test_probing_every_list_returns_every_row():
+    index, vectors = make_index()
+    rows = index.search_rows(vectors[0], nprobe=index.nlist)
+    assert sorted(rows.tolist()) == list(range(len(vectors)))
+
+
+def test_candidates_contain_the_nearest_neighbour():
+    index, vectors = make_index()
+    for row in range(0, len(vectors), 40):
+        assert row in index.search_rows(vectors[row]).tolist()
+    assert len(index.search_rows(vectors[0])) < len(vectors)
+
+
+def test_removed_rows_are_not_returned():
+    index, vectors = make_index()
+    index.remove([0, 1])
+    rows = index.search_rows(vectors[0], nprobe=index.nlist).tolist()
+    assert 0 not in rows and 1 not in rows
+    assert len(rows) == len(vectors) - 2
+
+
+def test_compact_renumbers_rows():
+    index, vectors = make_index()
+    index.remove([0])
+    index.compact(list(range(1, len(vectors))))
+    rows = index.search_rows(vectors[5], nprobe=index.nlist)
+    assert sorted(rows.tolist()) == list(range(len(vectors) - 1))
+    # Old row 5 is row 4 now, still in the list closest to its vector
+    assert 4 in index.search_rows(vectors[5]).tolist()
+
+
+def test_automatic_nlist_retrains_after_growth():
+    index, vectors = make_index(nlist=0)
+    assert index.nlist == int(4 * np.sqrt(len(vectors)))
+    assert not index.needs_retraining(len(vectors))
+    assert index.needs_retraining(5 * len(vectors))
+
+    fixed, vectors = make_index(nlist=8)
+    assert not fixed.needs_retraining(100 * len(vectors))
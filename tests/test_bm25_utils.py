@@ -0,0 +1,108 @@
+from bm25_utils import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def make_index(directory=None):
+    index = BM25Index(directory)
+    index.add([
+        ("a_chunk_0", "a", "Transformers rely on self-attention instead of recurrence."),
+        ("a_chunk_1", "a", "We train on ImageNet-1k with a p-value below 0.05."),
+        ("b_chunk_0", "b", "Recurrent networks process tokens one at a time."),
+    ])
+    return index
+
+
+def test_tokenize_keeps_compound_terms_and_drops_stopwords():
+    assert tokenize("The ImageNet-1k p-value of 3.14 and BRCA1") == ["imagenet-1k", "p-value", "3.14", "brca1"]
+
+
+def test_search_ranks_matching_chunks():
+    index = make_index()
+    results = index.search("self-attention transformers")
+    assert [vector_id for vector_id, _ in results] == ["a_chunk_0"]
+    assert index.search("the of and") == []
+
+
+def test_search_restricted_to_a_document():
+    index = make_index()
+    assert [vector_id for vector_id, _ in index.search("tokens recurrence", document_id="b")] == ["b_chunk_0"]
+    assert index.search("imagenet-1k", document_id="b") == []
+
+
+def test_remove_and_re_add():
+    index = make_index()
+    index.remove(["a_chunk_1"])
+    assert "a_chunk_1" not in index
+    assert index.search("imagenet-1k") == []
+    index.add([("a_chunk_0", "a", "Convolutions everywhere.")])
+    assert index.search("transformers") == []
+    assert index.search("convolutions")[0][0] == "a_chunk_0"
+    index.remove_document("a")
+    assert len(index) == 1
+
+
+def test_persist_compacts_and_reloads(tmp_path):
+    index = make_index(str(tmp_path))
+    index.remove(["a_chunk_1"])
+    index.persist()
+    reopened = BM25Index(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.search("transformers")[0][0] == "a_chunk_0"
+    assert reopened.search("imagenet-1k") == []
+
+
+def test_refresh_picks_up_another_writer(tmp_path):
+    reader = make_index(str(tmp_path))
+    reader.persist()
+    writer = BM25Index(str(tmp_path))
+    writer.add([("c_chunk_0", "c", "Diffusion models denoise images.")])
+    writer.persist()
+    assert reader.search("diffusion") == []
+    assert reader.refresh()
+    assert reader.search("diffusion")[0][0] == "c_chunk_0"
+    assert not reader.refresh()
+
+
+def test_refresh_keeps_unsaved_changes(tmp_path):
+    reader = make_index(str(tmp_path))
+    reader.persist()
+    writer = BM25Index(str(tmp_path))
+    writer.remove_document("a")
+    writer.persist()
+    reader.add([("d_chunk_0", "d", "Unsaved chunk.")])
+    assert not reader.refresh()
+    assert "d_chunk_0" in reader
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    assert [vector_id for vector_id, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_concurrent_persists_keep_both_processes_changes(tmp_path):
+    first = make_index(str(tmp_path))
+    first.persist()
+    second = BM25Index(str(tmp_path))
+
+    first.add([("c_chunk_0", "c", "Convolutions share weights across positions.")])
+    first.persist()
+    second.remove_document("b")
+    second.add([("d_chunk_0", "d", "Dropout regularizes large networks.")])
+    second.persist()
+
+    merged = BM25Index(str(tmp_path))
+    assert merged.search("convolutions") and merged.search("dropout")
+    assert merged.search("recurrent tokens") == []
+
+
+def test_refresh_reloads_a_newer_version(tmp_path):
+    reader = make_index(str(tmp_path))
+    reader.persist()
+    writer = BM25Index(str(tmp_path))
+    writer.add([("c_chunk_0", "c", "Convolutions share weights across positions.")])
+    writer.persist()
+
+    assert reader.search("convolutions") == []
+    reader.refresh()
+    assert [vector_id for vector_id, _ in reader.search("convolutions")] == ["c_chunk_0"]
@@ -0,0 +1,77 @@
+import numpy as np
+
+from cache_utils import AnswerCache, EmbeddingCache
+
+QUESTION = [1.0, 0.0, 0.0]
+CHUNKS = ["a_chunk_0:hash0", "a_chunk_1:hash1"]
+
+
+def test_answer_cache_is_scoped():
+    cache = AnswerCache()
+    cache.put(QUESTION, CHUNKS, "Answer about paper a", document_ids=["a"], scope="a")
+    assert cache.get(QUESTION, CHUNKS, scope="a") == "Answer about paper a"
+    assert cache.get(QUESTION, CHUNKS) is None
+    assert cache.get(QUESTION, CHUNKS, scope="b") is None
+
+
+def test_answer_cache_matches_similar_questions_over_the_same_chunks():
+    cache = AnswerCache(threshold=0.95)
+    cache.put(QUESTION, CHUNKS, "Answer")
+    assert cache.get([0.99, 0.05, 0.0], list(reversed(CHUNKS))) == "Answer"
+    assert cache.get([0.0, 1.0, 0.0], CHUNKS) is None
+    assert cache.get(QUESTION, CHUNKS[:1]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2)
+    cache.put(QUESTION, ["a"], "A")
+    cache.put(QUESTION, ["b"], "B")
+    assert cache.get(QUESTION, ["a"]) == "A"
+    cache.put(QUESTION, ["c"], "C")
+    assert cache.get(QUESTION, ["b"]) is None
+    assert cache.get(QUESTION, ["a"]) == "A"
+    assert cache.evictions == 1
+
+
+def test_answer_cache_expires_entries(clock):
+    cache = AnswerCache(ttl=60)
+    cache.put(QUESTION, CHUNKS, "Answer")
+    clock.now += 59
+    assert cache.get(QUESTION, CHUNKS) == "Answer"
+    clock.now += 2
+    assert cache.get(QUESTION, CHUNKS) is None
+    assert cache.expirations == 1
+
+
+def test_answer_cache_invalidates_documents():
+    cache = AnswerCache()
+    cache.put(QUESTION, ["a"], "A", document_ids=["a"])
+    cache.put(QUESTION, ["b"], "B", document_ids=["b"])
+    assert cache.invalidate_documents(["a"]) == 1
+    assert cache.get(QUESTION, ["a"]) is None
+    assert cache.get(QUESTION, ["b"]) == "B"
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), dimension=3)
+    vectors = np.asarray([[1, 2, 3], [4, 5, 6]], dtype=np.float32)
+    cache.put_many("model", ["first", "second"], vectors)
+    found = cache.get_many("model", ["second", "missing", "first"])
+    assert sorted(found) == [0, 2]
+    np.testing.assert_array_equal(found[0], vectors[1])
+    assert cache.get_many("other-model", ["first"]) == {}
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries=2, dimension=1)
+    cache.put_many("model", ["a"], np.ones((1, 1)))
+    clock.now += 1
+    cache.put_many("model", ["b"], np.ones((1, 1)))
+    clock.now += 1
+    cache.get_many("model", ["a"])
+    clock.now += 1
+    cache.put_many("model", ["c"], np.ones((1, 1)))
+    assert sorted(cache.get_many("model", ["a", "b", "c"])) == [0, 2]
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
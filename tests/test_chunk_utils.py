@@ -0,0 +1,75 @@
+import pytest
+
+from chunk_utils import is_heading, iter_structured_chunks, split_sentences
+
+PAGES = [
+    """Efficient Sparse Attention for Long Documents
+Abstract
+We study attention over long inputs. Our method scales lin-
+early with the sequence length.
+1 Introduction
+Transformers are expensive on long documents. We make three contributions:
+1 We propose a sparse attention pattern
+2 We evaluate it on three benchmarks
+3 We release the code
+""",
+    """3 Method
+3.1 Training details
+We train for 10 epochs with a batch size of 32. The learning rate is 0.001.
+Table 1: Accuracy on ImageNet.
+Model Top-1 Top-5
+1 ResNet 76 93
+2 ViT 81 95
+4 Results on ImageNet-1k
+Sparse attention matches dense attention. It is 3 times faster.
+""",
+]
+
+
+@pytest.mark.parametrize("line", [
+    "Abstract",
+    "RELATED WORK",
+    "1 Introduction",
+    "2.1. Training Data",
+    "3.1 Training details",
+    "IV. RESULTS",
+    "A. Proofs",
+    "4 Results on ImageNet-1k",
+])
+def test_detects_headings(line):
+    assert is_heading(line)
+
+
+@pytest.mark.parametrize("line", [
+    "1 ResNet 76 93",
+    "2 ViT 81.2 95.0",
+    "1 We propose a sparse attention pattern",
+    "A Transformer based model",
+    "3 times faster than the baseline",
+    "Table 1: Accuracy on ImageNet.",
+    "We train for 10 epochs.",
+])
+def test_rejects_body_lines(line):
+    assert not is_heading(line)
+
+
+def test_numbered_list_is_not_a_heading():
+    assert not is_heading("1 Sparse Attention", "2 Dense Attention")
+    assert is_heading("3 Method", "3.1 Training details")
+
+
+def test_chunks_follow_sections_of_realistic_pages():
+    chunks = list(iter_structured_chunks(PAGES, max_tokens=200))
+    assert [chunk.section for chunk in chunks] == [
+        "", "Abstract", "1 Introduction", "3.1 Training details", "4 Results on ImageNet-1k"
+    ]
+    assert "linearly" in chunks[1].text
+    assert "We release the code" in chunks[2].text
+    assert "1 ResNet 76 93" in chunks[3].text
+    assert (chunks[3].page_start, chunks[4].page_start) == (2, 2)
+
+
+def test_split_sentences():
+    assert split_sentences("It works. The code is public! Is it fast?") == [
+        "It works.", "The code is public!", "Is it fast?"
+    ]
@@ -0,0 +1,62 @@
+import pytest
+
+from conversation_utils import MemoryConversationStore, SQLiteConversationStore, truncate_history
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryConversationStore(**kwargs)
+        return SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), **kwargs)
+    return make
+
+
+def test_truncate_history_keeps_recent_turns_within_budget():
+    turns = [(f"Question {i}?", "word " * 10) for i in range(10)]
+    assert truncate_history(turns, max_turns=3, max_tokens=1000) == turns[-3:]
+    # Each turn is about 19 estimated tokens
+    assert truncate_history(turns, max_turns=10, max_tokens=40) == turns[-2:]
+    assert truncate_history(turns, max_turns=0) == []
+
+
+def test_truncate_history_shortens_a_long_last_answer():
+    window = truncate_history([("Old?", "old"), ("What is it?", "word " * 100)], max_turns=5, max_tokens=20)
+    assert len(window) == 1
+    question, answer = window[0]
+    assert question == "What is it?"
+    assert 0 < len(answer.split()) < 100
+
+
+def test_store_keeps_the_last_turns(make_store):
+    store = make_store(max_stored_turns=3)
+    for i in range(5):
+        store.append("c1", f"q{i}", f"a{i}")
+    assert store.turns("c1") == [("q2", "a2"), ("q3", "a3"), ("q4", "a4")]
+    assert store.turns("unknown") == []
+    store.delete("c1")
+    assert store.turns("c1") == []
+
+
+def test_store_expires_idle_conversations(make_store, clock):
+    store = make_store(ttl=60)
+    store.append("c1", "q", "a")
+    clock.now += 59
+    assert store.turns("c1") == [("q", "a")]
+    store.append("c1", "q2", "a2")
+    clock.now += 59
+    assert len(store.turns("c1")) == 2
+    clock.now += 61
+    assert store.turns("c1") == []
+    assert store.stats()["conversations"] == 0
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryConversationStore(max_conversations=2)
+    store.append("c1", "q", "a")
+    store.append("c2", "q", "a")
+    store.turns("c1")
+    store.append("c3", "q", "a")
+    assert store.turns("c2") == []
+    assert store.turns("c1") == [("q", "a")]
+    assert store.stats()["evicted"] == 1
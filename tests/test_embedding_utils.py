@@ -0,0 +1,38 @@
+import numpy as np
+
+import embedding_utils
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, **kwargs):
+        self.calls += 1
+        return np.full(embedding_utils.EMBEDDING_DIMENSION, len(text), dtype=np.float32)
+
+
+class ReadOnlyCache:
+    def get_many(self, model, texts):
+        return {}
+
+    def put_many(self, model, texts, vectors):
+        raise AssertionError("questions must not reach the on-disk cache")
+
+
+def test_questions_bypass_the_on_disk_cache(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(embedding_utils, "get_embedding_model", lambda: model)
+    monkeypatch.setattr(embedding_utils, "get_embedding_cache", lambda: ReadOnlyCache())
+    monkeypatch.setattr(embedding_utils, "_query_embeddings", type(embedding_utils._query_embeddings)())
+    monkeypatch.setattr(embedding_utils, "QUERY_EMBEDDING_CACHE_SIZE", 2)
+    embeddings = embedding_utils.SentenceTransformerEmbeddings()
+
+    assert embeddings.embed_query("what is attention?")[0] == len("what is attention?")
+    embeddings.embed_query("what is attention?")
+    assert model.calls == 1
+
+    embeddings.embed_query("who are the authors?")
+    embeddings.embed_query("which datasets?")
+    embeddings.embed_query("what is attention?")
+    assert model.calls == 4
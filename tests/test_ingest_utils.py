@@ -0,0 +1,40 @@
+import fitz
+
+from embedding_utils import iter_changed_entries
+from file_utils import extract_documents
+from ingest_utils import document_ids_for, find_pdfs
+from vector_utils import LocalVectorStore
+
+
+def write_pdf(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), text)
+    pdf.save(str(path))
+    pdf.close()
+
+
+def test_same_named_papers_in_subfolders_get_distinct_ids(tmp_path):
+    write_pdf(tmp_path / "a" / "paper.pdf", "Attention layers are all we need.")
+    write_pdf(tmp_path / "b" / "paper.pdf", "Convolutions are all we need.")
+    write_pdf(tmp_path / "top.pdf", "Recurrence is all we need.")
+
+    paths = find_pdfs(str(tmp_path))
+    document_ids = document_ids_for(paths, str(tmp_path))
+    assert document_ids == ["a/paper.pdf", "b/paper.pdf", "top.pdf"]
+
+    # Diffing the second paper must not delete the vectors of the first one
+    store = LocalVectorStore(str(tmp_path / "index"), dimension=2)
+    documents = extract_documents(paths, document_ids)
+    for vector_id, _, metadata in iter_changed_entries(documents, store):
+        store.upsert([(vector_id, [1.0, 0.0], metadata)])
+    for document_id in document_ids:
+        assert any("_chunk_" in vector_id for vector_id in store.list_document_ids(document_id))
+
+
+def test_document_ids_default_to_the_common_folder(tmp_path):
+    paths = [str(tmp_path / "x" / "a" / "paper.pdf"), str(tmp_path / "x" / "b" / "paper.pdf")]
+    assert document_ids_for(paths) == ["a/paper.pdf", "b/paper.pdf"]
+    assert document_ids_for([paths[0]]) == ["paper.pdf"]
+    # Paths outside the given root fall back to the common folder
+    assert document_ids_for(paths, root=str(tmp_path / "elsewhere")) == ["a/paper.pdf", "b/paper.pdf"]
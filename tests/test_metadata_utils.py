@@ -0,0 +1,75 @@
+import pytest
+
+from metadata_utils import MetadataLookup, classify_metadata_question
+from registry_utils import DocumentRegistry
+
+
+@pytest.mark.parametrize("question, field", [
+    ("Who wrote this paper?", "authors"),
+    ("Who are the authors?", "authors"),
+    ("Can you tell me who wrote the paper?", "authors"),
+    ("What are the names of the authors?", "authors"),
+    ("Authors?", "authors"),
+    ("What is the title?", "title"),
+    ("What is the title of this paper?", "title"),
+    ("What's the paper called?", "title"),
+    ("Which university are the authors from?", "organizations"),
+    ("What institutions are the authors affiliated with?", "organizations"),
+    ("Where are the authors from?", "organizations"),
+    ("Which lab is this paper from?", "organizations"),
+    ("What are the authors' emails?", "emails"),
+    ("How can I contact the authors?", "emails"),
+    ("How do I contact the authors?", "emails"),
+])
+def test_classifies_metadata_questions(question, field):
+    assert classify_metadata_question(question) == field
+
+
+@pytest.mark.parametrize("question", [
+    "What did the authors find?",
+    "How do the authors evaluate the model?",
+    "Did the authors release code?",
+    "What do the authors say about limitations?",
+    "What do the authors propose?",
+    "Why did the authors use BM25?",
+    "What title does Table 2 have?",
+    "What is the title of section 3?",
+    "Which lab trained the model?",
+    "How many authors cite prior work?",
+    "Summarize the paper",
+    "Who wrote the original proof that the loss converges?",
+    "Who wrote Attention Is All You Need?",
+])
+def test_content_questions_need_retrieval(question):
+    assert classify_metadata_question(question) is None
+
+
+def make_registry(tmp_path, *titles):
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+    registry.upsert_many([
+        {"id": f"doc{i}", "title": title, "authors": f"Author {i}", "organizations": "Unknown Organizations",
+         "emails": "", "abstract": "", "source": "", "page_count": 1, "chunk_count": 1, "vector_count": 1}
+        for i, title in enumerate(titles)
+    ])
+    return registry
+
+
+def test_answers_from_the_registry(tmp_path):
+    lookup = MetadataLookup(make_registry(tmp_path, "Attention Is All You Need", "Deep Residual Learning"))
+
+    assert lookup.answer("Who wrote Attention Is All You Need?") == \
+        'The authors are: Author 0 (paper: "Attention Is All You Need").'
+    assert lookup.answer("Who authored attention is all you need") == \
+        'The authors are: Author 0 (paper: "Attention Is All You Need").'
+    # Ambiguous paper, missing field and content questions take the retrieval path
+    assert lookup.answer("Who are the authors?") is None
+    assert lookup.answer("Which university are the authors from?", document_id="doc1") is None
+    assert lookup.answer("What did the authors find?", document_id="doc1") is None
+
+
+def test_who_wrote_needs_a_registered_title(tmp_path):
+    lookup = MetadataLookup(make_registry(tmp_path, "Attention Is All You Need"))
+
+    assert lookup.answer("Who wrote this paper?") == 'The authors are: Author 0 (paper: "Attention Is All You Need").'
+    assert lookup.answer("Who wrote the original proof that the loss converges?") is None
+    assert lookup.answer("Who wrote the attention is all you need follow-up on sparse kernels?") is None
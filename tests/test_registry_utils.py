@@ -0,0 +1,38 @@
+import sqlite3
+
+from registry_utils import DocumentRegistry, document_record
+
+
+def entries(*texts):
+    return [(f"doc_chunk_{i}", text, {"type": "chunk", "content_hash": f"hash-{text}"})
+            for i, text in enumerate(texts)]
+
+
+def test_reingesting_changed_content_drops_the_summary(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "documents.sqlite3"))
+    document = {"id": "doc", "title": "Paper", "pages": ["page"]}
+    registry.upsert_many([document_record(document, entries("first", "second"))])
+    registry.put_summary("doc", "summary-hash", "completed", {"Abstract": "Old summary"})
+
+    # Same content: the summary stays
+    registry.upsert_many([document_record(document, entries("first", "second"))])
+    assert registry.get_summary("doc")["sections"] == {"Abstract": "Old summary"}
+
+    registry.upsert_many([document_record(document, entries("first", "changed"))])
+    assert registry.get_summary("doc") is None
+    assert registry.get("doc")["chunk_count"] == 2
+
+
+def test_opens_registries_without_content_hashes(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE documents (id TEXT PRIMARY KEY, title TEXT NOT NULL, authors TEXT NOT NULL, "
+                 "organizations TEXT NOT NULL, emails TEXT NOT NULL, abstract TEXT NOT NULL, source TEXT NOT NULL, "
+                 "page_count INTEGER NOT NULL, chunk_count INTEGER NOT NULL, vector_count INTEGER NOT NULL, "
+                 "created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.commit()
+    conn.close()
+
+    registry = DocumentRegistry(path)
+    registry.upsert_many([document_record({"id": "doc"}, entries("text"))])
+    assert registry.get("doc")["content_hash"]
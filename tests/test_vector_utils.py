@@ -0,0 +1,113 @@
+import numpy as np
+
+from bm25_utils import BM25Index
+from embedding_utils import iter_changed_entries
+from metrics_utils import STAGE_SECONDS
+from vector_utils import HybridVectorStore, LocalVectorStore
+
+DIMENSION = 4
+
+
+def make_store(tmp_path):
+    return HybridVectorStore(LocalVectorStore(str(tmp_path / "dense"), dimension=DIMENSION), BM25Index())
+
+
+def chunk(document_id, number, text):
+    metadata = {"type": "chunk", "document_id": document_id, "text": text}
+    return f"{document_id}_chunk_{number}", [1.0, float(number), 0.0, 0.0], metadata
+
+
+def test_delete_with_eq_filter_removes_bm25_chunks(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert([chunk("a", 0, "attention layers"), chunk("b", 0, "attention heads")])
+    store.delete(filter={"document_id": {"$eq": "a"}})
+    assert "a_chunk_0" not in store.sparse
+    assert "b_chunk_0" in store.sparse
+
+
+def test_delete_of_other_types_keeps_bm25_chunks(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert([chunk("a", 0, "attention layers")])
+    store.delete(filter={"document_id": "a", "type": {"$eq": "title"}})
+    assert "a_chunk_0" in store.sparse
+
+
+def test_bm25_miss_is_backfilled_without_re_upserting(tmp_path):
+    dense = LocalVectorStore(str(tmp_path / "dense"), dimension=DIMENSION)
+    document = {"id": "a", "title": "Paper", "full_content": "Attention is all you need."}
+    stats = {}
+    dense.upsert([(vector_id, [1.0, 0.0, 0.0, 0.0], metadata)
+                  for vector_id, _, metadata in iter_changed_entries([document], dense, stats)])
+    assert stats["changed"] > 0
+
+    # The same chunks, indexed before the BM25 index existed
+    store = HybridVectorStore(dense, BM25Index())
+    stats = {}
+    assert list(iter_changed_entries([document], store, stats)) == []
+    assert stats["changed"] == 0
+    assert store.sparse.search("attention")[0][0].startswith("a_chunk_")
+
+
+def test_chunking_and_diff_are_separate_stages(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "dense"), dimension=DIMENSION)
+    document = {"id": "a", "title": "Paper", "full_content": "Attention is all you need.",
+                "stage_seconds": {"parse": 0.5, "extract": 0.1}}
+    before = {stage: STAGE_SECONDS.count(pipeline="ingest", stage=stage) for stage in ("parse", "chunk", "diff")}
+    list(iter_changed_entries([document], store))
+    for stage, count in before.items():
+        assert STAGE_SECONDS.count(pipeline="ingest", stage=stage) == count + 1
+
+
+def test_concurrent_persists_keep_both_processes_changes(tmp_path):
+    first = LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+    first.upsert([chunk("a", 0, "attention"), chunk("b", 0, "recurrence")])
+    first.persist()
+    second = LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+
+    first.upsert([chunk("c", 1, "convolution")])
+    first.persist()
+    second.delete_document("b")
+    second.upsert([chunk("d", 2, "dropout")])
+    second.persist()
+
+    merged = LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+    assert sorted(merged.fetch_metadata(["a_chunk_0", "b_chunk_0", "c_chunk_1", "d_chunk_2"])) == [
+        "a_chunk_0", "c_chunk_1", "d_chunk_2",
+    ]
+
+
+def test_query_sees_vectors_persisted_by_another_process(tmp_path):
+    reader = LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+    reader.upsert([chunk("a", 0, "attention")])
+    reader.persist()
+    writer = LocalVectorStore(str(tmp_path), dimension=DIMENSION)
+    writer.upsert([chunk("b", 0, "recurrence")])
+    writer.persist()
+
+    assert reader.list_document_ids("b") == ["b_chunk_0"]
+
+
+def ivf_store(directory, vectors):
+    store = LocalVectorStore(str(directory), dimension=vectors.shape[1], index_type="ivf", min_train_size=50)
+    store.upsert([(f"a_chunk_{i}", vector, {"type": "chunk", "document_id": "a"}) for i, vector in enumerate(vectors)])
+    return store
+
+
+def test_stale_ivf_index_is_rebuilt_on_load(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((100, 8)).astype(np.float32)
+    ivf_store(tmp_path, vectors).persist()
+    np.save(tmp_path / "ivf_assignments.npy", np.zeros(3, dtype=np.int32))
+
+    store = LocalVectorStore(str(tmp_path), dimension=8, index_type="ivf", min_train_size=50)
+    assert store.ann.trained
+    assert store.query(vectors[7].tolist(), top_k=1).matches[0].id == "a_chunk_7"
+
+
+def test_ivf_index_gets_more_lists_as_the_store_grows(tmp_path):
+    vectors = np.random.default_rng(0).standard_normal((1000, 8)).astype(np.float32)
+    store = ivf_store(tmp_path, vectors[:100])
+    assert store.ann.nlist == 40
+
+    store.upsert([(f"b_chunk_{i}", vector, {"type": "chunk", "document_id": "b"}) for i, vector in enumerate(vectors[100:])])
+    assert store.ann.nlist == int(4 * np.sqrt(1000))
+    assert store.query(vectors[500].tolist(), top_k=1).matches[0].id == "b_chunk_400"
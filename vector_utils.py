@@ -0,0 +1,963 @@
+import os
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from ann_utils import IVFFlatIndex
+from bm25_utils import BM25Index, reciprocal_rank_fusion
+from lock_utils import file_lock, file_version
+from model_utils import register_model, get_model
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+pine_api_key = os.getenv("PINECONE_API_KEY")
+pine_env = os.getenv("PINECONE_ENVIRONMENT")
+
+# Vector store backend: "pinecone" (remote) or "local" (in-process NumPy index)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.getcwd(), "index"))
+
+# Local index search: "flat" (exact) or "ivf" (approximate, see ann_utils)
+LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "flat").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 picks 4 * sqrt(n) lists
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", "20000"))  # Exact search below this size
+# Retrain an automatically sized IVF index once the store is this many times the size it was trained for
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "4"))
+
+# Retrieval: "hybrid" (BM25 + dense fused with reciprocal rank fusion), "dense" or "sparse".
+# The BM25 index lives on local disk, so hybrid search over Pinecone is opt-in
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid" if VECTOR_STORE == "local" else "dense").lower()
+BM25_INDEX_DIR = os.getenv("BM25_INDEX_DIR", os.path.join(LOCAL_INDEX_DIR, "bm25"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+INDEX_NAME = "document-embeddings"
+DIMENSION = 384  # Dimension of the 'all-MiniLM-L6-v2' model
+
+# Metadata fields the local index keeps inverted lists for
+INDEXED_FIELDS = ("type", "document_id")
+
+Vector = Tuple[str, List[float], Dict[str, Any]]
+
+
+class QueryMatch:
+    """A single query result, mirroring the fields of a Pinecone match."""
+
+    def __init__(self, id: str, score: float, metadata: Optional[Dict[str, Any]] = None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata or {}
+
+    def __repr__(self) -> str:
+        return f"QueryMatch(id={self.id!r}, score={self.score:.4f})"
+
+
+class QueryResponse:
+    """Query results, mirroring the `matches` attribute of a Pinecone response."""
+
+    def __init__(self, matches: List[QueryMatch]):
+        self.matches = matches
+
+
+def _match_condition(value: Any, condition: Any) -> bool:
+    """
+    Check a metadata value against a Pinecone-style filter condition.
+
+    Args:
+        value: Metadata value of the vector
+        condition: Either a plain value or a dict with one of $eq, $ne, $in, $nin
+
+    Returns:
+        True if the value satisfies the condition
+    """
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$eq" and value != operand:
+            return False
+        if operator == "$ne" and value == operand:
+            return False
+        if operator == "$in" and value not in operand:
+            return False
+        if operator == "$nin" and value in operand:
+            return False
+    return True
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """
+    Check vector metadata against a Pinecone-style metadata filter.
+
+    Args:
+        metadata: Metadata of the vector
+        filter: Mapping of field name to condition
+
+    Returns:
+        True if every condition in the filter is satisfied
+    """
+    if not filter:
+        return True
+    return all(_match_condition(metadata.get(field), condition) for field, condition in filter.items())
+
+
+class VectorStore(ABC):
+    """
+    Interface shared by the vector store backends.
+
+    Implementations must be safe to call from several threads at once: the
+    streaming ingestion pipeline reads content hashes and deletes orphaned
+    vectors on its producer thread while the calling thread upserts, and the
+    web app queries while uploads are indexed.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors: List[Vector]) -> None:
+        """
+        Insert or overwrite vectors.
+
+        Args:
+            vectors: List of (vector id, values, metadata) tuples
+        """
+
+    @abstractmethod
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = True) -> QueryResponse:
+        """
+        Find the vectors most similar to a query vector.
+
+        Args:
+            vector: Query vector
+            top_k: Number of matches to return
+            filter: Optional Pinecone-style metadata filter
+            include_metadata: Whether to return the metadata of each match
+
+        Returns:
+            QueryResponse with matches sorted by decreasing cosine similarity
+        """
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Delete vectors by ID or by metadata filter.
+
+        Args:
+            ids: IDs of the vectors to delete
+            filter: Pinecone-style metadata filter selecting vectors to delete
+        """
+
+    def delete_document(self, document_id: str) -> None:
+        """
+        Delete every vector of a document.
+
+        Args:
+            document_id: ID of the document to remove
+        """
+        self.delete(filter={"document_id": document_id})
+
+    @abstractmethod
+    def list_document_ids(self, document_id: str) -> List[str]:
+        """
+        List the IDs of the vectors stored for a document.
+
+        Args:
+            document_id: ID of the document
+
+        Returns:
+            Vector IDs (may include IDs of other documents sharing the prefix)
+        """
+
+    @abstractmethod
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch the metadata of vectors by ID.
+
+        Args:
+            ids: Vector IDs
+
+        Returns:
+            Dictionary mapping each existing ID to its metadata
+        """
+
+    def content_hashes(self, document_id: str) -> Dict[str, Optional[str]]:
+        """
+        Return the content hash of every vector stored for a document.
+
+        Args:
+            document_id: ID of the document
+
+        Returns:
+            Dictionary mapping vector IDs to their "content_hash" metadata
+            (None for vectors stored before hashes were recorded)
+        """
+        metadata = self.fetch_metadata(self.list_document_ids(document_id))
+        return {
+            vector_id: fields.get("content_hash")
+            for vector_id, fields in metadata.items()
+            if fields.get("document_id") == document_id
+        }
+
+    def backfill(self, entries: List[Vector]) -> None:
+        """
+        Add entries the store already holds to its secondary indexes that miss them.
+
+        Called with the unchanged entries skipped by incremental re-indexing.
+        Stores without secondary indexes do nothing.
+
+        Args:
+            entries: (vector id, text, metadata) tuples already stored
+        """
+
+    @abstractmethod
+    def as_retriever(self, embedding: Any, search_kwargs: Optional[Dict[str, Any]] = None) -> BaseRetriever:
+        """
+        Wrap the store in a LangChain retriever.
+
+        Args:
+            embedding: LangChain embeddings used to embed queries
+            search_kwargs: Retriever search parameters such as k and filter
+
+        Returns:
+            LangChain retriever over this store
+        """
+
+    def persist(self) -> None:
+        """Flush pending writes to durable storage. No-op for remote stores."""
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Vector store backed by the remote Pinecone index.
+
+    Holds no state besides the index client, whose HTTP connection pool is
+    thread-safe, so concurrent calls need no lock.
+    """
+
+    def __init__(self, index: Any):
+        self.index = index
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        self.index.upsert(vectors=vectors)
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = True) -> QueryResponse:
+        kwargs = {"vector": vector, "top_k": top_k, "include_metadata": include_metadata}
+        if filter:
+            kwargs["filter"] = filter
+        response = self.index.query(**kwargs)
+        return QueryResponse([
+            QueryMatch(match.id, match.score, dict(match.metadata or {}))
+            for match in response.matches
+        ])
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None) -> None:
+        if ids:
+            self.index.delete(ids=ids)
+        if filter:
+            self.index.delete(filter=filter)
+
+    def delete_document(self, document_id: str) -> None:
+        # Serverless indexes cannot delete by metadata filter, go through the ID prefix
+        for ids in self.index.list(prefix=f"{document_id}_"):
+            if ids:
+                self.index.delete(ids=list(ids))
+
+    def list_document_ids(self, document_id: str) -> List[str]:
+        ids = []
+        for page in self.index.list(prefix=f"{document_id}_"):
+            ids.extend(page)
+        return ids
+
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        metadata = {}
+        for start in range(0, len(ids), 100):
+            response = self.index.fetch(ids=ids[start:start + 100])
+            for vector_id, vector in response.vectors.items():
+                metadata[vector_id] = dict(vector.metadata or {})
+        return metadata
+
+    def as_retriever(self, embedding: Any, search_kwargs: Optional[Dict[str, Any]] = None) -> BaseRetriever:
+        from langchain_pinecone import Pinecone as LangChainPinecone
+
+        return LangChainPinecone(
+            index=self.index,
+            embedding=embedding,
+            text_key='text'
+        ).as_retriever(
+            search_type="similarity",
+            search_kwargs=search_kwargs or {"k": 10}
+        )
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process cosine index backed by NumPy.
+
+    Vectors are stored L2-normalized in a float32 matrix so that cosine
+    similarity is a single matrix-vector product. The index persists to
+    `vectors.npy` (loaded memory-mapped) plus a `metadata.json` sidecar
+    holding the IDs and metadata of each row.
+
+    With `index_type="ivf"` and at least `min_train_size` vectors, unfiltered
+    and broadly filtered queries only score the candidates of an IVF-flat
+    index instead of every row.
+
+    The API and CLI bulk ingestion may share the directory. Queries reload
+    the index when another process persisted it and nothing is left unsaved
+    here. `persist` holds a file lock and, when the files changed since they
+    were loaded, replays this process's unsaved upserts and deletes on the
+    newer version instead of overwriting it.
+    """
+
+    def __init__(self, directory: str, dimension: int = DIMENSION, index_type: str = "flat",
+                 nlist: int = 0, nprobe: int = 8, min_train_size: int = 20000, retrain_growth: float = 4.0):
+        """
+        Open the local index stored in a directory, creating it if needed.
+
+        Args:
+            directory: Directory holding vectors.npy and metadata.json
+            dimension: Dimension of the stored vectors
+            index_type: "flat" for exact search or "ivf" for approximate search
+            nlist: Number of IVF lists (0 picks 4 * sqrt(n))
+            nprobe: Number of IVF lists scanned per query
+            min_train_size: Number of vectors needed before the IVF index is trained
+            retrain_growth: Growth past the size an automatic `nlist` was trained
+                for that triggers retraining with more lists
+        """
+        self.directory = directory
+        self.dimension = dimension
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self._lock = threading.RLock()
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.ann = IVFFlatIndex(self.dimension, nlist=self.nlist, nprobe=self.nprobe) if self.index_type == "ivf" else None
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[Any, set]] = {field: {} for field in INDEXED_FIELDS}
+        self._tombstones = 0
+        self._dirty = False
+        self._loaded_version: Optional[Tuple[int, int]] = None
+        # IDs upserted (True) or deleted (False) since the last persist
+        self._unsaved: Dict[str, bool] = {}
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.directory, "metadata.json")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.directory, "index.lock")
+
+    def _load(self) -> None:
+        """Load a persisted index, memory-mapping the vector matrix."""
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.metadata_path)):
+            logger.info(f"Creating new local vector index in {self.directory}")
+            return
+
+        self._loaded_version = file_version(self.metadata_path)
+        with open(self.metadata_path, "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+
+        self._matrix = np.load(self.vectors_path, mmap_mode="r")
+        self._size = len(sidecar["ids"])
+        self._ids = sidecar["ids"]
+        self._metadata = sidecar["metadata"]
+        for row, (vector_id, metadata) in enumerate(zip(self._ids, self._metadata)):
+            self._id_to_row[vector_id] = row
+            self._index_metadata(row, metadata)
+        if self.ann is not None and not self.ann.load(self.directory, self._size):
+            # Stale or missing IVF files: retrain now instead of serving exact
+            # search until the next upsert. The files are rewritten on the next persist
+            if self.count() >= self.min_train_size:
+                self._train_ann()
+        logger.info(f"Loaded local vector index with {self._size} vectors from {self.directory}")
+
+    def _index_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in INDEXED_FIELDS:
+            if field in metadata:
+                self._postings[field].setdefault(metadata[field], set()).add(row)
+
+    def _unindex_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        for field in INDEXED_FIELDS:
+            rows = self._postings[field].get(metadata.get(field))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    self._postings[field].pop(metadata.get(field))
+
+    def _ensure_capacity(self, needed: int) -> None:
+        """Make the matrix writable and large enough to hold `needed` rows."""
+        writable = isinstance(self._matrix, np.ndarray) and not isinstance(self._matrix, np.memmap)
+        if writable and self._matrix.shape[0] >= needed:
+            return
+        capacity = max(needed, 2 * self._matrix.shape[0], 1024)
+        matrix = np.zeros((capacity, self.dimension), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    @staticmethod
+    def _normalize(values: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(values, axis=-1, keepdims=True)
+        # Zero vectors (embeddings of empty text) stay zero and score 0
+        return np.divide(values, norms, out=np.zeros_like(values), where=norms > 0)
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        if not vectors:
+            return
+        with self._lock:
+            values = self._normalize(np.asarray([v for _, v, _ in vectors], dtype=np.float32))
+            new_ids = [vector_id for vector_id, _, _ in vectors if vector_id not in self._id_to_row]
+            self._ensure_capacity(self._size + len(new_ids))
+
+            for (vector_id, _, metadata), row_values in zip(vectors, values):
+                metadata = dict(metadata or {})
+                row = self._id_to_row.get(vector_id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._ids.append(vector_id)
+                    self._metadata.append(metadata)
+                    self._id_to_row[vector_id] = row
+                else:
+                    if self._metadata[row] is not None:
+                        self._unindex_metadata(row, self._metadata[row])
+                    self._metadata[row] = metadata
+                self._matrix[row] = row_values
+                self._index_metadata(row, metadata)
+                self._unsaved[vector_id] = True
+            self._dirty = True
+
+            if self.ann is not None:
+                if self.ann.trained and not self.ann.needs_retraining(self.count(), self.retrain_growth):
+                    rows = [self._id_to_row[vector_id] for vector_id, _, _ in vectors]
+                    self.ann.add(rows, self._matrix[rows])
+                elif self.count() >= self.min_train_size:
+                    self.rebuild_ann()
+
+    def rebuild_ann(self) -> None:
+        """Retrain the IVF index on the current vectors and re-add every live row."""
+        with self._lock:
+            if self.ann is not None and self._train_ann():
+                self._dirty = True
+
+    def _train_ann(self) -> bool:
+        live = [row for row in range(self._size) if self._metadata[row] is not None]
+        if not live:
+            return False
+        self.ann.train(self._matrix[live])
+        for start in range(0, len(live), 65536):
+            batch = live[start:start + 65536]
+            self.ann.add(batch, self._matrix[batch])
+        return True
+
+    def _candidate_rows(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Resolve a filter to candidate rows, using the inverted lists for
+        indexed fields and a metadata scan for everything else.
+
+        Returns:
+            Sorted array of candidate rows, or None when every live row matches
+        """
+        rows = None
+        remaining = {}
+        for field, condition in (filter or {}).items():
+            if field in INDEXED_FIELDS and (not isinstance(condition, dict) or
+                                            set(condition) <= {"$eq", "$in"}):
+                if isinstance(condition, dict):
+                    values = condition.get("$in", []) if "$in" in condition else [condition["$eq"]]
+                else:
+                    values = [condition]
+                field_rows = set()
+                for value in values:
+                    field_rows |= self._postings[field].get(value, set())
+                rows = field_rows if rows is None else rows & field_rows
+            else:
+                remaining[field] = condition
+
+        if remaining:
+            scan = rows if rows is not None else range(self._size)
+            rows = {row for row in scan
+                    if self._metadata[row] is not None and matches_filter(self._metadata[row], remaining)}
+
+        if rows is None:
+            return None
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = True, nprobe: Optional[int] = None, exact: bool = False) -> QueryResponse:
+        """
+        Find the vectors most similar to a query vector.
+
+        Args:
+            vector: Query vector
+            top_k: Number of matches to return
+            filter: Optional Pinecone-style metadata filter
+            include_metadata: Whether to return the metadata of each match
+            nprobe: Number of IVF lists to scan, overriding the index default
+            exact: Score every candidate row even if an IVF index is available
+
+        Returns:
+            QueryResponse with matches sorted by decreasing cosine similarity
+        """
+        with self._lock:
+            self.refresh()
+            if self._size == 0 or top_k <= 0:
+                return QueryResponse([])
+
+            query = self._normalize(np.asarray(vector, dtype=np.float32))
+            rows = self._candidate_rows(filter)
+
+            # Narrow large candidate sets with the IVF index, small filtered
+            # sets (e.g. a single document) are cheaper to score exactly
+            use_ann = (not exact and self.ann is not None and self.ann.trained and
+                       (rows is None or len(rows) >= self.min_train_size))
+            if use_ann:
+                ann_rows = self.ann.search_rows(query, nprobe=nprobe)
+                rows = ann_rows if rows is None else np.intersect1d(rows, ann_rows, assume_unique=True)
+                if len(rows) == 0:
+                    return QueryResponse([])
+                scores = self._matrix[rows] @ query
+            elif rows is None:
+                scores = self._matrix[:self._size] @ query
+                rows = np.arange(self._size)
+                if self._tombstones:
+                    # Deleted rows keep their slot until the next persist
+                    alive = np.fromiter((m is not None for m in self._metadata), dtype=bool, count=self._size)
+                    scores = np.where(alive, scores, -np.inf)
+            else:
+                if len(rows) == 0:
+                    return QueryResponse([])
+                scores = self._matrix[rows] @ query
+
+            k = min(top_k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            matches = []
+            for position in best:
+                if not np.isfinite(scores[position]):
+                    continue
+                row = int(rows[position])
+                metadata = dict(self._metadata[row]) if include_metadata else {}
+                matches.append(QueryMatch(self._ids[row], float(scores[position]), metadata))
+            return QueryResponse(matches)
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None) -> None:
+        with self._lock:
+            rows = {self._id_to_row[vector_id] for vector_id in (ids or []) if vector_id in self._id_to_row}
+            if filter:
+                candidates = self._candidate_rows(filter)
+                rows |= set(candidates.tolist()) if candidates is not None else set(range(self._size))
+            if self.ann is not None:
+                self.ann.remove(rows)
+            for row in rows:
+                metadata = self._metadata[row]
+                if metadata is None:
+                    continue
+                self._unindex_metadata(row, metadata)
+                self._id_to_row.pop(self._ids[row], None)
+                self._metadata[row] = None
+                self._unsaved[self._ids[row]] = False
+                self._tombstones += 1
+            if rows:
+                self._dirty = True
+
+    def list_document_ids(self, document_id: str) -> List[str]:
+        with self._lock:
+            self.refresh()
+            rows = self._postings["document_id"].get(document_id, set())
+            return [self._ids[row] for row in sorted(rows)]
+
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                vector_id: dict(self._metadata[self._id_to_row[vector_id]])
+                for vector_id in ids
+                if vector_id in self._id_to_row
+            }
+
+    def count(self) -> int:
+        """Return the number of live vectors in the index."""
+        with self._lock:
+            return len(self._id_to_row)
+
+    def refresh(self) -> bool:
+        """
+        Reload the index if another process persisted a newer version.
+
+        Returns:
+            Whether the index was reloaded (never with unsaved changes)
+        """
+        with self._lock:
+            version = file_version(self.metadata_path)
+            if self._dirty or version is None or version == self._loaded_version:
+                return False
+            # The lock keeps a concurrent persist from replacing the files mid-load
+            with file_lock(self.lock_path):
+                self._reset()
+                self._load()
+            return True
+
+    def _replay_on_disk_version(self) -> None:
+        """Reload the persisted index and apply the unsaved changes made here on top of it."""
+        upserted = [
+            (vector_id, self._matrix[self._id_to_row[vector_id]].copy(), self._metadata[self._id_to_row[vector_id]])
+            for vector_id, live in self._unsaved.items() if live and vector_id in self._id_to_row
+        ]
+        deleted = [vector_id for vector_id, live in self._unsaved.items() if not live]
+        logger.info(f"Local vector index in {self.directory} changed on disk, merging "
+                    f"{len(upserted)} upserts and {len(deleted)} deletes")
+        self._reset()
+        self._load()
+        self.delete(ids=deleted)
+        self.upsert(upserted)
+        self._dirty = True
+
+    def persist(self) -> None:
+        """
+        Compact deleted rows and write vectors.npy and metadata.json atomically.
+
+        Changes persisted by another process since the index was loaded are
+        kept: the unsaved changes made here are replayed on top of them.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            with file_lock(self.lock_path):
+                self._persist()
+
+    def _persist(self) -> None:
+        version = file_version(self.metadata_path)
+        if version is not None and version != self._loaded_version:
+            self._replay_on_disk_version()
+        os.makedirs(self.directory, exist_ok=True)
+
+        live = [row for row in range(self._size) if self._metadata[row] is not None]
+        matrix = np.ascontiguousarray(self._matrix[live], dtype=np.float32)
+        ids = [self._ids[row] for row in live]
+        metadata = [self._metadata[row] for row in live]
+
+        tmp_vectors = self.vectors_path + ".tmp.npy"
+        tmp_metadata = self.metadata_path + ".tmp"
+        np.save(tmp_vectors, matrix)
+        with open(tmp_metadata, "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "metadata": metadata}, f)
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_metadata, self.metadata_path)
+        if self.ann is not None and self.ann.trained:
+            self.ann.compact(live)
+            self.ann.save(self.directory)
+
+        # Rebuild the in-memory state over the compacted rows
+        self._matrix = matrix
+        self._size = len(ids)
+        self._ids = ids
+        self._metadata = metadata
+        self._id_to_row = {vector_id: row for row, vector_id in enumerate(ids)}
+        self._postings = {field: {} for field in INDEXED_FIELDS}
+        for row, row_metadata in enumerate(metadata):
+            self._index_metadata(row, row_metadata)
+        self._tombstones = 0
+        self._loaded_version = file_version(self.metadata_path)
+        self._unsaved = {}
+        self._dirty = False
+        logger.info(f"Persisted local vector index with {self._size} vectors to {self.directory}")
+
+    def as_retriever(self, embedding: Any, search_kwargs: Optional[Dict[str, Any]] = None) -> BaseRetriever:
+        return LocalRetriever(store=self, embedding=embedding, search_kwargs=search_kwargs or {"k": 10})
+
+
+class LocalRetriever(BaseRetriever):
+    """LangChain retriever over a LocalVectorStore."""
+
+    store: Any
+    embedding: Any
+    search_kwargs: Dict[str, Any] = {"k": 10}
+    text_key: str = "text"
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        vector = self.embedding.embed_query(query)
+        extra = {"nprobe": self.search_kwargs["nprobe"]} if "nprobe" in self.search_kwargs else {}
+        response = self.store.query(
+            vector,
+            top_k=self.search_kwargs.get("k", 10),
+            filter=self.search_kwargs.get("filter"),
+            **extra
+        )
+        documents = []
+        for match in response.matches:
+            metadata = dict(match.metadata)
+            text = metadata.pop(self.text_key, "")
+            metadata["vector_id"] = match.id
+            documents.append(Document(page_content=text, metadata=metadata))
+        return documents
+
+
+class HybridVectorStore(VectorStore):
+    """
+    Vector store paired with a BM25 index over the same content chunks.
+
+    Every write goes to both: upserted chunks are tokenized into the BM25
+    index, deletes remove them from it. Unchanged chunks the BM25 index
+    misses are backfilled from their stored text without touching their
+    dense vectors.
+
+    Queries and metadata lookups go to the wrapped store. `as_retriever`
+    returns a HybridRetriever fusing both rankings. Attributes of the
+    wrapped store (e.g. `count`) stay reachable.
+    """
+
+    def __init__(self, store: VectorStore, sparse: BM25Index):
+        self.store = store
+        self.sparse = sparse
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.store, name)
+
+    def upsert(self, vectors: List[Vector]) -> None:
+        self.store.upsert(vectors)
+        self.sparse.add(
+            (vector_id, metadata.get("document_id", ""), metadata.get("text", ""))
+            for vector_id, _, metadata in vectors
+            if metadata.get("type") == "chunk"
+        )
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[Dict[str, Any]] = None,
+              include_metadata: bool = True, **kwargs: Any) -> QueryResponse:
+        return self.store.query(vector, top_k=top_k, filter=filter, include_metadata=include_metadata, **kwargs)
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None) -> None:
+        self.store.delete(ids=ids, filter=filter)
+        if ids:
+            self.sparse.remove(ids)
+        if filter:
+            self._delete_sparse(filter)
+
+    def _delete_sparse(self, filter: Dict[str, Any]) -> None:
+        conditions = {field: _unwrap_eq(condition) for field, condition in filter.items()}
+        if conditions.pop("type", "chunk") != "chunk":
+            return  # The BM25 index only holds content chunks
+        document_ids = conditions.pop("document_id", None)
+        if isinstance(document_ids, dict) and set(document_ids) == {"$in"}:
+            document_ids = document_ids["$in"]
+        elif isinstance(document_ids, str):
+            document_ids = [document_ids]
+        if conditions or not isinstance(document_ids, list):
+            logger.warning(f"BM25 index cannot apply delete filter {filter}, it may keep stale chunks")
+            return
+        for document_id in document_ids:
+            self.sparse.remove_document(document_id)
+
+    def delete_document(self, document_id: str) -> None:
+        self.store.delete_document(document_id)
+        self.sparse.remove_document(document_id)
+
+    def list_document_ids(self, document_id: str) -> List[str]:
+        return self.store.list_document_ids(document_id)
+
+    def fetch_metadata(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return self.store.fetch_metadata(ids)
+
+    def content_hashes(self, document_id: str) -> Dict[str, Optional[str]]:
+        return self.store.content_hashes(document_id)
+
+    def backfill(self, entries: List[Vector]) -> None:
+        # Chunks stored before the BM25 index existed (or by another process)
+        # are tokenized from their metadata, their dense vectors stay as they are
+        missing = [
+            (vector_id, metadata.get("document_id", ""), metadata.get("text", ""))
+            for vector_id, _, metadata in entries
+            if metadata.get("type") == "chunk" and vector_id not in self.sparse
+        ]
+        if missing:
+            self.sparse.add(missing)
+            logger.info(f"Backfilled {len(missing)} chunks into the BM25 index")
+
+    def persist(self) -> None:
+        self.store.persist()
+        self.sparse.persist()
+
+    def as_retriever(self, embedding: Any, search_kwargs: Optional[Dict[str, Any]] = None) -> BaseRetriever:
+        return HybridRetriever(store=self, embedding=embedding, search_kwargs=search_kwargs or {"k": 10})
+
+
+def _unwrap_eq(condition: Any) -> Any:
+    """Reduce a {"$eq": value} filter condition to the value."""
+    if isinstance(condition, dict) and set(condition) == {"$eq"}:
+        return condition["$eq"]
+    return condition
+
+
+def _sparse_scope(filter: Optional[Dict[str, Any]]) -> Tuple[bool, Optional[str]]:
+    """
+    Decide whether BM25 can serve a metadata filter.
+
+    The BM25 index only holds content chunks and their document IDs.
+
+    Returns:
+        (usable, document_id restriction)
+    """
+    if not filter:
+        return True, None
+    document_id = None
+    for field, condition in filter.items():
+        condition = _unwrap_eq(condition)
+        if field == "type" and condition == "chunk":
+            continue
+        if field == "document_id" and isinstance(condition, str):
+            document_id = condition
+            continue
+        return False, None
+    return True, document_id
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    LangChain retriever fusing BM25 and dense rankings with reciprocal rank fusion.
+
+    `search_kwargs["mode"]` overrides SEARCH_MODE per request. Filters BM25
+    cannot serve (e.g. metadata field types) fall back to dense search.
+    """
+
+    store: Any
+    embedding: Any
+    search_kwargs: Dict[str, Any] = {"k": 10}
+    text_key: str = "text"
+    rrf_k: int = RRF_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        k = self.search_kwargs.get("k", 10)
+        filter = self.search_kwargs.get("filter")
+        mode = self.search_kwargs.get("mode", SEARCH_MODE)
+        sparse_usable, document_id = _sparse_scope(filter)
+        if not sparse_usable:
+            mode = "dense"
+        # Fused rankings draw from deeper candidate lists
+        fetch_k = max(2 * k, 20) if mode == "hybrid" else k
+
+        rankings = []
+        metadata: Dict[str, Dict[str, Any]] = {}
+        if mode in ("hybrid", "dense"):
+            extra = {"nprobe": self.search_kwargs["nprobe"]} if "nprobe" in self.search_kwargs else {}
+            response = self.store.query(self.embedding.embed_query(query), top_k=fetch_k, filter=filter, **extra)
+            rankings.append([match.id for match in response.matches])
+            metadata.update((match.id, match.metadata) for match in response.matches)
+        if mode in ("hybrid", "sparse"):
+            self.store.sparse.refresh()
+            rankings.append([vector_id for vector_id, _ in
+                             self.store.sparse.search(query, top_k=fetch_k, document_id=document_id)])
+
+        ids = [vector_id for vector_id, _ in reciprocal_rank_fusion(rankings, k=self.rrf_k)[:k]]
+        missing = [vector_id for vector_id in ids if vector_id not in metadata]
+        if missing:
+            metadata.update(self.store.fetch_metadata(missing))
+
+        documents = []
+        for vector_id in ids:
+            if vector_id not in metadata:
+                continue
+            fields = dict(metadata[vector_id])
+            text = fields.pop(self.text_key, "")
+            fields["vector_id"] = vector_id
+            documents.append(Document(page_content=text, metadata=fields))
+        return documents
+
+
+_stores: Dict[str, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_pinecone_client():
+    """
+    Return the shared Pinecone client, creating it on first use.
+
+    Returns:
+        pinecone.Pinecone client
+    """
+    return get_model("pinecone")
+
+
+def _create_pinecone_client():
+    import pinecone
+
+    client = pinecone.Pinecone(api_key=pine_api_key, environment=pine_env)
+    logger.info("Pinecone initialized successfully")
+    return client
+
+
+register_model("pinecone", _create_pinecone_client)
+
+
+def get_vector_store(create: bool = True) -> Optional[VectorStore]:
+    """
+    Return the vector store selected by the VECTOR_STORE setting.
+
+    Args:
+        create: Create the Pinecone index if it does not exist yet
+
+    Returns:
+        VectorStore instance, or None if the Pinecone index does not exist
+        and `create` is False
+    """
+    with _stores_lock:
+        if VECTOR_STORE in _stores:
+            return _stores[VECTOR_STORE]
+
+        if VECTOR_STORE == "local":
+            store = LocalVectorStore(
+                LOCAL_INDEX_DIR,
+                index_type=LOCAL_INDEX_TYPE,
+                nlist=IVF_NLIST,
+                nprobe=IVF_NPROBE,
+                min_train_size=IVF_MIN_TRAIN_SIZE,
+                retrain_growth=IVF_RETRAIN_GROWTH
+            )
+        elif VECTOR_STORE == "pinecone":
+            pc = get_pinecone_client()
+            if INDEX_NAME not in pc.list_indexes().names():
+                if not create:
+                    return None
+                import pinecone
+
+                logger.info(f"Creating new Pinecone index: {INDEX_NAME}")
+                pc.create_index(
+                    name=INDEX_NAME,
+                    dimension=DIMENSION,
+                    metric="cosine",
+                    spec=pinecone.ServerlessSpec(
+                        cloud="aws",
+                        region="us-east-1"
+                    )
+                )
+            store = PineconeVectorStore(pc.Index(INDEX_NAME))
+            logger.info(f"Connected to Pinecone index: {INDEX_NAME}")
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE '{VECTOR_STORE}', expected 'pinecone' or 'local'")
+
+        if SEARCH_MODE != "dense":
+            store = HybridVectorStore(store, BM25Index(BM25_INDEX_DIR))
+
+        _stores[VECTOR_STORE] = store
+        return store